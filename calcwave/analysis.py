@@ -0,0 +1,308 @@
+# Static analysis of CalcWave programs.
+# Finds every call site of a memory class (see mathextensions.getMemoryClasses()) in the program text, and works out
+# from its arguments how many past samples its state depends on, without running the program.
+# Programs can also keep state without memory classes, as the evaluator keeps their variables (and out) from one sample to
+# the next: any variable read before the program assigns it in a sample may hold a value from the last one.
+
+import ast
+import math
+import builtins
+from calcwave import mathextensions
+
+# Builtins that may appear in arguments that are evaluated during analysis
+SAFE_BUILTINS = {"int": int, "float": float, "round": round, "abs": abs, "len": len, "max": max, "min": min, "range": range, "list": list}
+
+# Builtins that read the program's variables by name, which the analysis cannot follow
+STATE_READERS = {"globals", "locals", "vars", "eval", "exec"}
+
+# Modules whose results change from one run to the next (the clock, random numbers, the system), and attributes that give
+# random numbers in others (eg. numpy.random)
+NONDETERMINISTIC_MODULES = {"time", "datetime", "random", "secrets", "uuid", "os"}
+NONDETERMINISTIC_ATTRIBUTES = {"random", "default_rng"}
+
+
+# One call of a memory class in the program text
+class CallSite:
+  def __init__(self, name, lineno, col, memory, bounded, repeated = False):
+    self.name = name # The name called, eg. "delay"
+    self.lineno = lineno
+    self.col = col
+    self.memory = memory # Number of past samples the call's state depends on, or None if unbounded or unknown
+    self.bounded = bounded # False if the memory class never forgets, the arguments could not be worked out, or it is repeated
+    self.repeated = repeated # True if it is in a loop, function, lambda or comprehension, so it may run any number of times per sample
+
+  def __repr__(self):
+    return f"<CallSite {self.name}() at line {self.lineno}: memory={self.memory}>"
+
+
+# The result of analyzing a program
+class ProgramAnalysis:
+  def __init__(self, callsites, carried = (), nondeterministic = ()):
+    self.callsites = callsites
+    self.carried = list(carried) # (name, lineno) of the variables the program may carry from one sample to the next
+    self.nondeterministic = list(nondeterministic) # (name, lineno) of the clock and random number modules the program uses
+
+  # True if nothing keeps state between samples: no variables are carried, and no call sites keep state (only const() is
+  # allowed, as it never changes)
+  def isStateless(self):
+    return not self.carried and all(site.memory == 0 for site in self.callsites)
+
+  # True if the program's state depends on a bounded number of past samples: every call site's does, and no variables are
+  # carried (which may depend on every sample since the start)
+  def isBounded(self):
+    return not self.carried and all(site.bounded for site in self.callsites)
+
+  # The number of past samples the program's state depends on, which is how many to evaluate to warm it up, or None if any
+  # call site is unbounded. Memory classes can feed each other (as in delay(ema(y, 10), 100)), and then their memories add
+  # up, so this is the sum of every call site's memory.
+  def warmupLength(self):
+    if not self.isBounded():
+      return None
+    return sum(site.memory for site in self.callsites)
+
+  # Call sites with unbounded or unknown memory
+  def unboundedSites(self):
+    return [site for site in self.callsites if not site.bounded]
+
+  # Describes what keeps unbounded state, eg. ['"n" at line 2', 'intg() at line 3']
+  def unboundedReasons(self):
+    return [f'"{name}" at line {lineno}' for name, lineno in self.carried] + \
+           [f"{site.name}() at line {site.lineno}" + (" in a loop or function" if site.repeated else "") for site in self.unboundedSites()]
+
+
+# Evaluates constant expressions using only literals, the math module, a few builtins, and names already known to be constant.
+# Raises ValueError for anything else.
+class _ConstantEvaluator:
+  def __init__(self, names):
+    self.names = names
+
+  def evaluate(self, node):
+    for sub in ast.walk(node):
+      if isinstance(sub, ast.Name) and sub.id not in self.names:
+        raise ValueError(f'"{sub.id}" is not a constant')
+      if isinstance(sub, (ast.Attribute, ast.Lambda, ast.NamedExpr, ast.Subscript)) or isinstance(sub, ast.comprehension):
+        raise ValueError("Expression is too complex to evaluate statically")
+    code = compile(ast.Expression(body = node), "<analysis>", "eval")
+    try:
+      return eval(code, {"__builtins__": {}}, self.names)
+    except Exception as e:
+      raise ValueError(str(e))
+
+
+# Returns the names assigned exactly once in the whole program (at the top level), mapped to their value expressions
+def _single_assignments(tree):
+  counts = {}
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+      counts[node.id] = counts.get(node.id, 0) + 1
+    elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+      counts[node.name] = counts.get(node.name, 0) + 2
+  assigned = []
+  for node in tree.body:
+    if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+      name = node.targets[0].id
+      if counts.get(name) == 1:
+        assigned.append((name, node.value))
+  return assigned
+
+
+# Finds the variables a program may carry from one sample to the next: names read before they are definitely assigned in
+# the sample (following ifs, loops and functions conservatively), reads of out before it is assigned in full (out[:] = ...),
+# and calls of globals() and the like.
+class _CarriedStateFinder:
+  def __init__(self, tree):
+    assignedAnywhere = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+    predefined = set(vars(math)) | set(dir(builtins)) | set(mathextensions.getFunctionTable()) | {"load"}
+    predefined.update(mc.__callname__() for mc in mathextensions.getMemoryClasses())
+    self.predefined = (predefined - assignedAnywhere) | {"x"} | set(_loaded_aliases(tree)) # x is set before every sample
+    self.carried = {} # Name (or "globals()", etc.): line of its first read
+
+  # Returns (name, lineno) for every variable the node reads, leaving out those bound inside it by comprehensions and lambdas
+  def reads(self, node):
+    bound = set()
+    stored = set() # Names whose nodes are subscripted to assign to them (as out in out[0] = ...), which is not a read
+    for sub in ast.walk(node):
+      if isinstance(sub, ast.comprehension):
+        bound.update(n.id for n in ast.walk(sub.target) if isinstance(n, ast.Name))
+      elif isinstance(sub, ast.Lambda):
+        bound.update(arg.arg for arg in ast.walk(sub.args) if isinstance(arg, ast.arg))
+      elif isinstance(sub, ast.Subscript) and isinstance(sub.ctx, (ast.Store, ast.Del)) and not isinstance(node, ast.AugAssign):
+        stored.add(id(sub.value))
+    found = []
+    for sub in ast.walk(node):
+      if isinstance(sub, ast.Name) and sub.id not in bound and id(sub) not in stored and (isinstance(sub.ctx, ast.Load) or isinstance(node, ast.AugAssign)):
+        found.append((sub.id, sub.lineno))
+      if isinstance(sub, ast.Call) and isinstance(sub.func, ast.Name) and sub.func.id in STATE_READERS:
+        found.append((sub.func.id + "()", sub.lineno))
+    return found
+
+  def check(self, node, assigned):
+    for name, lineno in self.reads(node):
+      if name not in assigned and (name == "out" or name not in self.predefined):
+        self.carried.setdefault(name, lineno)
+
+  # Returns the names a simple statement (or a loop or with target) assigns. "out" is assigned by out[:] = ...
+  def stores(self, node):
+    names = set()
+    for sub in ast.walk(node):
+      if isinstance(sub, ast.Name) and isinstance(sub.ctx, ast.Store):
+        names.add(sub.id)
+      elif isinstance(sub, (ast.Import, ast.ImportFrom)):
+        names.update((alias.asname or alias.name).split(".")[0] for alias in sub.names)
+    if isinstance(node, ast.Assign):
+      for target in node.targets:
+        if isinstance(target, ast.Subscript) and isinstance(target.value, ast.Name) and target.value.id == "out" \
+            and isinstance(target.slice, ast.Slice) and target.slice.lower is None and target.slice.upper is None and target.slice.step is None:
+          names.add("out")
+    return names
+
+  # Checks a block of statements run with the names in "assigned" already assigned, returning those assigned after it
+  def visit(self, body, assigned):
+    assigned = set(assigned)
+    for stmt in body:
+      if isinstance(stmt, (ast.For, ast.AsyncFor)):
+        self.check(stmt.iter, assigned)
+        self.visit(stmt.body, assigned | self.stores(stmt.target))
+        self.visit(stmt.orelse, assigned)
+      elif isinstance(stmt, ast.While):
+        self.check(stmt.test, assigned)
+        self.visit(stmt.body, assigned)
+        self.visit(stmt.orelse, assigned)
+      elif isinstance(stmt, ast.If):
+        self.check(stmt.test, assigned)
+        assigned |= self.visit(stmt.body, assigned) & self.visit(stmt.orelse, assigned)
+      elif isinstance(stmt, (ast.With, ast.AsyncWith)):
+        for item in stmt.items:
+          self.check(item.context_expr, assigned)
+          if item.optional_vars is not None:
+            assigned |= self.stores(item.optional_vars)
+        assigned = self.visit(stmt.body, assigned)
+      elif isinstance(stmt, ast.Try):
+        self.visit(stmt.orelse, self.visit(stmt.body, assigned))
+        for handler in stmt.handlers:
+          self.visit(handler.body, assigned | ({handler.name} if handler.name else set()))
+        assigned = self.visit(stmt.finalbody, assigned)
+      elif isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        # The body runs when called, with its own locals; the variables it reads from the program must be assigned before
+        # it is defined
+        for sub in ast.walk(stmt):
+          if isinstance(sub, (ast.Global, ast.Nonlocal)):
+            for name in sub.names:
+              self.carried.setdefault(name, sub.lineno)
+        local = {arg.arg for arg in ast.walk(stmt.args) if isinstance(arg, ast.arg)} if not isinstance(stmt, ast.ClassDef) else set()
+        for sub in stmt.body:
+          local |= self.stores(sub)
+        for sub in stmt.body:
+          self.check(sub, assigned | local | {stmt.name})
+        for sub in stmt.decorator_list + (stmt.bases if isinstance(stmt, ast.ClassDef) else stmt.args.defaults + stmt.args.kw_defaults):
+          if sub is not None:
+            self.check(sub, assigned)
+        assigned.add(stmt.name)
+      elif isinstance(stmt, (ast.Global, ast.Nonlocal)):
+        for name in stmt.names:
+          self.carried.setdefault(name, stmt.lineno)
+      else:
+        self.check(stmt, assigned)
+        assigned |= self.stores(stmt)
+    return assigned
+
+
+def _try_evaluate(constants, node):
+  try:
+    return constants.evaluate(node)
+  except ValueError:
+    return None
+
+# Analyzes the program text. rate is the sample rate passed to memory classes, and is available to constant expressions.
+# Raises SyntaxError if the text does not parse.
+def analyze(text, rate = 44100):
+  tree = ast.parse(text)
+  memoryClasses = {mc.__callname__(): mc for mc in mathextensions.getMemoryClasses()}
+
+  names = {k: v for k, v in vars(math).items() if not k.startswith('_')}
+  names.update(SAFE_BUILTINS)
+  names["rate"] = rate
+  constants = _ConstantEvaluator(names)
+  for name, value in _single_assignments(tree):
+    if name in memoryClasses:
+      continue
+    try:
+      names[name] = constants.evaluate(value)
+    except ValueError:
+      pass
+
+  # Calls that may run several times per sample, feeding each other in ways the memories of their call sites do not add up to
+  repeated = set()
+  for node in ast.walk(tree):
+    if isinstance(node, (ast.For, ast.AsyncFor)):
+      parts = node.body + node.orelse
+    elif isinstance(node, (ast.While, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+      parts = [node]
+    elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+      parts = node.body if isinstance(node.body, list) else [node.body]
+    else:
+      continue
+    repeated.update(id(sub) for part in parts for sub in ast.walk(part) if isinstance(sub, ast.Call))
+
+  callsites = []
+  for node in ast.walk(tree):
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in memoryClasses):
+      continue
+    mc = memoryClasses[node.func.id]
+    # Arguments that cannot be evaluated (such as the input signal) are passed as None. If the memory length depends on one,
+    # __memorylength__ will fail, and the memory is unknown.
+    args = [_try_evaluate(constants, arg) for arg in node.args]
+    kwargs = {kw.arg: _try_evaluate(constants, kw.value) for kw in node.keywords if kw.arg is not None}
+    try:
+      memory = mc.__memorylength__(*args, **kwargs)
+    except Exception:
+      memory = None
+    if id(node) in repeated and memory != 0: # (const() never changes, however often it is called)
+      callsites.append(CallSite(node.func.id, node.lineno, node.col_offset, None, False, repeated = True))
+    else:
+      callsites.append(CallSite(node.func.id, node.lineno, node.col_offset, memory, memory is not None))
+  callsites.sort(key = lambda site: (site.lineno, site.col))
+  finder = _CarriedStateFinder(tree)
+  finder.visit(tree.body, set())
+  return ProgramAnalysis(callsites, sorted(finder.carried.items(), key = lambda item: item[1]), _nondeterministic_uses(tree))
+
+
+# Returns (name, lineno) for every use of a module whose results change from one run to the next: imports of those in
+# NONDETERMINISTIC_MODULES, and attributes in NONDETERMINISTIC_ATTRIBUTES (as in np.random.rand()), or __import__()
+def _nondeterministic_uses(tree):
+  uses = []
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Import):
+      uses.extend((alias.name, node.lineno) for alias in node.names
+                  if alias.name.split(".")[0] in NONDETERMINISTIC_MODULES or set(alias.name.split(".")) & NONDETERMINISTIC_ATTRIBUTES)
+    elif isinstance(node, ast.ImportFrom) and node.module:
+      if node.module.split(".")[0] in NONDETERMINISTIC_MODULES or set(node.module.split(".")) & NONDETERMINISTIC_ATTRIBUTES \
+          or any(alias.name in NONDETERMINISTIC_ATTRIBUTES for alias in node.names):
+        uses.append((node.module, node.lineno))
+    elif isinstance(node, ast.Attribute) and node.attr in NONDETERMINISTIC_ATTRIBUTES:
+      uses.append((node.attr, node.lineno))
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "__import__":
+      uses.append(("__import__", node.lineno))
+  return sorted(uses, key = lambda use: use[1])
+
+# Returns the aliases the program loads audio files as, with load(path, alias), that are string literals
+def _loaded_aliases(tree):
+  aliases = []
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "load":
+      arg = node.args[1] if len(node.args) > 1 else next((kw.value for kw in node.keywords if kw.arg == "alias"), None)
+      if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+        aliases.append(arg.value)
+  return aliases
+
+# Returns the paths of the audio files the program loads with load(path, alias), or None if any path is not a string literal
+# (and so cannot be known without running the program)
+def loaded_paths(text):
+  paths = []
+  for node in ast.walk(ast.parse(text)):
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "load":
+      arg = node.args[0] if node.args else next((kw.value for kw in node.keywords if kw.arg == "path"), None)
+      if not (isinstance(arg, ast.Constant) and isinstance(arg.value, str)):
+        return None
+      paths.append(arg.value)
+  return paths
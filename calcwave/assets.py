@@ -0,0 +1,610 @@
+# Loading of the audio files that programs load() as assets.
+# Decoded audio is kept as float32 (samples, channels) arrays. An AssetCache also stores each decoded file in a cache
+# directory as a .npy file, named after the file's path, size and modification time (and the rate it was decoded for), and
+# later loads, in any process, memory-map that file instead of decoding again. Processes that load the same file then share
+# its pages through the operating system's page cache.
+# Uncompressed WAV and RF64 files are not decoded at all: their data chunk is memory-mapped where it is (see map_wav()).
+# Other files too large to decode at once are streamed, decoding pages of them as they are read (see PagedAsset).
+# Files recorded at a different sample rate than the project's are resampled to it once, when they are first loaded.
+# Decoded arrays that are not stored in a file (eg. without a cache directory) are shared with render worker processes
+# through shared memory instead (see SharedAssets).
+
+import os
+import math
+import struct
+import gc
+import atexit
+import weakref
+import hashlib
+import threading
+import collections
+import numpy as np
+
+VERSION = 1
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "calcwave", "assets")
+
+
+# Decodes the audio file at path into a float32 array of shape (samples, channels), scaled to -1..1.
+# If given, progress is called with the fraction decoded so far, at most once per percent.
+def decode(path, progress = None):
+  try:
+    # TODO: stop auto normalization??? https://github.com/bastibe/python-soundfile/issues/20
+    import soundfile as sf
+  except ImportError as e:
+    print("Error importing soundfile module needed for loading audio. You may install this using \"python3 -m pip install soundfile\".")
+    raise e
+  # The file's sample rate is dealt with by open_asset() and AssetCache.load(), which resample it
+  if progress is None:
+    arr, samplerate = sf.read(path, always_2d = True, dtype = 'float32')
+    return arr
+  with sf.SoundFile(path) as file:
+    arr = np.zeros((file.frames, file.channels), dtype = np.float32)
+    done = 0
+    reported = -1
+    for block in file.blocks(blocksize = 1 << 16, dtype = 'float32', always_2d = True):
+      block = block[:len(arr) - done] # Some decoders overestimate the length
+      arr[done:done + len(block)] = block
+      done += len(block)
+      if int(done * 100 / max(len(arr), 1)) > reported:
+        reported = int(done * 100 / max(len(arr), 1))
+        progress(done / max(len(arr), 1))
+  return arr[:done]
+
+
+### Memory-mapped WAV files ###
+
+# numpy dtypes of the WAV sample formats that can be mapped directly, by (format tag, bits per sample)
+_WAV_DTYPES = {(1, 16): '<i2', (1, 32): '<i4', (3, 32): '<f4', (3, 64): '<f8'}
+
+# Returns (dtype, channels, offset, frames) of the data chunk of a WAV or RF64 file, or None if the file is not one, or its
+# samples cannot be mapped as an array (such as 8 and 24-bit integers)
+def wav_layout(path):
+  with open(path, 'rb') as file:
+    riff = file.read(12)
+    if len(riff) < 12 or riff[:4] not in (b'RIFF', b'RF64') or riff[8:12] != b'WAVE':
+      return None
+    fmt = None
+    dataSize64 = None # The data size from an RF64 file's ds64 chunk
+    while True:
+      header = file.read(8)
+      if len(header) < 8:
+        return None
+      chunk, size = struct.unpack('<4sI', header)
+      if chunk == b'data':
+        if size == 0xFFFFFFFF and dataSize64 is not None:
+          size = dataSize64
+        offset = file.tell()
+        break
+      body = file.read(size + (size & 1)) # Chunks are padded to an even size
+      if chunk == b'ds64' and size >= 24:
+        dataSize64 = struct.unpack('<Q', body[8:16])[0]
+      elif chunk == b'fmt ' and size >= 16:
+        tag, channels, _, _, blockAlign, bits = struct.unpack('<HHIIHH', body[:16])
+        if tag == 0xFFFE and size >= 26: # WAVE_FORMAT_EXTENSIBLE: the format tag begins the subformat GUID
+          tag = struct.unpack('<H', body[24:26])[0]
+        fmt = (tag, channels, blockAlign, bits)
+  if fmt is None:
+    return None
+  tag, channels, blockAlign, bits = fmt
+  dtype = _WAV_DTYPES.get((tag, bits))
+  if dtype is None or channels == 0 or blockAlign != channels * bits // 8:
+    return None
+  size = min(size, os.path.getsize(path) - offset) # Files still being written may be shorter than their header says
+  return np.dtype(dtype), channels, offset, size // blockAlign
+
+
+# A read-only (samples, channels) view of integer (or float64) samples that converts them to float32 in -1..1 as they are
+# read, so that they never need to be converted (or held in memory) all at once
+class ScaledArray:
+  def __init__(self, raw):
+    self.raw = raw # The samples, eg. a numpy.memmap
+    self.scale = np.float32(1 if raw.dtype.kind == 'f' else 1 / 2 ** (raw.dtype.itemsize * 8 - 1)) # The same scale soundfile decodes with
+    self.shape = raw.shape
+    self.ndim = raw.ndim
+    self.dtype = np.dtype(np.float32)
+
+  def __len__(self):
+    return len(self.raw)
+
+  def __getitem__(self, index):
+    return np.multiply(self.raw[index], self.scale, dtype = np.float32)
+
+  def __array__(self, dtype = None, copy = None):
+    arr = np.multiply(self.raw, self.scale, dtype = np.float32)
+    return arr if dtype is None else arr.astype(dtype)
+
+  def __iter__(self):
+    return (self[i] for i in range(len(self)))
+
+  def setflags(self, write = None):
+    if write:
+      raise ValueError("Mapped audio is read-only")
+
+# Maps the samples of an uncompressed WAV or RF64 file without reading them, returning a read-only array (a ScaledArray
+# unless they are float32), or None if the file cannot be mapped
+def map_wav(path):
+  try:
+    layout = wav_layout(path)
+  except OSError:
+    return None
+  if layout is None:
+    return None
+  dtype, channels, offset, frames = layout
+  if frames == 0:
+    return np.zeros((0, channels), dtype = np.float32)
+  raw = np.memmap(path, dtype = dtype, mode = 'r', offset = offset, shape = (frames, channels))
+  return raw if dtype == np.float32 else ScaledArray(raw)
+
+# Returns the audio of the file at path, mapped if it can be, or else decoded, and resampled to "rate" if given
+def open_asset(path, rate = None):
+  arr = map_wav(path)
+  arr = arr if arr is not None else decode(path)
+  srcRate = file_rate(path) if rate is not None else None
+  return resample(arr, srcRate, rate) if rate is not None and srcRate != rate else arr
+
+
+### Resampling ###
+
+# Returns samples lo..hi of x as a float32 array, with zeros for the samples beyond either end of x
+def _window(x, lo, hi):
+  padded = np.zeros((hi - lo, x.shape[1]), dtype = np.float32)
+  padded[max(lo, 0) - lo:min(hi, len(x)) - lo] = np.asarray(x[max(lo, 0):min(hi, len(x))], dtype = np.float32)
+  return padded
+
+# Returns the sample rate of the audio file at path
+def file_rate(path):
+  import soundfile as sf
+  return sf.info(path).samplerate
+
+def resampled_length(frames, srcRate, dstRate):
+  return -(-frames * dstRate // srcRate)
+
+# Resamples x, a (samples, channels) array (or anything that can be sliced like one, such as a PagedAsset), from srcRate to
+# dstRate with a Kaiser-windowed sinc filter of halfWidth zero crossings on each side, evaluated as a polyphase filter bank.
+# Writes into out (eg. a memory-mapped array) if given, and returns it. progress is called with the fraction done.
+def resample(x, srcRate, dstRate, out = None, progress = None, halfWidth = 32, beta = 8.6):
+  g = math.gcd(int(srcRate), int(dstRate))
+  up, down = int(dstRate) // g, int(srcRate) // g
+  frames, channels = len(x), x.shape[1]
+  if out is None:
+    out = np.zeros((resampled_length(frames, srcRate, dstRate), channels), dtype = np.float32)
+  cutoff = min(1.0, up / down) # Of the input's Nyquist frequency; lower when downsampling, to avoid aliasing
+  reach = int(math.ceil(halfWidth / cutoff)) # Input samples used on each side of an output sample
+  offsets = np.arange(-reach + 1, reach + 1) # Taps relative to the input sample at or before the output sample
+
+  def weights(frac): # Filter weights for output samples frac (0..1) of the way past their input sample
+    d = offsets[None, :] - frac[:, None]
+    w = np.sinc(d * cutoff) * np.i0(beta * np.sqrt(np.clip(1 - (d / reach) ** 2, 0, 1))) / np.i0(beta)
+    return w / w.sum(axis = 1, keepdims = True) # Unity gain at DC
+
+  if up > 4096:
+    # Rates with no small common ratio: weigh every output sample's window separately, with the weights of the nearest of
+    # 4096 fractional positions (off by at most 1/4096 of a sample)
+    bank = weights(np.arange(4096) / 4096)
+    for start in range(0, len(out), 8192):
+      n = np.arange(start, min(start + 8192, len(out)), dtype = np.int64)
+      base = n * down // up
+      lo = int(base[0]) - reach + 1
+      padded = _window(x, lo, int(base[-1]) + reach + 1)
+      out[start:start + len(n)] = np.einsum('mt,mtc->mc', bank[n * down % up * 4096 // up], padded[base[:, None] + offsets[None, :] - lo])
+      if progress is not None:
+        progress((start + len(n)) / len(out))
+    return out
+
+  bank = weights(np.arange(up) / up) # The weights repeat every "up" output samples
+  # Output samples n, n + up, n + 2 * up ... use the same weights, on input windows "down" samples apart, so each such
+  # series is computed as one product of strided windows of the input and a vector of weights
+  perPhase = max(64, (1 << 16) // up)
+  for start in range(0, len(out), perPhase * up):
+    stop = min(start + perPhase * up, len(out))
+    lo = start * down // up - reach + 1
+    padded = _window(x, lo, (stop - 1) * down // up + reach + 1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, len(offsets), axis = 0) # (rows, channels, taps)
+    for n in range(start, min(start + up, stop)):
+      count = len(range(n, stop, up))
+      out[n:stop:up] = windows[n * down // up - reach + 1 - lo::down][:count] @ bank[n * down % up]
+    if progress is not None:
+      progress(stop / len(out))
+  return out
+
+
+### Streamed files ###
+
+# A read-only (samples, channels) view of an audio file that decodes it in pages of pageFrames frames as they are indexed,
+# keeping the most recently used pages up to "budget" bytes. When pages are read in order, "readAhead" pages are decoded
+# at once, since seeking in compressed files is slow.
+class PagedAsset:
+  def __init__(self, path, pageFrames = 65536, budget = 64 << 20, readAhead = 4):
+    import soundfile as sf
+    self.file = sf.SoundFile(path)
+    self.pageFrames = pageFrames
+    self.readAhead = readAhead
+    self.shape = (self.file.frames, self.file.channels)
+    self.ndim = 2
+    self.dtype = np.dtype(np.float32)
+    self.maxPages = max(readAhead, budget // (pageFrames * self.file.channels * 4))
+    self.pages = collections.OrderedDict() # Decoded pages by number, least recently used first
+    self.nextPage = None # The page after the last ones decoded
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock() # Programs may be evaluated by several threads (eg. when warming up a hot swap)
+
+  def __len__(self):
+    return self.shape[0]
+
+  # Returns the decoded frames of page number p
+  def page(self, p):
+    with self.lock:
+      arr = self.pages.get(p)
+      if arr is not None:
+        self.pages.move_to_end(p)
+        self.hits += 1
+        return arr
+      self.misses += 1
+      count = self.readAhead if p == self.nextPage else 1
+      self.file.seek(p * self.pageFrames)
+      data = self.file.read(frames = count * self.pageFrames, dtype = 'float32', always_2d = True)
+      data.setflags(write = False)
+      for i in range(0, max(len(data), 1), self.pageFrames):
+        self.pages[p + i // self.pageFrames] = data[i:i + self.pageFrames]
+      self.nextPage = p + count
+      while len(self.pages) > self.maxPages:
+        self.pages.popitem(last = False)
+      return self.pages[p]
+
+  def __getitem__(self, index):
+    if isinstance(index, tuple): # eg. asset[i, 0] or asset[:, 0]
+      frames = self[index[0]]
+      if isinstance(index[0], (int, np.integer)): # A single frame, so the rest index its channels
+        return frames[index[1:]]
+      return frames[(slice(None),) + index[1:]]
+    if isinstance(index, slice):
+      start, stop, step = index.indices(len(self))
+      if step != 1:
+        return self[start:stop][::step]
+      parts = []
+      while start < stop:
+        p, offset = divmod(start, self.pageFrames)
+        part = self.page(p)[offset:offset + stop - start]
+        parts.append(part)
+        start += len(part)
+      return np.concatenate(parts) if parts else np.zeros((0, self.shape[1]), dtype = np.float32)
+    if isinstance(index, (list, np.ndarray)): # An array of frame numbers, eg. from mathextensions.play()
+      index = np.asarray(index, dtype = np.intp)
+      index = np.where(index < 0, index + len(self), index)
+      if index.size and (index.min() < 0 or index.max() >= len(self)):
+        raise IndexError(f"index is out of bounds for audio of {len(self)} samples")
+      out = np.empty(index.shape + self.shape[1:], dtype = np.float32)
+      pages = index // self.pageFrames
+      for p in np.unique(pages): # In order, so that reading ahead applies
+        inPage = pages == p
+        out[inPage] = self.page(int(p))[index[inPage] - p * self.pageFrames]
+      return out
+    index = int(index)
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError(f"index {index} is out of bounds for audio of {len(self)} samples")
+    p, offset = divmod(index, self.pageFrames)
+    return self.page(p)[offset]
+
+  def __array__(self, dtype = None, copy = None):
+    arr = self[:]
+    return arr if dtype is None else arr.astype(dtype)
+
+  def __iter__(self):
+    return (self[i] for i in range(len(self)))
+
+  def setflags(self, write = None):
+    if write:
+      raise ValueError("Streamed audio is read-only")
+
+
+### Shared memory ###
+
+# Decoded audio held in multiprocessing.shared_memory blocks, for worker processes to attach to by name instead of each
+# decoding and holding its own copy. The process that creates the blocks owns them: it counts the references to each (see
+# put() and release()), and unlinks a block when its last reference is released, or when it exits. Other processes receive
+# a SharedAssets by pickling it, which sends only the blocks' names, and attach read-only views of them.
+class SharedAssets:
+  def __init__(self):
+    self.blocks = {} # SharedMemory blocks, by key
+    self.layouts = {} # (shape, dtype) of the array in each block, by key
+    self.refs = {} # References to each block, by key (in the owner)
+    self.views = {} # Read-only arrays of the blocks, by key (in attached processes)
+    self.owner = True
+    atexit.register(self.close)
+
+  # Copies arr into a new block for key, or adds a reference to the existing one
+  def put(self, key, arr):
+    from multiprocessing import shared_memory
+    if key in self.blocks:
+      self.refs[key] += 1
+      return
+    block = shared_memory.SharedMemory(create = True, size = max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype = arr.dtype, buffer = block.buf)[...] = arr
+    self.blocks[key] = block
+    self.layouts[key] = (arr.shape, arr.dtype.str)
+    self.refs[key] = 1
+
+  # Drops a reference to key's block, unlinking it once there are none left
+  def release(self, key):
+    self.refs[key] -= 1
+    if self.refs[key] == 0:
+      del self.refs[key], self.layouts[key]
+      self.views.pop(key, None)
+      block = self.blocks.pop(key)
+      block.unlink()
+      try:
+        block.close()
+      except BufferError: # Arrays of it are still in use; it is unmapped once they are gone
+        pass
+
+  # Returns the read-only array of key's block, or None if there is none
+  def get(self, key):
+    if key not in self.blocks:
+      return None
+    arr = self.views.get(key)
+    if arr is None:
+      shape, dtype = self.layouts[key]
+      arr = np.ndarray(shape, dtype = dtype, buffer = self.blocks[key].buf)
+      arr.setflags(write = False)
+      self.views[key] = arr
+    return arr
+
+  # Unlinks all the blocks, in the owner (in attached processes, they are unmapped when the process exits)
+  def close(self):
+    if self.owner:
+      for key in list(self.refs):
+        self.refs[key] = 1
+        self.release(key)
+
+  def nbytes(self):
+    return sum(block.size for block in self.blocks.values())
+
+  def __getstate__(self):
+    return {key: (block.name, self.layouts[key]) for key, block in self.blocks.items()}
+
+  def __setstate__(self, state):
+    from multiprocessing import shared_memory
+    self.blocks, self.layouts, self.refs, self.views = {}, {}, {}, {}
+    self.owner = False
+    for key, (name, layout) in state.items():
+      try:
+        self.blocks[key] = shared_memory.SharedMemory(name)
+      except FileNotFoundError: # Released since; the worker loads the file itself
+        continue
+      self.layouts[key] = layout
+
+
+# Returns the bytes of memory that loaded audio (as returned by AssetCache.load()) holds or maps
+def held_bytes(arr):
+  if isinstance(arr, PagedAsset):
+    return sum(page.nbytes for page in list(arr.pages.values()))
+  if isinstance(arr, ScaledArray):
+    return arr.raw.nbytes
+  return arr.nbytes
+
+
+class AssetCache:
+  # Files that would decode to more than streamAbove bytes, and cannot be mapped, are streamed as PagedAssets that keep
+  # up to pageBudget bytes of each decoded.
+  # Loaded audio is kept for as long as the programs that loaded it exist. Once the audio this process holds exceeds
+  # memoryBudget bytes (if given), the least recently used files that no program uses any more are dropped (see trim()).
+  def __init__(self, directory = DEFAULT_DIR, streamAbove = 1 << 30, pageBudget = 64 << 20, memoryBudget = None):
+    self.directory = directory # Where decoded files are stored, or None to only share them within this process
+    self.streamAbove = streamAbove
+    self.pageBudget = pageBudget
+    self.memoryBudget = memoryBudget
+    self.loaded = collections.OrderedDict() # Arrays loaded by this process, by key, least recently used first
+    self.users = {} # The programs (eg. Evaluators) using each array, by key, as weakref.WeakSets
+    self.evictions = 0
+    self.lock = threading.RLock() # Files are loaded by the audio thread, and prefetched by another
+    self.shared = None # SharedAssets of arrays shared with (or by) other processes, created by share()
+    if directory is not None:
+      os.makedirs(directory, exist_ok = True)
+
+  # Only the settings, and the names of the shared arrays, are sent to other processes; they load or attach the arrays themselves
+  def __getstate__(self):
+    return {"directory": self.directory, "streamAbove": self.streamAbove, "pageBudget": self.pageBudget, "memoryBudget": self.memoryBudget,
+            "shared": self.shared}
+
+  def __setstate__(self, state):
+    shared = state.pop("shared", None)
+    self.__init__(**state)
+    self.shared = shared
+
+  # Returns the number of bytes the file at path would take decoded as float32
+  def decodedSize(self, path):
+    import soundfile as sf
+    info = sf.info(path)
+    return info.frames * info.channels * 4
+
+  # Returns the key identifying the decoded audio of the file at path, at the given sample rate (or its own rate, if None),
+  # and the rate it needs resampling to (None if it does not). A file changed on disk gets a new key.
+  def key(self, path, rate = None):
+    if rate is not None and file_rate(path) == rate:
+      rate = None
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    digest = hashlib.sha256(repr((VERSION, path, stat.st_size, stat.st_mtime_ns, rate)).encode()).hexdigest()[:24]
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{digest}", rate
+
+  def path(self, key):
+    return os.path.join(self.directory, key + ".npy")
+
+  # Whether the file at path has been loaded by this process, so that loading it again does not read or decode anything
+  def isResident(self, path, rate = None):
+    try:
+      return self.key(path, rate)[0] in self.loaded
+    except Exception: # Missing or not audio
+      return False
+
+  # Returns the read-only decoded audio of the file at path at the given sample rate, from this process's arrays, by mapping
+  # it if it is an uncompressed WAV file, from a memory-mapped cache file, or by decoding (and resampling) it and storing it in
+  # the cache directory. progress is called with the fraction decoded (or resampled) so far.
+  # If given, user is the program that uses the audio, which keeps it from being evicted for as long as it exists.
+  def load(self, path, rate = None, progress = None, user = None):
+    key, rate = self.key(path, rate)
+    with self.lock:
+      arr = self.loaded.get(key)
+      if arr is not None:
+        self.loaded.move_to_end(key)
+        self.addUser(key, user)
+        return arr
+    arr = self.shared.get(key) if self.shared is not None else None
+    if arr is None and rate is None:
+      arr = map_wav(path)
+    if arr is None and self.directory is not None:
+      try:
+        arr = np.load(self.path(key), mmap_mode = 'r')
+      except (OSError, ValueError): # Not cached yet, or a damaged file
+        arr = None
+    if arr is None and rate is not None:
+      arr = self.resampled(key, path, rate, progress)
+    if arr is None and self.decodedSize(path) > self.streamAbove:
+      arr = PagedAsset(path, budget = self.pageBudget)
+    if arr is None:
+      arr = decode(path, progress)
+      if self.directory is not None:
+        arr = self.store(key, arr)
+    arr.setflags(write = False)
+    with self.lock:
+      self.loaded[key] = arr
+      self.addUser(key, user)
+    self.trim(keep = key)
+    return arr
+
+  def addUser(self, key, user):
+    if user is not None:
+      self.users.setdefault(key, weakref.WeakSet()).add(user)
+
+  # Returns the bytes of audio this process holds
+  def memoryUsage(self):
+    with self.lock:
+      return sum(held_bytes(arr) for arr in self.loaded.values())
+
+  # Drops the least recently used arrays that no program uses (other than keep's) until the audio this process holds fits in
+  # memoryBudget. Returns the number dropped.
+  def trim(self, keep = None):
+    if self.memoryBudget is None:
+      return 0
+    with self.lock:
+      used = self.memoryUsage()
+      if used <= self.memoryBudget:
+        return 0
+      evicted = 0
+      for attempt in range(2):
+        for key in [key for key in self.loaded if key != keep and not self.users.get(key)]:
+          if used <= self.memoryBudget:
+            break
+          used -= held_bytes(self.loaded.pop(key))
+          self.users.pop(key, None)
+          evicted += 1
+        if used <= self.memoryBudget or attempt > 0:
+          break
+        gc.collect() # Replaced programs are only freed by the garbage collector (Evaluators refer to themselves), so free them
+      self.evictions += evicted
+      return evicted
+
+  # Describes the audio held, for a status bar
+  def usageText(self):
+    text = f"assets {self.memoryUsage() / (1 << 20):.0f}"
+    return text + (f"/{self.memoryBudget / (1 << 20):.0f}M" if self.memoryBudget is not None else "M")
+
+  # Resamples the file at path to rate, writing the result straight into the cache directory (so that files too large to hold
+  # in memory can be resampled), and returns it memory-mapped from there
+  def resampled(self, key, path, rate, progress = None):
+    source = map_wav(path)
+    if source is None:
+      source = PagedAsset(path, budget = self.pageBudget) if self.decodedSize(path) > self.streamAbove else decode(path)
+    srcRate = file_rate(path)
+    if self.directory is None:
+      return resample(source, srcRate, rate, progress = progress)
+    cachePath = self.path(key)
+    tmp = f"{cachePath}.{os.getpid()}.tmp"
+    out = np.lib.format.open_memmap(tmp, mode = 'w+', dtype = np.float32, shape = (resampled_length(len(source), srcRate, rate), source.shape[1]))
+    resample(source, srcRate, rate, out = out, progress = progress)
+    out.flush()
+    del out
+    os.replace(tmp, cachePath)
+    return np.load(cachePath, mmap_mode = 'r')
+
+  # Loads the files at paths (at the given sample rate) and places those that are only held in this process's memory in
+  # shared memory, for the worker processes this cache is then sent to. Files that are memory-mapped or streamed are not,
+  # since every process can map or stream them itself. Returns the keys shared, to pass to unshare() once the workers are done.
+  def share(self, paths, rate = None):
+    keys = []
+    for path in paths:
+      try:
+        arr = self.load(path, rate)
+      except Exception: # The program will raise it when it runs
+        continue
+      if type(arr) is np.ndarray:
+        if self.shared is None:
+          self.shared = SharedAssets()
+        key = self.key(path, rate)[0]
+        self.shared.put(key, arr)
+        keys.append(key)
+    return keys
+
+  def unshare(self, keys):
+    for key in keys:
+      self.shared.release(key)
+
+  # Writes arr to the cache directory, returning it memory-mapped from there
+  def store(self, key, arr):
+    path = self.path(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+      with open(tmp, 'wb') as file:
+        np.save(file, arr)
+      os.replace(tmp, path) # Other processes never see a partial file
+      return np.load(path, mmap_mode = 'r')
+    except OSError: # Eg. the disk is full; the decoded array still works
+      if os.path.exists(tmp):
+        os.remove(tmp)
+      return arr
+
+
+# Loads the audio files of an edited program into an AssetCache on a background thread, so that the program can be swapped
+# in once they are resident, without the audio thread ever waiting for them
+class Prefetcher:
+  def __init__(self, cache):
+    self.cache = cache
+    self.generation = 0 # Incremented by every prefetch() and cancel(), so that older prefetches are abandoned
+    self.lock = threading.Lock()
+
+  # The paths that are not yet resident in the cache (at the given sample rate)
+  def pending(self, paths, rate = None):
+    return [path for path in paths if not self.cache.isResident(path, rate)]
+
+  # Abandons the current prefetch: its onReady will not be called
+  def cancel(self):
+    with self.lock:
+      self.generation += 1
+
+  # Starts loading the paths (at the given sample rate) on a background thread, calling onProgress(text) as it goes, and
+  # onReady() once they are all loaded, unless another prefetch has started (or cancel() has been called) since.
+  # Returns the thread.
+  def prefetch(self, paths, onReady, onProgress = None, rate = None):
+    with self.lock:
+      self.generation += 1
+      generation = self.generation
+    report = onProgress or (lambda text: None)
+
+    def run():
+      for n, path in enumerate(paths):
+        if generation != self.generation:
+          return
+        name = f"{os.path.basename(path)} ({n + 1}/{len(paths)})" if len(paths) > 1 else os.path.basename(path)
+        try:
+          self.cache.load(path, rate, progress = lambda fraction: report(f"Loading {name}: {int(fraction * 100)}%"))
+        except Exception as e: # The program will raise it when it runs
+          report(f"Could not load {path}: {type(e).__name__}: {e}")
+      if generation == self.generation:
+        onReady()
+
+    thread = threading.Thread(target = run, name = "asset-prefetch", daemon = True)
+    thread.start()
+    return thread
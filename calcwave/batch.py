@@ -0,0 +1,294 @@
+# Batch rendering: "calcwave render" exports many projects in one run, spread over a pool of processes.
+# Projects are given as .cw files, glob patterns, or manifests (.json or .csv) listing jobs with per-job overrides of the
+# project's settings (see MANIFEST_FIELDS). Audio files that jobs load are decoded once into the asset cache (see assets.py),
+# which every worker memory-maps. A table of how long each job took is printed at the end.
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+import concurrent.futures
+
+# Fields a manifest job may set, and their types. "project" is required; the others override the project's settings.
+MANIFEST_FIELDS = {"project": str, "output": str, "start": float, "end": float, "step": float,
+                   "rate": int, "channels": int, "format": str, "seed": int}
+
+
+# One project to render, and where to
+class RenderJob:
+  def __init__(self, project, output, overrides = None):
+    self.project = project # Absolute path of the .cw file
+    self.output = output # Absolute path of the file to export to
+    self.overrides = overrides or {} # Project settings to replace, from MANIFEST_FIELDS
+
+  def __repr__(self):
+    return f"<RenderJob {self.project} -> {self.output}>"
+
+
+# The outcome of a RenderJob
+class RenderResult:
+  def __init__(self, job, frames = 0, rate = 44100, seconds = 0.0, error = None, messages = None):
+    self.job = job
+    self.frames = frames # Frames rendered
+    self.rate = rate
+    self.seconds = seconds # Wall time spent rendering
+    self.error = error # Why the job failed, or None if it succeeded
+    self.messages = messages or [] # What the export reported
+
+  # Frames rendered per second of wall time
+  def throughput(self):
+    return self.frames / self.seconds if self.seconds > 0 else 0.0
+
+  # Seconds of audio rendered per second of wall time
+  def realtimeFactor(self):
+    return self.throughput() / self.rate
+
+
+# Reads the jobs of a manifest. JSON manifests hold a list of objects (or an object with a "jobs" list); CSV manifests have a
+# header row naming the fields, and leave cells empty to keep the project's setting. Paths are relative to the manifest.
+def read_manifest(path):
+  with open(path, newline = '') as file:
+    if path.lower().endswith(".csv"):
+      rows = [{k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()} for row in csv.DictReader(file)]
+    else:
+      rows = json.load(file)
+      if isinstance(rows, dict):
+        rows = rows.get("jobs", [])
+  base = os.path.dirname(os.path.abspath(path))
+  entries = []
+  for i, row in enumerate(rows):
+    unknown = set(row) - set(MANIFEST_FIELDS)
+    if unknown:
+      raise ValueError(f'{path}: job {i + 1} has unknown fields: {", ".join(sorted(unknown))}')
+    if "project" not in row:
+      raise ValueError(f'{path}: job {i + 1} has no "project"')
+    try:
+      fields = {k: MANIFEST_FIELDS[k](v) for k, v in row.items()}
+    except ValueError as e:
+      raise ValueError(f"{path}: job {i + 1}: {e}")
+    for key in ("project", "output"):
+      if key in fields:
+        fields[key] = os.path.join(base, os.path.expanduser(fields[key]))
+    entries.append(fields)
+  return entries
+
+# Returns the RenderJobs for the inputs: .cw files, glob patterns matching them, and manifests.
+# Outputs default to the project's name with a .wav extension, in outputDir or next to the project. Raises ValueError if
+# several jobs would export to the same file, as they are rendered at the same time.
+def collect_jobs(inputs, outputDir = None):
+  entries = []
+  for item in inputs:
+    if os.path.splitext(item)[1].lower() in (".json", ".csv"):
+      entries.extend(read_manifest(item))
+      continue
+    matches = sorted(glob.glob(os.path.expanduser(item))) if glob.has_magic(item) else [item]
+    if not matches:
+      raise ValueError(f'"{item}" does not match any files')
+    entries.extend({"project": path} for path in matches)
+
+  jobs = []
+  for fields in entries:
+    project = os.path.abspath(fields.pop("project"))
+    output = fields.pop("output", None)
+    if output is None:
+      output = os.path.join(outputDir or os.path.dirname(project), os.path.splitext(os.path.basename(project))[0] + ".wav")
+    jobs.append(RenderJob(project, os.path.abspath(output), fields))
+
+  byOutput = {}
+  for job in jobs:
+    byOutput.setdefault(os.path.normcase(job.output), []).append(job)
+  for same in byOutput.values():
+    if len(same) > 1:
+      projects = ", ".join(os.path.relpath(job.project) for job in same)
+      raise ValueError(f'{len(same)} jobs would export to {same[0].output} ({projects}); give them different outputs')
+  return jobs
+
+
+### Running jobs ###
+
+_assets = {} # The assets.AssetCache of this process, by directory, shared by its jobs (see Evaluator.loadAsset())
+
+# Collects what exportAudio reports, in place of an InfoDisplay
+class _Log:
+  def __init__(self):
+    self.messages = []
+
+  def updateInfo(self, text):
+    self.messages.append(text)
+
+# Renders a job in this process, exporting on "processes" processes
+def run_job(job, overwrite = False, processes = 1, renderCache = None, assetDir = None):
+  from calcwave.calcwave import Config, Evaluator, exportAudio
+  from calcwave.assets import AssetCache
+  result = RenderResult(job)
+  try:
+    if os.path.exists(job.output) and not overwrite:
+      raise FileExistsError(f"{job.output} already exists (use -y to overwrite)")
+    with open(job.project) as file:
+      project = json.load(file)
+    settings = {key: project[key] for key in ("start", "end", "step", "rate", "channels")}
+    settings.update({k: v for k, v in job.overrides.items() if k in settings})
+    config = Config()
+    config.start, config.end, config.step = settings["start"], settings["end"], settings["step"]
+    config.rate, config.channels = settings["rate"], settings["channels"]
+    config.frameSize = project.get("frameSize", config.frameSize)
+    config.seed = job.overrides.get("seed")
+    config.jobs = processes
+    config.checkpointInterval = 0
+    config.renderCache = renderCache
+    if assetDir not in _assets:
+      _assets[assetDir] = AssetCache(assetDir)
+    config.assetCache = _assets[assetDir]
+    os.makedirs(os.path.dirname(job.output), exist_ok = True)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(job.project)) # Relative paths in load() are relative to the project
+    try:
+      config.evaluator = Evaluator(project["expr"], rate = config.rate, channels = config.channels, audio_map = config.AUDIO_MAP, seed = config.seed,
+                                   asset_cache = config.assetCache)
+      log = _Log()
+      t = time.perf_counter()
+      exportAudio(job.output, config, None, log, dtype = job.overrides.get("format", "float32"))
+      result.seconds = time.perf_counter() - t
+    finally:
+      os.chdir(cwd)
+    from calcwave import render
+    result.frames = render.sample_count(config.start, config.end, config.step)
+    result.rate = config.rate
+    result.messages = log.messages
+  except Exception as e:
+    result.error = f"{type(e).__name__}: {e}"
+  return result
+
+# Returns the absolute paths of the audio files the job's program loads, and the sample rate it loads them at
+def job_assets(job):
+  from calcwave import analysis
+  with open(job.project) as file:
+    project = json.load(file)
+  paths = analysis.loaded_paths(project["expr"]) or []
+  base = os.path.dirname(job.project)
+  return [os.path.join(base, os.path.expanduser(path)) for path in paths], job.overrides.get("rate", project["rate"])
+
+def _init_worker(assets):
+  _assets[assets.directory] = assets
+
+def _run_job_in_worker(job, overwrite, cacheArgs, assetDir):
+  renderCache = None
+  if cacheArgs is not None:
+    from calcwave.cache import RenderCache
+    renderCache = RenderCache(*cacheArgs)
+  return run_job(job, overwrite, renderCache = renderCache, assetDir = assetDir)
+
+# Runs the jobs on a pool of "processes" processes, calling onResult with each RenderResult as it finishes.
+# Returns the results in the order of the jobs. A single job is exported on all the processes instead.
+# Decoded audio files are stored in assetDir (see assets.AssetCache), if given, where all the processes can map them.
+# Otherwise, they are decoded once by this process and shared with the others through shared memory.
+def run_jobs(jobs, processes = 1, overwrite = False, renderCache = None, onResult = None, assetDir = None):
+  if len(jobs) == 1 or processes == 1:
+    results = []
+    for job in jobs:
+      results.append(run_job(job, overwrite, processes if len(jobs) == 1 else 1, renderCache, assetDir))
+      if onResult:
+        onResult(results[-1])
+    return results
+  from calcwave.assets import AssetCache
+  cacheArgs = None if renderCache is None else (renderCache.directory, renderCache.maxBytes)
+  if assetDir not in _assets:
+    _assets[assetDir] = AssetCache(assetDir)
+  assets = _assets[assetDir]
+  shared = []
+  if assetDir is None: # (With a cache directory, the workers memory-map the decoded files from it instead)
+    for job in jobs:
+      try:
+        paths, rate = job_assets(job)
+      except Exception: # The job fails when it runs
+        continue
+      shared.extend(assets.share(paths, rate))
+  try:
+    with concurrent.futures.ProcessPoolExecutor(max_workers = min(processes, len(jobs)), initializer = _init_worker, initargs = (assets,)) as pool:
+      futures = {pool.submit(_run_job_in_worker, job, overwrite, cacheArgs, assetDir): i for i, job in enumerate(jobs)}
+      results = [None] * len(jobs)
+      for future in concurrent.futures.as_completed(futures):
+        results[futures[future]] = future.result()
+        if onResult:
+          onResult(results[futures[future]])
+  finally:
+    assets.unshare(shared)
+  return results
+
+
+# Formats the results as a table, with a line of totals
+def summary_table(results, wallTime = None):
+  rows = [("Job", "Output", "Frames", "Seconds", "Frames/s", "Realtime", "Status")]
+  for result in results:
+    rows.append((os.path.basename(result.job.project), os.path.basename(result.job.output), str(result.frames),
+                 f"{result.seconds:.2f}", f"{result.throughput():.0f}", f"{result.realtimeFactor():.1f}x",
+                 "ok" if result.error is None else "FAILED"))
+  done = [result for result in results if result.error is None]
+  frames = sum(result.frames for result in done)
+  audio = sum(result.frames / result.rate for result in done)
+  if wallTime:
+    rows.append(("Total", f"{len(done)}/{len(results)} ok", str(frames), f"{wallTime:.2f}", f"{frames / wallTime:.0f}", f"{audio / wallTime:.1f}x", ""))
+  widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+  return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+
+def parse_args(argv):
+  from calcwave.calcwave import parse_size
+  from calcwave import wavwriter
+  from calcwave import cache
+  from calcwave import assets
+  parser = argparse.ArgumentParser(prog = "calcwave render", description = "Export many Calcwave projects in one run, on a pool of processes")
+  parser.add_argument("inputs", nargs = '+', metavar = "PROJECT",
+                      help = "Project files (*.cw), glob patterns matching them (quote them, eg. 'sfx/*.cw'), or manifests (*.json or *.csv) of jobs with per-job settings: " + ", ".join(MANIFEST_FIELDS))
+  parser.add_argument("-j", "--jobs", type = int, default = 0,
+                      help = "Number of processes to render with (default 0, one per CPU core)")
+  parser.add_argument("-d", "--output-dir", type = str, default = None,
+                      help = "Where to export projects that have no output in a manifest (default: next to each project, as NAME.wav)")
+  parser.add_argument("--format", type = str, default = None, choices = list(wavwriter.FORMATS),
+                      help = "The sample format to export in, for jobs that do not set one (default float32)")
+  parser.add_argument("--seed", type = int, default = None,
+                      help = "Seed random functions such as rand(), for jobs that do not set a seed")
+  parser.add_argument("--cache", type = str, nargs = '?', const = cache.DEFAULT_DIR, default = None, metavar = "DIR",
+                      help = "Read and store rendered audio in a render cache directory (see calcwave -h)")
+  parser.add_argument("--cache-size", type = parse_size, default = "1G", metavar = "SIZE",
+                      help = "The most disk space the render cache may use (default 1G)")
+  parser.add_argument("--asset-cache", type = str, default = assets.DEFAULT_DIR, metavar = "DIR",
+                      help = "Where to keep decoded copies of loaded audio files, which every worker memory-maps (see calcwave -h)")
+  parser.add_argument("--no-asset-cache", action = 'store_true',
+                      help = "Decode loaded audio files in every worker, without storing them in the asset cache")
+  parser.add_argument("-y", "--yes", action = 'store_true',
+                      help = "Overwrite existing output files (otherwise, those jobs fail)")
+  return parser.parse_args(argv)
+
+def main(argv):
+  args = parse_args(argv)
+  from calcwave import render
+  try:
+    jobs = collect_jobs(args.inputs, os.path.abspath(args.output_dir) if args.output_dir else None)
+  except (OSError, ValueError) as e:
+    print(f"Error: {e}", file = sys.stderr)
+    return 2
+  for job in jobs:
+    if args.format and "format" not in job.overrides:
+      job.overrides["format"] = args.format
+    if args.seed is not None and "seed" not in job.overrides:
+      job.overrides["seed"] = args.seed
+  renderCache = None
+  if args.cache:
+    from calcwave.cache import RenderCache
+    renderCache = RenderCache(os.path.abspath(os.path.expanduser(args.cache)), args.cache_size)
+
+  def onResult(result):
+    if result.error is None:
+      print(f"Rendered {result.job.output}", file = sys.stderr)
+    else:
+      print(f"Failed {result.job.project}: {result.error}", file = sys.stderr)
+
+  t = time.perf_counter()
+  assetDir = None if args.no_asset_cache else os.path.abspath(os.path.expanduser(args.asset_cache))
+  results = run_jobs(jobs, render.resolve_jobs(args.jobs), args.yes, renderCache, onResult, assetDir)
+  print(summary_table(results, time.perf_counter() - t))
+  return 0 if all(result.error is None for result in results) else 1
@@ -0,0 +1,205 @@
+# Headless benchmarks of render throughput: "python -m calcwave.bench" renders the example projects, and a set of synthetic
+# stress programs, on each evaluation backend, and prints JSON with the samples per second, realtime factor and peak memory
+# of each, for tracking performance across versions.
+# The backends are the ways Calcwave evaluates programs: "player" plays through the AudioPlayer into a null sink, "serial"
+# renders on one process (as single-process exports do), and "parallel" renders on a pool of processes (as exports with -j).
+# Every case runs in a fresh process, so that its peak RSS is its own.
+
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import platform
+import tempfile
+import subprocess
+
+BACKENDS = ("player", "serial", "parallel")
+
+# Synthetic stress programs, as name: (channels, text). "{asset}" is replaced with the path of a generated audio file.
+STRESS_PROGRAMS = {
+  "math": (1, "out[:] = sin(x / 30) * cos(x / 7) + tanh(sin(x / 1000)) * 0.2"),
+  "memory": (1, "s = sin(x / 40)\nout[:] = (ema(s, 50) + delay(s, [100, 300], [1, 0.5]) + history(s, 500)[0] + derv(s) + conv(s, [0.25, 0.5, 0.25])) / 5"),
+  "assets": (2, "load({asset!r}, 'a')\nout[:] = play(a, x * 1.5) * 0.5 + a[int(x) % len(a)] * 0.5"),
+  "multichannel": (8, "for i in range(8):\n  out[i] = sin(x / (20 + i))"),
+}
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples") # In a source checkout
+
+
+# Returns the peak resident memory in MiB of this process, and of its largest child process (eg. a render worker)
+def peak_rss():
+  try:
+    import resource
+  except ImportError: # Windows
+    return None, None
+  unit = 1 if sys.platform == "darwin" else 1024 # ru_maxrss is in bytes on macOS, and KiB elsewhere
+  return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / (1 << 20),
+          resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / (1 << 20))
+
+# Writes the audio file that the "assets" stress program reads: 10 seconds of stereo noise and tones, compressed so that it
+# is decoded when loaded
+def write_asset(path, rate = 44100):
+  import numpy as np
+  import soundfile as sf
+  t = np.arange(rate * 10) / rate
+  rng = np.random.default_rng(0)
+  data = np.stack([np.sin(t * 440 * 2 * np.pi), rng.uniform(-1, 1, len(t))], axis = 1) * 0.5
+  sf.write(path, data, rate)
+  return path
+
+# Returns the cases to run, as dicts of the program's text and settings, with at most "seconds" of audio each
+def collect_cases(projects, stress, seconds, assetDir):
+  from calcwave import render
+  cases = []
+  for path in projects:
+    with open(path) as file:
+      project = json.load(file)
+    frames = min(render.sample_count(project["start"], project["end"], project["step"]), int(seconds * project["rate"]))
+    cases.append({"program": os.path.relpath(path), "kind": "project", "text": project["expr"], "channels": project["channels"],
+                  "rate": project["rate"], "start": project["start"], "step": project["step"], "frames": frames,
+                  "frameSize": project.get("frameSize", 1024), "cwd": os.path.dirname(os.path.abspath(path))})
+  if stress:
+    asset = write_asset(os.path.join(assetDir, "bench.flac"))
+    for name, (channels, text) in STRESS_PROGRAMS.items():
+      cases.append({"program": name, "kind": "stress", "text": text.format(asset = asset), "channels": channels, "rate": 44100,
+                    "start": 0, "step": 1.0, "frames": int(seconds * 44100), "frameSize": 1024, "cwd": assetDir})
+  return cases
+
+
+# Runs a case on a backend in this process, returning its result
+def run_case(case, backend, jobs):
+  from calcwave import analysis
+  from calcwave import render
+  from calcwave.assets import AssetCache
+  from calcwave.calcwave import Config, Evaluator, AudioPlayer
+  os.chdir(case["cwd"]) # Relative paths in load() are relative to the project
+  text, rate, channels = case["text"], case["rate"], case["channels"]
+  start, step, frames = case["start"], case["step"], case["frames"]
+  end = start + (frames - 1) * step
+  result = {"program": case["program"], "kind": case["kind"], "backend": backend, "channels": channels, "rate": rate, "frames": frames}
+
+  warmup = 0
+  if backend == "parallel":
+    try:
+      program = analysis.analyze(text, rate = rate)
+    except SyntaxError as e:
+      return {**result, "skipped": f"SyntaxError: {e}"}
+    if not program.isBounded():
+      return {**result, "skipped": "the program keeps unbounded state, so it is only rendered on one process"}
+    warmup = program.warmupLength()
+    result["jobs"] = jobs
+
+  # Audio files are loaded (into memory, not the asset cache directory, which may or may not be warm) before timing
+  assets = AssetCache(None)
+  for path in analysis.loaded_paths(text) or []:
+    try:
+      assets.load(path, rate)
+    except Exception: # The program will raise it when it runs
+      pass
+
+  errors = 0
+  t = time.perf_counter()
+  if backend == "player":
+    config = Config()
+    config.start, config.end, config.step, config.rate, config.channels = start, end, step, rate, channels
+    config.frameSize = case["frameSize"]
+    config.sink = "null"
+    config.loopCacheBytes = 0
+    config.assetCache = assets
+    config.evaluator = Evaluator(text, rate = rate, channels = channels, asset_cache = assets)
+    config.publish()
+    player = AudioPlayer(config)
+    player.loop = False
+    player.pauseOnError = False
+    count = [0]
+    def onError(msg):
+      count[0] += 1
+    player.set_info_update_fn(onError)
+    player.play()
+    errors = count[0]
+  elif backend == "serial":
+    evaluator = Evaluator(text, rate = rate, channels = channels, asset_cache = assets)
+    for block in render.render_serial(evaluator.evaluate, start, end, step, channels, case["frameSize"]):
+      errors += block.errorCount
+  else:
+    for block in render.render_parallel(text, rate, start, end, step, channels, case["frameSize"], jobs, warmup = warmup, assetCache = assets):
+      errors += block.errorCount
+  seconds = time.perf_counter() - t
+
+  rss, childRss = peak_rss()
+  result.update({"seconds": round(seconds, 4), "samples_per_sec": round(frames / seconds, 1), "realtime_factor": round(frames / rate / seconds, 3),
+                 "peak_rss_mib": None if rss is None else round(rss, 1), "errors": errors})
+  if backend == "parallel" and childRss is not None:
+    result["peak_worker_rss_mib"] = round(childRss, 1)
+  return result
+
+# Runs a case on a backend in a fresh process, returning its result
+def run_isolated(case, backend, jobs):
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env = dict(os.environ, PYTHONPATH = os.pathsep.join([root] + [p for p in [os.environ.get("PYTHONPATH")] if p]))
+  proc = subprocess.run([sys.executable, "-m", "calcwave.bench", "--case", json.dumps([case, backend, jobs])], capture_output = True, text = True, env = env)
+  lines = proc.stdout.strip().splitlines()
+  if proc.returncode != 0 or not lines:
+    error = (proc.stderr.strip().splitlines() or ["exited with status " + str(proc.returncode)])[-1]
+    return {"program": case["program"], "kind": case["kind"], "backend": backend, "failed": error}
+  return json.loads(lines[-1])
+
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(prog = "python -m calcwave.bench", description = "Measure Calcwave's render throughput on example projects and synthetic stress programs, reporting JSON")
+  parser.add_argument("projects", nargs = '*', metavar = "PROJECT",
+                      help = f"Project files (*.cw) to benchmark (default: the example projects, {os.path.join(EXAMPLES_DIR, '*.cw')})")
+  parser.add_argument("--seconds", type = float, default = 5.0,
+                      help = "The most audio to render of each program, from the start of its range (default 5)")
+  parser.add_argument("--backends", type = str, default = ",".join(BACKENDS),
+                      help = f"Comma-separated backends to run each program on (default {','.join(BACKENDS)})")
+  parser.add_argument("-j", "--jobs", type = int, default = 0,
+                      help = "Number of processes for the parallel backend (default 0, one per CPU core)")
+  parser.add_argument("--no-stress", action = 'store_true',
+                      help = "Only benchmark the projects, not the synthetic stress programs (" + ", ".join(STRESS_PROGRAMS) + ")")
+  parser.add_argument("-o", "--output", type = str, default = None,
+                      help = "Write the JSON report to this file instead of stdout")
+  parser.add_argument("--case", type = str, default = None, help = argparse.SUPPRESS) # Runs one case, for run_isolated()
+  args = parser.parse_args(argv)
+  args.backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+  unknown = set(args.backends) - set(BACKENDS)
+  if unknown:
+    parser.error(f'unknown backends: {", ".join(sorted(unknown))} (choose from {", ".join(BACKENDS)})')
+  return args
+
+def main(argv = None):
+  args = parse_args(sys.argv[1:] if argv is None else argv)
+  if args.case is not None:
+    case, backend, jobs = json.loads(args.case)
+    print(json.dumps(run_case(case, backend, jobs)))
+    return 0
+
+  import numpy as np
+  from calcwave import render
+  from calcwave.calcwave import version
+  projects = args.projects or sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.cw")))
+  jobs = render.resolve_jobs(args.jobs)
+  report = {"calcwave": version, "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "seconds": args.seconds, "results": []}
+  with tempfile.TemporaryDirectory(prefix = "calcwave-bench-") as assetDir:
+    for case in collect_cases(projects, not args.no_stress, args.seconds, assetDir):
+      for backend in args.backends:
+        result = run_isolated(case, backend, jobs)
+        report["results"].append(result)
+        if "samples_per_sec" in result:
+          print(f'{case["program"]} [{backend}]: {result["samples_per_sec"]:.0f} samples/s, {result["realtime_factor"]:.2f}x realtime', file = sys.stderr)
+        else:
+          print(f'{case["program"]} [{backend}]: {result.get("skipped") or result.get("failed")}', file = sys.stderr)
+
+  text = json.dumps(report, indent = 2)
+  if args.output:
+    with open(args.output, 'w') as file:
+      file.write(text + "\n")
+  else:
+    print(text)
+  return 0 if not any("failed" in result for result in report["results"]) else 1
+
+if __name__ == "__main__":
+  sys.exit(main())
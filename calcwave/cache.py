@@ -0,0 +1,319 @@
+# Content-addressed cache of rendered audio, for replaying and re-exporting programs that have not changed.
+# Rendered samples are stored in chunks of CHUNK_FRAMES frames, in .npy files named after a key that identifies everything the
+# samples depend on (see program_key()) and the chunk's position in the range. The cache directory is capped in size, and the
+# least recently used chunks are evicted first.
+#
+# Only deterministic programs are cached. The player caches stateless programs, whose samples only depend on x. Exports also
+# cache programs with bounded memory (see analysis.ProgramAnalysis.warmupLength()): after reading chunks from the cache, the
+# program is warmed up before computing the next chunk that misses, as in a parallel export. As warming up only approximates
+# the state of some memory classes (such as ema(), which never forgets entirely), chunks computed after a warm-up are not stored.
+
+import os
+import json
+import hashlib
+import numpy as np
+from calcwave import analysis
+from calcwave import render
+from calcwave.iterators import maybeCalcIterator, npchunker
+
+CHUNK_FRAMES = 4096
+VERSION = 1
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "calcwave", "render")
+
+
+class RenderCache:
+  def __init__(self, directory = DEFAULT_DIR, maxBytes = 1 << 30):
+    self.directory = directory
+    self.maxBytes = maxBytes
+    os.makedirs(directory, exist_ok = True)
+    self.size = self.scan()[1]
+    self.hits = 0
+    self.misses = 0
+    self.stores = 0
+
+  def path(self, key, chunk):
+    return os.path.join(self.directory, f"{key}-{chunk}.npy")
+
+  # Returns the cached samples of the chunk, of shape (frames, channels), or None if they are not cached
+  def get(self, key, chunk, frames):
+    path = self.path(key, chunk)
+    try:
+      samples = np.load(path)
+      os.utime(path) # Mark as recently used
+    except (OSError, ValueError): # Missing, evicted by another process, or truncated
+      self.misses += 1
+      return None
+    if len(samples) != frames:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return samples
+
+  def put(self, key, chunk, samples):
+    path = self.path(key, chunk)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as file:
+      np.save(file, np.asarray(samples, dtype = np.float32))
+    os.replace(tmp, path) # Readers in other processes never see a partial file
+    self.size += os.path.getsize(path)
+    self.stores += 1
+    if self.size > self.maxBytes:
+      self.evict()
+
+  # Returns the cached chunk files as (mtime, size, path) tuples, oldest first, and their total size
+  def scan(self):
+    entries = []
+    for entry in os.scandir(self.directory):
+      if entry.name.endswith(".npy"):
+        try:
+          stat = entry.stat()
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    return entries, sum(size for _, size, _ in entries)
+
+  # Deletes the least recently used chunks until the cache is below 90% of its maximum size
+  def evict(self):
+    entries, self.size = self.scan() # Other processes may share the directory, so recount
+    for _, size, path in entries:
+      if self.size <= self.maxBytes * 0.9:
+        break
+      try:
+        os.remove(path)
+        self.size -= size
+      except OSError:
+        pass
+
+  def clear(self):
+    for _, _, path in self.scan()[0]:
+      os.remove(path)
+    self.size = 0
+
+  # Describes the cache's size, and the chunks looked up in it by this process
+  def statusText(self):
+    self.size = self.scan()[1] # Includes chunks stored by other processes, such as export workers
+    lookups = f"{self.hits} hits, {self.misses} misses, " if self.hits or self.misses else ""
+    return f"Render cache: {lookups}{self.size / (1 << 20):.1f} MiB in {self.directory}"
+
+
+# Returns (path, size, mtime) for each audio file the program loads, or None if they cannot be determined statically
+def asset_fingerprints(text):
+  paths = analysis.loaded_paths(text)
+  if paths is None:
+    return None
+  fingerprints = []
+  for path in paths:
+    path = os.path.abspath(os.path.expanduser(path))
+    try:
+      stat = os.stat(path)
+      fingerprints.append((path, stat.st_size, stat.st_mtime_ns))
+    except OSError:
+      fingerprints.append((path, None, None))
+  return fingerprints
+
+# Returns whether the program gives the same samples every time a range is rendered, so that they can be cached.
+# With stateful = True (for exports, which render from an empty state), programs with bounded memory can be cached, not only
+# stateless ones; programs that keep values in their own variables never are (see analysis.ProgramAnalysis.carried).
+# Programs that call rand() are not either: unseeded, they are not meant to repeat, and seeded, they are only reproducible
+# when rendered from the start. Nor are programs that read the clock or random numbers from modules such as time or
+# numpy.random (see analysis.NONDETERMINISTIC_MODULES).
+def is_repeatable(text, rate, stateful = False):
+  try:
+    program = analysis.analyze(text, rate = rate)
+  except SyntaxError:
+    return False
+  return (program.isStateless() or (stateful and program.isBounded())) and not any(site.name == "rand" for site in program.callsites) \
+         and not program.nondeterministic
+
+# Returns the cache key for rendering the program over a range starting at origin, or None if the program cannot be cached
+# (see is_repeatable()).
+def program_key(text, rate, channels, step, origin, seed = None, stateful = False):
+  if not is_repeatable(text, rate, stateful):
+    return None
+  assets = asset_fingerprints(text)
+  if assets is None:
+    return None
+  material = json.dumps({"version": VERSION, "text": text, "rate": rate, "channels": channels, "step": repr(float(step)),
+                         "origin": repr(float(origin)), "seed": seed, "assets": assets, "chunk": CHUNK_FRAMES})
+  return hashlib.sha256(material.encode()).hexdigest()[:40]
+
+
+# Renders samples first..last (exclusive) of a range of count samples like render.render_serial(), yielding Blocks of up to
+# frameSize samples. Whole chunks are read from the cache where they are stored, and chunks computed from their beginning
+# are stored, unless the program was warmed up before them. warmup is the program's memory (0 if stateless): before computing
+# samples after reading some from the cache, or if "stale" is True (the program's state is not yet that at sample first), the
+# program is warmed up on the samples before.
+def cached_render(cache, key, evaluate, origin, step, first, last, count, channels, frameSize, minVal = None, maxVal = None, warmup = 0, stale = False):
+  i = first
+  exact = True # Whether the program's state is exactly that of a serial render, so that the samples computed can be stored
+  while i < last:
+    chunk = i // CHUNK_FRAMES
+    chunkStart = chunk * CHUNK_FRAMES
+    chunkEnd = min(chunkStart + CHUNK_FRAMES, count)
+    stop = min(chunkEnd, last)
+    samples = cache.get(key, chunk, chunkEnd - chunkStart)
+    if samples is not None:
+      for j in range(i, stop, frameSize):
+        block = samples[j - chunkStart:min(j + frameSize, stop) - chunkStart]
+        if minVal is not None or maxVal is not None:
+          block = np.clip(block, minVal, maxVal)
+        yield render.Block(j, block, [], 0)
+      i = stop
+      stale = True
+      continue
+
+    if stale and warmup > 0:
+      exact = False
+      for j in range(max(0, i - warmup), i):
+        try:
+          evaluate(origin + j * step)
+        except Exception:
+          pass
+    stale = False
+    parts = [] if exact and i == chunkStart and stop == chunkEnd else None # Only whole chunks are stored
+    for j in range(i, stop, frameSize):
+      block = render.render_block(evaluate, origin, step, j, min(frameSize, stop - j), channels)
+      if parts is not None:
+        parts = parts + [block.samples.copy()] if block.errorCount == 0 else None # Samples that raised exceptions are not stored
+      if minVal is not None or maxVal is not None:
+        np.clip(block.samples, minVal, maxVal, out = block.samples)
+      yield block
+    if parts is not None:
+      cache.put(key, chunk, np.concatenate(parts))
+    i = stop
+
+
+# A maybeCalcIterator for the AudioPlayer that reads samples of a stateless program from the cache.
+# It counts samples from the range's origin, to find their chunks; chunks played from their beginning are stored once complete.
+class CachedCalcIterator(maybeCalcIterator):
+  def __init__(self, cache, key, origin, count, channels, start, end, step, func, **kwargs):
+    super().__init__(start, end, step, func, **kwargs)
+    self.cache, self.key, self.count, self.channels = cache, key, count, channels
+    self.i = int(round((self.curr - origin) / step)) # Index of the next sample
+    self.chunk = None
+    self.cached = None # Samples of the current chunk, if it is cached
+    self.recording = None # Samples of the current chunk computed so far, if it is being recorded
+
+  def loadChunk(self, chunk):
+    self.chunk = chunk
+    frames = min(CHUNK_FRAMES, self.count - chunk * CHUNK_FRAMES)
+    self.cached = self.cache.get(self.key, chunk, frames)
+    self.recording = None
+    if self.cached is None and self.i == chunk * CHUNK_FRAMES:
+      self.recording = np.zeros((frames, self.channels), dtype = np.float32)
+
+  def __next__(self):
+    if self.curr > self.end or self.curr < self.start or self.i >= self.count:
+      raise StopIteration()
+    chunk, j = divmod(self.i, CHUNK_FRAMES)
+    if chunk != self.chunk:
+      self.loadChunk(chunk)
+    if self.cached is not None:
+      self.curr += self.step
+      self.i += 1
+      return self.clip(self.cached[j].copy())
+
+    x, self.curr = self.curr, self.curr + self.step
+    try:
+      v = self.func(x)
+    except Exception as e:
+      self.recording = None
+      self.exceptionHandler(e)
+      if self.repeatOnException: # Undo last step
+        self.curr = self.curr - self.step
+      else:
+        self.i += 1
+      return 0
+    self.i += 1
+    if self.recording is not None:
+      self.recording[j] = v
+      if j == len(self.recording) - 1:
+        self.cache.put(self.key, chunk, self.recording)
+        self.recording = None
+    return self.clip(v)
+
+
+### Loop playback ###
+# While looping over the range, the AudioPlayer records the samples of a repeatable, stateless program into a LoopBuffer in
+# memory as it plays them, and plays them back from it on later passes instead of evaluating the program again.
+# A LoopBuffer belongs to one range and evaluator, so recompiling the program or changing the range starts a new one.
+
+class LoopBuffer:
+  def __init__(self, snapshot, count, channels):
+    self.start, self.end, self.step, self.evaluator = snapshot
+    self.origin = render.range_origin(self.start, self.end, self.step)
+    self.samples = np.zeros((count, channels), dtype = np.float32) # Unclipped
+    self.recorded = 0 # Samples before this index have been recorded
+
+  # Whether the buffer holds the samples of the snapshot's range and program
+  def matches(self, snapshot):
+    return (snapshot.start, snapshot.end, snapshot.step) == (self.start, self.end, self.step) and snapshot.evaluator is self.evaluator
+
+  def isComplete(self):
+    return self.recorded == len(self.samples)
+
+  def nbytes(self):
+    return self.samples.nbytes
+
+
+# A maybeCalcIterator that plays samples from a LoopBuffer where they have been recorded, and records the ones it evaluates
+# that continue the recording
+class LoopIterator(maybeCalcIterator):
+  def __init__(self, buffer, start, end, step, func, **kwargs):
+    super().__init__(start, end, step, func, **kwargs)
+    self.buffer = buffer
+    self.i = int(round((self.curr - buffer.origin) / step)) # Index of the next sample
+
+  def __next__(self):
+    if self.curr > self.end or self.curr < self.start or self.i >= len(self.buffer.samples):
+      raise StopIteration()
+    if self.i < self.buffer.recorded:
+      v = self.buffer.samples[self.i].copy()
+      self.curr += self.step
+      self.i += 1
+      return self.clip(v)
+
+    x, self.curr = self.curr, self.curr + self.step
+    try:
+      v = self.func(x)
+    except Exception as e:
+      self.exceptionHandler(e)
+      if self.repeatOnException: # Undo last step
+        self.curr = self.curr - self.step
+      else:
+        self.i += 1
+      return 0
+    if self.i == self.buffer.recorded:
+      self.buffer.samples[self.i] = v
+      self.buffer.recorded += 1
+    self.i += 1
+    return self.clip(v)
+
+  # Yields chunks of n frames like iterators.npchunker(), slicing whole chunks out of the buffer where they are recorded
+  def chunks(self, n, channels):
+    samples = self.buffer.samples
+    while True:
+      stop = min(self.i + n, len(samples))
+      if self.i >= len(samples) or self.curr > self.end or self.curr < self.start:
+        return
+      if stop > self.buffer.recorded:
+        chunk = next(npchunker(self, n, channels, dtype = np.float32), None)
+        if chunk is None:
+          return
+        yield chunk
+        continue
+      chunk = samples[self.i:stop].copy()
+      if stop - self.i < n: # Like npchunker, drop a final partial chunk
+        self.curr += (stop - self.i) * self.step
+        self.i = stop
+        return
+      self.curr += n * self.step
+      self.i = stop
+      if self.minVal is not None:
+        self.min_clip = self.min_clip or bool((chunk < self.minVal).any())
+      if self.maxVal is not None:
+        self.max_clip = self.max_clip or bool((chunk > self.maxVal).any())
+      if self.minVal is not None or self.maxVal is not None:
+        np.clip(chunk, self.minVal, self.maxVal, out = chunk)
+      yield chunk
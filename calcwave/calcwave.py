@@ -30,30 +30,33 @@ import re
 import time
 import wave
 import gc
+import types
 #import calcwave
 from calcwave import mathextensions
-from calcwave.texteditors import TextEditor, LineEditor, detect_os_monkeypatch_curses_keybindings
+from calcwave import analysis
+from calcwave import render
+from calcwave import wavwriter
+from calcwave import checkpoint
+from calcwave import cache
+from calcwave import assets
 from calcwave.elementaltypes import *
-from calcwave.basicui import *
 from calcwave.iterators import npchunker, maybeCalcIterator
-from calcwave.menuitems import *
-from calcwave.editsync import FileWatchAndSync
+from calcwave.sinks import create_sink, is_device_sink, resolve_sink_spec, default_device_channels
+from calcwave.telemetry import PlayerTelemetry, FrameSizeTuner
 #import calcwave.mathextensions
 import json
+import pickle
 import itertools
+import collections
 import time
 import numpy as np
-import pyaudio
 import traceback
 import tempfile
 import subprocess
 import shlex
 
-#from watchdog.observers import Observer
-from watchdog.observers.polling import PollingObserver
-
-import curses
-import matplotlib.pyplot as plt
+# The terminal interface (calcwave.tui, with curses), matplotlib and watchdog are imported where they are first used, so that
+# exports and headless runs start quickly, and work without them.
 
 global global_display_lock
 global_display_lock = threading.Lock()
@@ -61,10 +64,6 @@ global_display_lock = threading.Lock()
 global global_exception
 global_exception = None
 
-# This is necessary because some systems I tested on seemed to have inaccurate curses default key bindings
-# (eg. enter, escape, backspace wouldn't type the correct character), which is odd...
-detect_os_monkeypatch_curses_keybindings(curses_module = curses)
-
 # Supress SyntaxWarning from Math module
 import warnings
 warnings.filterwarnings(
@@ -156,6 +155,10 @@ class SaveTimer:
   
 
 
+# An immutable view of what the AudioPlayer should be playing. Config.publish() swaps in a new one as a single
+# reference assignment, so the player can check for changes every chunk without taking a lock.
+PlaybackSnapshot = collections.namedtuple("PlaybackSnapshot", ["start", "end", "step", "evaluator"])
+
 # Config that all compatible objects should understand
 class Config:
   def __init__(self):
@@ -171,14 +174,36 @@ class Config:
     #self.functionTable = self.getFunctionTable()
     self.evaluator = None
     self.SaveTimer = None
-    self.updateAudio = False # Audio interrupt to read new data
+    self.snapshot = None # The PlaybackSnapshot last published for the AudioPlayer
     self.output_fd = None # File descriptor for pipe of info display; check if this is set before using
     self.output_device_index = None
+    self.autotune = False # Whether AudioPlayer adapts frameSize to the measured DSP load
+    self.saveTunedFrameSize = False # Whether the frameSize chosen by autotuning is saved back into the project
+    self.hotswap = False # Whether to warm up recompiled programs' memory classes and crossfade to them, instead of switching abruptly
+    self.prerollSeconds = 5.0 # The most audio to render when warming up a recompiled program
+    self.jobs = 1 # Number of processes to export with (0 for one per CPU)
+    self.verifyExport = False # Whether to compare a parallel export against a serial render afterwards
+    self.dither = False # Whether to add TPDF dither when exporting to an integer format
+    self.container = None # The file container to export to (see wavwriter.CONTAINERS), or None to choose from the file extension
+    self.splitSize = 0 # If nonzero, exports are split into numbered files of at most this many bytes of audio each
+    self.seed = None # Seeds random memory classes, for reproducible renders, if not None
+    self.checkpointInterval = 30 # Seconds between export checkpoints, or 0 to not save any
+    self.resume = False # Whether exportAudio resumes from the output's checkpoint, if it has one
+    self.loopCacheBytes = 256 << 20 # The most memory the AudioPlayer may use to record a looping range, to play it back on later passes
+    self.renderCache = None # A cache.RenderCache that playback and exports read rendered chunks from, and store them in
+    self.sink = "pyaudio" # The --sink specification that AudioPlayer plays through
     self.AUDIO_MAP = {}
+    self.assetCache = None # An assets.AssetCache of decoded audio files shared by the evaluators of all programs (see Evaluator.loadAsset())
 
     self.lock = threading.Lock()
 
-    
+  # Publishes the current start, end, step and evaluator to the AudioPlayer, which switches to them at the next chunk boundary.
+  # Call this after changing any of them.
+  def publish(self):
+    with self.lock:
+      self.snapshot = PlaybackSnapshot(self.start, self.end, self.step, self.evaluator)
+    return self.snapshot
+
   
 class MemoryClassCompiler:
   def __init__(self):
@@ -200,7 +225,7 @@ class MemoryClassCompiler:
     # Create new instance of memory class for each greater number of calls of the function in user code
     count = self._func_count[fn_name]
     if count > len(ilist)-1:
-      self._instances[fn_name].append(class_initializer(extra_vars))
+      self._instances[fn_name].append(class_initializer({**extra_vars, "instance": count})) # "instance" distinguishes calls, eg. for seeding
     clazz = self._instances[fn_name][count]
     self._func_count[fn_name] += 1 # Increment to next instance
     
@@ -224,14 +249,25 @@ class MemoryClassCompiler:
   def getFunctionTable(self):
     return self.functionTable
 
+  # Returns the state of every memory class instance as bytes, for a checkpoint
+  def getState(self):
+    return pickle.dumps(self._instances)
+
+  # Restores the state returned by getState() (of a compiler for the same program)
+  def setState(self, state):
+    self._instances = pickle.loads(state)
+
 
 # Accepts CalcWave text input
 # Parses and evaluates Python syntax (with any extra features)
 # Compiles the given code ("text") upon construction, and throws any errors it produces
 class Evaluator:
   # Lightweight constructor that then immediately compiles text - a new instance is created for every version of the expression
-  def __init__(self, text, rate = 44100, symbolTable = vars(math), channels = 1, audio_map = {}):
+  def __init__(self, text, rate = 44100, symbolTable = vars(math), channels = 1, audio_map = {}, seed = None, asset_cache = None):
     self.text = text
+    self.seed = seed # Seeds random memory classes (such as rand()) if not None, so that renders are reproducible
+    self.rate = rate # Loaded audio files are resampled to this rate
+    self.asset_cache = asset_cache # If not None, an assets.AssetCache of decoded audio files shared with other evaluators
     self.symbolTable = symbolTable.copy()
 
     self.audio_map = audio_map
@@ -248,62 +284,60 @@ class Evaluator:
     self.symbolTable.update(mathextensions.getFunctionTable())
 
     self.memory_class = MemoryClassCompiler()
-    self.memory_class.compile(extra_vars = {"rate": rate})
+    self.memory_class.compile(extra_vars = {"rate": rate, "seed": seed})
     self.symbolTable.update(self.memory_class.getFunctionTable())
+    self.initialSymbols = dict(self.symbolTable) # To tell the variables the program assigns (see getState())
 
     self.prog = compile(text, '<string>', 'exec', optimize=2)
 
   ### A custom Evaluator function that loads and adds audio to the audio_map. This will be available globally in the syntax
+  # With an asset cache, audio_map is not used: the cache keeps the audio for as long as this program exists.
   def load(self, path, alias):
     if not alias in self.audio_aliases:
       self.audio_aliases.add(alias)
       audioarr = None
-      if not alias in self.audio_map.keys():      
+      if self.asset_cache is not None or not alias in self.audio_map.keys():
         if not os.path.exists(path):
-          raise FileNotFoundError('load "{alias}": path "{path}" does not exist.')
-        audioarr = self.loadAudioFile(path)
-        audioarr.setflags(write = False)
-        self.audio_map[alias] = audioarr
+          raise FileNotFoundError(f'load "{alias}": path "{path}" does not exist.')
+        audioarr = self.loadAsset(path)
+        if self.asset_cache is None:
+          self.audio_map[alias] = audioarr
       else:
         audioarr = self.audio_map[alias]
       self.symbolTable[alias] = audioarr
 
-  
-  def loadAudioFile(self, path: str):
-    try:
-      # TODO: stop auto normalization??? https://github.com/bastibe/python-soundfile/issues/20
-      import soundfile as sf
-    except ImportError as e:
-      print("Error importing pydub module needed for loading audio. You may install this using \"python3 -m pip install soundfile\". Note: the ffmpeg library will be needed for this.")
-      raise e
-    #filename, file_extension = os.path.splitext(path)
-    #a = pydub.AudioSegment.from_file(path)
-    #arr = a.get_array_of_samples()
-
-    # Note: samplerate is not used for now... This could cause issues...
-    arr, samplerate = sf.read(path, always_2d = True)
-    audioarr = arr
-    #channels = arr.shape[1]
-    #audioarr = arr.reshape(channels, -1).astype(float)
-    
-    #print(arr.shape)
-    #arr = arr.reshape( (arr.shape[1], arr.shape[0]) )
-    #nparr = np.array(arr)
-    #print(audioarr.dtype, arr.dtype)
-    #print(np.mean(audioarr))
-    #time.sleep(2)
-    if not np.issubdtype(arr.dtype, np.floating):
-      audioarr /= np.iinfo(arr.dtype).max # Scale between -1 and 1 as float
-      #print("ISNOTFLOATING", arr.dtype, np.iinfo(arr.dtype).max, arr, audioarr)
-      #time.sleep(2)
 
+  # Returns the decoded, read-only audio of the file at path at the program's rate, through the asset cache if there is one
+  def loadAsset(self, path):
+    if self.asset_cache is not None:
+      return self.asset_cache.load(path, self.rate, user = self)
+    audioarr = self.loadAudioFile(path)
+    audioarr.setflags(write = False)
     return audioarr
+  
+  def loadAudioFile(self, path: str):
+    return assets.open_asset(path, self.rate)
       
 
   # Retrieves the current expression contents as a string
   def getText(self):
     return self.text
 
+  # The state of the program, and a way to restore it: its memory classes (see MemoryClassCompiler.getState()), and the
+  # variables it has assigned, as a program may keep values in them from one sample to the next (eg. a counter). Loaded audio
+  # and imported modules are left out, as the program loads and imports them again. Raises an exception if a variable cannot
+  # be pickled.
+  def getState(self):
+    variables = {name: value for name, value in self.symbolTable.items()
+                 if name not in ("x", "__builtins__") and name not in self.audio_aliases and not isinstance(value, types.ModuleType)
+                 and (name not in self.initialSymbols or self.initialSymbols[name] is not value or name == "out")}
+    return pickle.dumps((self.memory_class.getState(), variables))
+
+  def setState(self, state):
+    memory, variables = pickle.loads(state)
+    self.memory_class.setState(memory)
+    self.symbolTable.update(variables)
+
   # Gets the last logged value, or the last computed value if none was specified
   # Note: 'log' is Deprecated
   def getLog(self):
@@ -323,629 +357,210 @@ class Evaluator:
     return self.symbolTable["out"] # Return result
 
 
-# Handles CalcWave's GUI
-# This is a CalcWave-specialized class (not following the parametric building-blocks convention). It holds references for
-# the main text editor and the buttons below (a UIManager), and switches between the two on up/down arrow keypresses
-# (based on booleans recieved by each of the two indicating whether those keypresses were handled or not).
-class WindowManager:
-  def __init__(self, global_config, scr, initialExpr, audioClass, editor, infoDisplay, exportDtype = int):
-    self.global_config = global_config
-    self.scr = scr
-    self.audioClass = audioClass
-    self.oldStdout = None
-    self.initialExpr = initialExpr
-    self.editor = editor
-    self.infoDisplay = infoDisplay
-
-    self.initCursesSettings()
-  
-    rows, cols = self.scr.getmaxyx()
-    self.menu = UIManager(Box(rowSize = 2, colSize = cols, rowStart = rows - 7, colStart = 0), global_config, audioClass, self.infoDisplay, exportDtype = exportDtype)
-    
-    #with global_display_lock:
-    #  self.editor.setText(initialExpr)
-    self.thread = None
-  
-  def start(self):
-    if self.thread is None:
-      self.shutdown = False
-      self.thread = threading.Thread(target=self.windowThread, args=(self.global_config, self.scr, self.menu, self.audioClass), daemon=True)
-      self.thread.start()
-    
-  def stop(self):
-    if hasattr(self, 'thread'):
-      if self.thread is not None:
-        self.shutdown = True
-        self.thread.join()
-
-  def initCursesSettings(self):
-    self.scr.keypad(True)
-    self.scr.nodelay(True)
-    curses.noecho()
-
-  # Controls whether to redirect all stdout to the infoDisplay
-  def setRedirectOutput(self, redirect: bool):
-    if redirect == True and self.oldStdout == None:
-      newWrite = self.infoDisplay.getWriteFD()
-      if not newWrite:
-        return False
-      self.oldStdout = sys.stdout
-      sys.stdout = os.fdopen(newWrite, 'w')
-    elif self.oldStdout != None:
-      oldfd = sys.stdout
-      sys.stdout = self.oldStdout
-      oldfd.close()
-      self.oldStdout = None
-    return True
-
-  def try_compile_code(self, text):
-    try:
-      evaluator = Evaluator(text, rate = self.global_config.rate, audio_map = self.global_config.AUDIO_MAP, channels = self.global_config.channels) # Compile on-screen code
-      with self.global_config.lock:
-        self.global_config.evaluator = evaluator # Install newly compiled code
-        self.global_config.SaveTimer.notify()
-        self.global_config.updateAudio = True
-        if self.audioClass.isPausedOnException():
-          self.audioClass.setPaused(False)
-    except Exception as e:
-      # Display exceptions to the user
-      with global_display_lock:
-        self.infoDisplay.updateInfo(f"[Compile error] {e.__class__.__name__}: {e.msg}\nAt line {e.lineno} col {e.offset}: {e.text}")
-        self.editor.highlightRange(Point(row = e.lineno, col = e.offset), Point(row = e.end_lineno, col = e.end_offset))
-
-  def windowThread(self, global_config, scr, menu, audioClass):
-    self.scr.getch()
-    self.scr.nodelay(0) # Turn delay mode on, such that curses will now wait for new keypresses on calls to getch()
-    # Draw graphics
-    with global_display_lock:
-      self.menu.refreshAll()
-      self.menu.title.refresh()
-      if self.initialExpr:
-        self.editor.setText(self.initialExpr)
-        self.initialExpr = None
-      
-
-    self.focused = self.editor
-    try:
-      while self.global_config.shutdown is False:
-        ch = self.scr.getch()
-
-        if ch == 27 and self.focused != self.menu: # Escape key
-          with global_display_lock:
-            self.infoDisplay.updateInfo("ESC recieved. Shutting down...")
-          with self.global_config.lock:
-            self.global_config.shutdown = True
-          break
-        isArrowKey = (ch == curses.KEY_UP or ch == curses.KEY_DOWN or ch == curses.KEY_LEFT or ch == curses.KEY_RIGHT)
-        with global_display_lock:
-          successful = self.focused.type(ch)
-        
-        if successful and self.focused == self.editor:
-          p = self.editor.getPos()
-          self.infoDisplay.updateInfo(f"Line: {p.row+1}, Col: {p.col}, Scroll: {self.editor.scrollOffset}")
-          
-          if isArrowKey:
-            continue
-          
-          self.global_config.SaveTimer.clearSaveMsg()
-          # Display cursor position
-          text = self.editor.getText()
-          self.try_compile_code(text)
-          continue
-        
-        # Switch between menu and inputPad with the arrow keys
-        if self.menu.isEditing(): continue # Don't remove focus from the menu while it's editing
-        if ch == curses.KEY_UP and not self.menu.isEditing(): 
-          self.focused.onUnfocus()
-          self.focused = self.editor
-          self.focused.onFocus()
-        elif ch == curses.KEY_DOWN:
-          self.focused.onUnfocus()
-          self.focused = self.menu
-          self.focused.onFocus()
-          
-    except Exception as e:
-      if isinstance(e, KeyboardInterrupt) or isinstance(e, SystemExit):
-        pass
-      else:
-        global_exception = e
-        with open("calcwave_windowmanager_crash.log", 'w') as f:
-          f.write(traceback.format_exc())
-          sys.stderr.write("WindowManger thread has crashed; crash traceback written to calcwave_windowmanager_crash.log\n")
-        raise e
-    finally:
-      self.global_config.shutdown = True
-      
-  # Changes curses settings back in order to restore terminal state
-  # Call this when you are done with this object!
-  def stopCursesSettings(self, scr):
-    curses.echo()
-    curses.nocbreak()
-    scr.keypad(False)
-
-
-
-
-
-
-
-
-
-# A button to export audio as a WAV file, assuming you have the "wave" module installed.
-class exportButton(LineEditor, BasicMenuItem):
-  def __init__(self, shape: Box, global_config, progressBar, infoDisplay, dtype):
-    super().__init__(shape)
-    self.global_config = global_config
-    self.infoPad = infoDisplay
-    self.progressBar = progressBar
-    self.setText("Export Audio")
-    self.hideCursor()
-    self.dtype = dtype
-
-
-  def getDisplayName(self):
-    return "Export Button"
-  
-  def updateValue(self, text):
-    self.setText(text)
-    
-  def onBeginEdit(self):
-      self.setText("") # Clear and allow you to enter the filename
-      return "Please enter filename, and press enter to save. Any existing file will be overwritten."
-  
-  def onHoverEnter(self):
-    self.hideCursor()
-    super().onHoverEnter()
-    return "Press enter to save a recording as a WAV file."
-
-  def onHoverLeave(self):
-    self.showCursor()
-    self.setText("Export Audio")
-    super().onHoverLeave()
-    
-  # Override type, make it check filenames live
-  def type(self, ch):
-    super().type(ch)
-    name = self.getText()
-    name = os.path.expanduser(name)
-    if name == '':
-      self.infoPad.updateInfo("Please enter filename, and press enter to save. Any existing file will be overwritten.")
-      return
-    
-    # Update the infoDisplay
-    fullPath = ''
-    if '/' in name:
-      # Use absolute specified path
-      fullPath = name + ".wav"
-      parDir = '/'.join(fullPath.split('/')[0:-1])
-      try:
-        if parDir != '' and not os.path.isdir(parDir):
-          self.infoPad.updateInfo("Invalid directory \"" + parDir + "\"")
-          return
-      except PermissionError:
-        self.infoPad.updateInfo("Permission denied: " + parDir)
-    else:
-      path = os.getcwd()
-      fullPath = path + "/" + name + ".wav"
-    
-      
-    if os.path.isfile(fullPath):
-      self.infoPad.updateInfo("Will overwrite " + fullPath)
-    else:
-      self.infoPad.updateInfo("Will export as " + fullPath)
-  
-  # Where it actually saves the file
-  def doAction(self):
-    name = self.getText()
-    name = os.path.expanduser(name)
-    actionMessage = "File saved in same directory!"
-    if name == '':
-      self.setText("Export Audio")
-      return "Cancelled."
-    self.setText("Export Audio")
-    path = ''
-    if '/' in name:
-      fullPath = name + ".wav"
-      parDir = '/'.join(fullPath.split('/')[0:-1]) # Remove ending '/'
-      if not os.path.isdir(parDir):
-        actionMsg = "Cannot export audio: invalid path \"" + fullPath + "\""
-        self.setText("Export Audio")
-        return
-    else:
-      path = os.getcwd()
-      fullPath = path + "/" + name + ".wav"
-    actionMsg = "Saving file as " + fullPath
-    
-    #with self.lock:
-    if(self.infoPad):
-      self.infoPad.updateInfo("Writing...")
-    
-    # Do in a separate thread?
-    thread = threading.Thread(target=exportAudio, args=(fullPath, self.global_config, self.progressBar, self.infoPad, self.dtype), daemon = True)
-    thread.start()
-    #exportAudio(fullPath)
-    return actionMsg
-    
-  
-
+WARMUP_TOLERANCE = 1e-3 # The largest difference render.warmup_error() may find for a program to be exported in parallel (ema() is only approximately warmed up)
 
+# Renders the range and exports it to fullPath, or to each path in a list of paths. The file type is chosen by extension.
 def exportAudio(fullPath, global_config, progressBar, infoPad, dtype = float):
-  def exHandler(e):
-    print(f"Exception at x={str(i)}: {type(e).__name__ }: {str(e)}") # Use print system
+  def report(text, end = '\n'):
+    if infoPad:
+      infoPad.updateInfo(text)
+    else:
+      print(text, file=sys.stderr, end = end)
 
   start, end, step = (0,0,0)
   with global_config.lock:
     start, end, step, evaluator = (global_config.start, global_config.end, global_config.step, global_config.evaluator)
-  
-  # If datatype is a float, remove clipping to preserve data depth (clipping is still used in live mode)
-  minVal, maxVal = (-1, 1)
-  if dtype == float:
-    minVal, maxVal = (None, None)
-
-  iter = maybeCalcIterator(start, end, step, evaluator.evaluate, minVal = minVal, maxVal = maxVal, exceptionHandler=exHandler)
-
-  # Logic for progress display
-  i = 0
-  progressStart = 0 # The point the progress display will start from, so it doesn't go backwards
-  # Support negative (backwards) step
-  if step < 0:
-    i = end
-    progressStart = end
-  elif step > 0:
-    i = start
-    progressStart = start
-  elif step == 0:
+  if step == 0:
     raise(ValueError("Step value cannot be zero!"))
   
+  # Samples are not clipped here, to preserve the full range in float outputs (clipping is still used in live mode).
+  # Outputs in integer formats are clipped by their writers.
+  format = wavwriter.format_for(dtype)
+  minVal, maxVal = (None, None)
+  paths = [fullPath] if isinstance(fullPath, str) else list(fullPath)
+  jobs = render.resolve_jobs(global_config.jobs)
+
+  # Single-process exports to one WAV file save checkpoints as they go, and can be resumed from them (see checkpoint.py)
+  settings = checkpoint.export_settings(evaluator.getText(), global_config.rate, global_config.channels, start, end, step,
+                                        format, global_config.container, global_config.dither, global_config.seed)
+  checkpointPath = checkpoint.sidecar_path(paths[0])
+  resumeFrom = None
+  if global_config.resume:
+    resumeFrom = checkpoint.load(checkpointPath)
+    if resumeFrom is None:
+      report("No checkpoint found for " + paths[0] + "; exporting from the start.")
+    else:
+      reason = resumeFrom.mismatch(settings)
+      if reason:
+        raise ValueError(f"Cannot resume from {checkpointPath}: {reason}.")
+      resumeFrom.unpack()
+      jobs = 1
+
+  # The range can be rendered in independent segments by a process pool if the program's state only depends on a bounded
+  # number of past samples: each segment is then warmed up by first evaluating that many samples before it.
+  warmup = 0
+  if jobs > 1:
+    try:
+      program = analysis.analyze(evaluator.getText(), rate = global_config.rate)
+    except SyntaxError:
+      program = None
+    if program is None or not program.isBounded():
+      sites = [] if program is None else program.unboundedReasons()
+      report("Program keeps unbounded state" + (f" ({', '.join(sites[:3])})" if sites else "") + "; exporting on one process.")
+      jobs = 1
+    elif global_config.seed is not None and any(site.name == "rand" for site in program.callsites):
+      report("Seeded random numbers are only reproducible on one process; exporting on one process.")
+      jobs = 1
+    else:
+      warmup = program.warmupLength()
+      # If warming up for twice as long changes the result, the analysis has underestimated the program's memory
+      error = render.warmup_error(evaluator.getText(), global_config.rate, global_config.channels, start, end, step, global_config.frameSize,
+                                  jobs, warmup, seed = global_config.seed, assetCache = global_config.assetCache)
+      if error > WARMUP_TOLERANCE:
+        report(f"Warming up for {warmup} samples does not settle the program's state (it changes samples by up to {error:.3g}); exporting on one process.")
+        jobs, warmup = 1, 0
+
+  total = render.sample_count(start, end, step)
+
+  # Chunks already rendered by an earlier export or playback of the same program are read from the render cache (see cache.py)
+  renderCache, cacheKey = global_config.renderCache, None
+  if renderCache is not None and resumeFrom is None:
+    cacheKey = cache.program_key(evaluator.getText(), global_config.rate, global_config.channels, step, render.range_origin(start, end, step),
+                                 seed = global_config.seed, stateful = True)
+    if cacheKey is not None and jobs == 1:
+      warmup = analysis.analyze(evaluator.getText(), rate = global_config.rate).warmupLength()
+
+  # Every output is written from the same render. Long renders are written as RF64 if they outgrow a WAV file, or split
+  # into numbered parts if requested.
+  writers = [wavwriter.open_writer(path, global_config.rate, global_config.channels, format, dither = global_config.dither, frames = total,
+                                   container = global_config.container, splitSize = global_config.splitSize, seed = global_config.seed) for path in paths]
+  # A parallel render to a single WAV file is stored by the workers themselves, straight into the preallocated file
+  mapped = jobs > 1 and len(writers) == 1 and isinstance(writers[0], wavwriter.WavWriter)
+  if mapped:
+    writers = [wavwriter.MappedWavWriter(paths[0], total, global_config.rate, global_config.channels, format, dither = global_config.dither, seed = global_config.seed, container = global_config.container)]
+  writer = writers[0] if len(writers) == 1 else wavwriter.TeeWriter(writers)
+
+  checkpointing = jobs == 1 and global_config.checkpointInterval > 0 and len(writers) == 1 and isinstance(writers[0], wavwriter.WavWriter)
+  # After reading from the cache, a stateful program's state lags behind until its next warm-up, so it cannot be saved
+  checkpointing = checkpointing and not (cacheKey is not None and warmup > 0)
+  if resumeFrom is not None and not checkpointing:
+    raise ValueError("Only single-process exports to one WAV file can be resumed.")
+
+  if jobs > 1:
+    blocks = render.render_parallel(evaluator.getText(), global_config.rate, start, end, step, global_config.channels, global_config.frameSize, jobs,
+                                    minVal = minVal, maxVal = maxVal, warmup = warmup, region = writer.region() if mapped else None, seed = global_config.seed,
+                                    cache = renderCache, key = cacheKey, assetCache = global_config.assetCache)
+  else:
+    # Export with a fresh copy of the program, so its state starts empty (and does not interfere with live playback)
+    exporter = Evaluator(evaluator.getText(), rate = global_config.rate, channels = global_config.channels, audio_map = global_config.AUDIO_MAP, seed = global_config.seed,
+                         asset_cache = global_config.assetCache)
+    if resumeFrom is not None:
+      exporter.setState(resumeFrom.state)
+      writer.rng.bit_generator.state = resumeFrom.ditherState
+      writer.open(resumeAt = resumeFrom.datasize)
+      report(f"Resuming from sample {resumeFrom.index} of {total}.")
+    first = resumeFrom.index if resumeFrom is not None else 0
+    if cacheKey is not None:
+      blocks = cache.cached_render(renderCache, cacheKey, exporter.evaluate, render.range_origin(start, end, step), step, first, total, total,
+                                   global_config.channels, global_config.frameSize, minVal = minVal, maxVal = maxVal, warmup = warmup)
+    else:
+      blocks = render.render_serial(exporter.evaluate, start, end, step, global_config.channels, global_config.frameSize,
+                                    minVal = minVal, maxVal = maxVal, first = first)
 
-  with open(fullPath, 'wb') as file:
-    totalsize = int((end - start) / step)
-    file.write(get_wav_header(totalsize, global_config.rate, dtype, global_config.channels))
-    
-    j = 0
+  with writer:
+    done = resumeFrom.index if resumeFrom is not None else 0
     # Write wave file
     oldtime = time.time()
-    for chunk in npchunker(iter, global_config.frameSize, global_config.channels, dtype=np.float32):
-      chunkold = chunk
-      chunk = np.ravel(chunk)
-      assert np.may_share_memory(chunkold, chunk) # Ensures that the ravel did not make a deep copy of chunk for performance reasons
-      if dtype == float:
-        file.write(struct.pack('<%df' % len(chunk), *chunk))
-      elif dtype == int:
-        file.write(struct.pack('<%dh' % len(chunk), *(int(c*32767) for c in chunk) ) )
+    lastCheckpoint = oldtime
+    for block in blocks:
+      for msg in block.errorMessages():
+        print(msg) # Use print system
+      if not mapped:
+        writer.write(block.samples)
+      done = done + len(block)
       timenow = time.time()
+      if checkpointing and timenow > lastCheckpoint + global_config.checkpointInterval:
+        lastCheckpoint = timenow
+        try:
+          state = exporter.getState()
+        except Exception as e: # Memory classes holding objects that cannot be pickled
+          report(f"Cannot save checkpoints for this program ({type(e).__name__}: {e}).")
+          checkpointing = False
+        else:
+          writer.flush()
+          checkpoint.Checkpoint(settings, block.first + len(block), writer.datasize, state, writer.rng.bit_generator.state).save(checkpointPath)
       if timenow > oldtime+0.25:
         oldtime = timenow
-        progtext = "Writing (" + str(int(abs(i-progressStart)/(abs(end-start))*100)) + "%)..."
-        if infoPad:
-          infoPad.updateInfo(progtext)
-        else:
-          print('\r' + progtext, file=sys.stderr, end = '')
-      i = i + int(len(chunk)/global_config.channels)
-      j = j + 1
-  progtext = "Exported as " + fullPath
-  if infoPad:
-    infoPad.updateInfo("Exported as " + fullPath)
-  else:
-    print('\n' + progtext, file=sys.stderr)
-
-
-
-# Adapted from https://stackoverflow.com/a/15650213
+        progtext = "Writing (" + str(int(done / max(total, 1) * 100)) + "%)..." + (f" [{jobs} jobs]" if jobs > 1 else "")
+        report(('' if infoPad else '\r') + progtext, end = '')
+  if os.path.exists(checkpointPath):
+    os.remove(checkpointPath)
+  progtext = "Exported as " + ", ".join(writer.paths)
+  report(progtext if infoPad else '\n' + progtext)
+  if cacheKey is not None and not infoPad:
+    report(renderCache.statusText())
+
+  # Compare a parallel export against a serial render by a freshly compiled copy of the program
+  # (only the first output is compared, and only if it is a single WAV file)
+  if global_config.verifyExport and jobs > 1:
+    if not isinstance(writers[0], (wavwriter.WavWriter, wavwriter.MappedWavWriter)):
+      report("Only exports to a single WAV file can be verified.")
+      return None
+    report("Verifying " + writers[0].path + " against a serial render...")
+    reference = Evaluator(evaluator.getText(), rate = global_config.rate, channels = global_config.channels, audio_map = {}, asset_cache = global_config.assetCache)
+    blocks = render.render_serial(reference.evaluate, start, end, step, global_config.channels, global_config.frameSize, minVal = minVal, maxVal = maxVal)
+    result = render.compare_to_file(writers[0].path, writers[0].dataOffset, blocks, format)
+    report(str(result) + (" Dither accounts for differences of up to one step." if writers[0].dither and result.differing else ""))
+    return result
+
+
+
+# Parses a size in bytes with an optional K, M, G or T suffix (powers of 1024), eg. "2G", for use as an argparse type
+def parse_size(text):
+  match = re.fullmatch(r'\s*([0-9]*\.?[0-9]+)\s*([kmgt]?)i?b?\s*', text.lower())
+  if not match:
+    raise argparse.ArgumentTypeError(f'Invalid size "{text}". Use a number of bytes with an optional K, M, G or T suffix')
+  return int(float(match.group(1)) * 1024 ** " kmgt".index(match.group(2) or ' '))
+
+# Returns the header of a WAV file of totalsize frames, in float32 if dtype is float, or int16 if it is int.
+# See wavwriter.wav_header() for the other formats.
 def get_wav_header(totalsize, sample_rate, dtype, channels):
-  byte_count = (totalsize) * (4 if dtype == float else 2) * channels # 32-bit floats
-  # write the header
-  wav_file = struct.pack('<ccccIccccccccIHHIIHHccccI',
-    b'R', b'I', b'F', b'F',
-    byte_count + 44 - 8,  # header size
-    b'W', b'A', b'V', b'E', b'f', b'm', b't', b' ',
-    16,  # size of 'fmt ' header
-    3 if dtype == float else 1,  # format 3 = floating-point PCM
-    channels,  # channels
-    sample_rate,  # samples / second
-    sample_rate * (4 if dtype == float else 2),  # bytes / second
-    4 if dtype == float else 2,  # block alignment
-    32 if dtype == float else 16,  # bits / sample
-    b'd', b'a', b't', b'a', byte_count)
-  return wav_file
-  
-
-    
-    
-# A class that controls and handles interactions with menus and other UI.
-# Drive UIManager's type(ch) function with keyboard characters
-# to interact with it when needed.
-# Note that parts of it are not written in the best way of now, and also has some glaring deviations from a more parametric,
-# building-block type convention.
-class UIManager:
-  def __init__(self, shape: Box, global_config, audioClass, infoDisplay, exportDtype = int):
-    self.infoDisplay = infoDisplay
-    self.global_config = global_config
-    
-    self.settingPads = []
-    self.boxWidth = int(shape.colSize / 3)
-    
-    self.title = TitleWindow(Box(rowSize = 1, colSize = shape.colSize, rowStart = 0, colStart = 0), "Calcwave v" + version)
-    self.lock = threading.Lock()
-    
-    # Create windows and store them in the self.settingPads list.
-    
-    # Graph Button
-    graphBtn = GraphButtonMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart, colStart = shape.colStart), global_config, audioClass)
-
-    # Start range
-    startWin = StartRangeMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart+1, colStart = shape.colStart), "beg", global_config)
-    startWin.updateValue(global_config.start)
-    
-    # Progress bar
-    progressWin = ProgressBar(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart+1, colStart = shape.colStart + self.boxWidth), audioClass, global_config, self.infoDisplay)
-    
-    # End range
-    endWin = EndRangeMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart+1, colStart = shape.colStart + self.boxWidth * 2), "end", global_config)
-    endWin.updateValue(global_config.end)
-    
-    # Step value
-    stepWin = StepMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart + 2, colStart = shape.colStart + self.boxWidth * 2), "step", global_config)
-    stepWin.updateValue(global_config.step)
-    
-    # This currently takes up the width of the screen. Change the value from colSize to resize it
-    saveWin = exportButton(Box(rowSize = int(shape.rowSize/2), colSize = int(shape.colSize*(2/3)-1), rowStart = shape.rowStart+2, colStart = shape.colStart), global_config, progressWin, self.infoDisplay, exportDtype)
-
-    if curses.has_colors():
-      curses.init_pair(2, curses.COLOR_RED, -1)
-      progressWin.win.bkgd(' ', curses.color_pair(2))
-    
-    # Be sure to add your object to the settingPads list!
-    # They will be selected by the arrow keys in the order of this list.
-    self.settingPads.append(graphBtn)
-    self.settingPads.append(startWin)
-    self.settingPads.append(progressWin)
-    self.settingPads.append(endWin)
-    self.settingPads.append(saveWin)
-    self.settingPads.append(stepWin)
-    
-    self.focusedWindow = startWin
-    self.focusedWindowIndex = 0
-    self.editing = False
-      
-    self.refreshAll()
-    # End of constructor
-  
-  # Returns true if this is busy editing a widget
-  def isEditing(self):
-    return self.editing
-
-  def onFocus(self):
-    self.refreshTitleMessage()
-    self.infoDisplay.updateInfo(self.focusedWindow.onHoverEnter())
-
-  def onUnfocus(self):
-    self.focusedWindow.onHoverLeave()
-    self.focusedWindow.hideCursor()
-    self.infoDisplay.updateInfo("")
-    self.title.refresh()
+  return wavwriter.wav_header(totalsize, sample_rate, channels, wavwriter.format_for(dtype))
   
-  # Calls refresh() for the InputPads for the start and end values,
-  # and updates the title window
-  def refreshAll(self):
-    for win in self.settingPads:
-      win.refresh()
-      win.hideCursor()
-  
-  # Retrieves the ProgressBar object in the most godawful way...
-  def getProgressBar(self):
-    return self.settingPads[2]
-    
-  # Refreshes title message based on editing status
-  def refreshTitleMessage(self):
-    if self.editing:
-      displayName = self.focusedWindow.getDisplayName()
-      if displayName != "":
-          self.title.customTitle("Editing " + displayName)
-    else:
-      self.title.refresh()
-      
-    
-  # Handles typing and switching between items
-  def type(self, ch):
-    # Make it possible to cancel editing using the escape key
-    if ch == 27: # Escape key
-      if self.editing == True:
-        self.editing = False
-        #self.focusedWindow.onHoverEnter()
-        self.infoDisplay.updateInfo("Cancelled editing!")
-        self.focusedWindow.onHoverEnter()
-        self.refreshTitleMessage()
-        return
-      else: # Not editing? Interpret as shut down
-        with self.lock:
-          self.infoDisplay.updateInfo("ESC recieved. Shutting down...")
-          self.global_config.shutdown = True
-
-    # Switch between menu items
-    if self.editing == False and (ch == curses.KEY_LEFT or ch == curses.KEY_RIGHT):
-      self.focusedWindow.onHoverLeave()
-      self.focusedWindow.hideCursor()
-      if ch == curses.KEY_LEFT:
-        if self.focusedWindowIndex > 0:
-          self.focusedWindowIndex = self.focusedWindowIndex - 1
-        else:
-          self.focusedWindowIndex = len(self.settingPads) - 1
-      elif ch == curses.KEY_RIGHT:
-        if self.focusedWindowIndex < len(self.settingPads) - 1:
-          self.focusedWindowIndex = self.focusedWindowIndex + 1
-        else:
-          self.focusedWindowIndex = 0
-      self.focusedWindow = self.settingPads[self.focusedWindowIndex]
-      msg = self.focusedWindow.onHoverEnter()
-      #self.setMainWindow(self.focusedWindow)
-      self.infoDisplay.updateInfo(msg)
-      return
-      
-    #self.setMainWindow(self.focusedWindow)
-    
-    # Function macro to end editing ; TODO: Make this not horribly inline inside this function?
-    def endEdit():
-      self.editing = False
-      # Run action specified in class
-      actionMsg = self.focusedWindow.doAction()
-      self.focusedWindow.onHoverEnter()
-      self.infoDisplay.updateInfo(actionMsg)
-      self.refreshTitleMessage()
-      self.global_config.SaveTimer.notify()
-      self.global_config.updateAudio = True
-    
-    # Function macro to begin edting
-    def beginEdit():
-      self.editing = True
-      self.focusedWindow.onHoverLeave() # Item exits hover mode while editing
-      self.refreshTitleMessage()
-      tooltipMsg = self.focusedWindow.onBeginEdit()
-      self.infoDisplay.updateInfo(tooltipMsg)
-      if self.focusedWindow.isOneshot(): # If onBeginEdit() returns True, end edit immediately after.
-        endEdit()
-      self.focusedWindow.refresh()
-    
-    # Toggle editing on and off and handle highlighting (with onHoverEnter)
-    if ch == curses.KEY_ENTER:
-      if self.editing == False:
-        beginEdit()
-      else:
-        endEdit()
-      return
-      
-      
-    # Drive the type function
-    if not (ch == curses.KEY_UP or ch == curses.KEY_DOWN):
-      if self.editing == False:
-        beginEdit() # Begin editing automatically
-      self.focusedWindow.type(ch)
-    
-    
 
-
-# The display at the bottom of the screen that shows status
-# and error messages
-class InfoDisplay:
-  def __init__(self, shape: Box):
-    self.shape = shape
-  # Make info display window (rowSize, colSize, rowStart, colStart)
-    self.win = curses.newwin(shape.rowSize, shape.colSize, shape.rowStart, shape.colStart)
-    self.otherWindow = None
-    self._r, self._w = os.pipe()
-    self.shutdown = False
-    self._has_new_message = False
-    self.message_cv = threading.Condition()
-    self.lock = threading.Lock()
-
-    # Set the background and text color of the display
-    if curses.has_colors():
-      curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)
-      self.win.bkgd(' ', curses.color_pair(1))
-
-    # For now, lines written will be deleted off the screen when scrolling,
-    # until perhaps a selection / scrolling mechanism is implemented.
-    self.win.scrollok(True)
-    self.thread = threading.Thread(target=self.writeThread, args = (self._r, self.win, self.message_cv), daemon=True)
-    self.thread.start()
-    self.thread2 = threading.Thread(target=self.refreshThread, args = (self.win, self.message_cv), daemon=True)
-    self.thread2.start()
-  
-
-
-  def __del__(self):
-    self.shutdown = True
-    os.write(self._w, b"Shutting Down...")
-    #with open(self._w) as stream:
-    #  print("Shutting Down...", file = stream) # This is really to wake up the reader
-    self.thread.join()
-    os.close(self._w)
-    self._has_new_message = True
-    with self.message_cv:
-      self.message_cv.notify()
-    self.thread2.join()
     
     
-  # If you tell it what window to go back to, it will retain
-  # the cursor focus.
-  def setMainWindow(self, window):
-    self.otherWindow = window
-
-  def getWriteFD(self):
-    return self._w # Must be opened with os.fdopen(... , 'w')
-  
-  def refreshThread(self, win, message_cv):
-    while self.shutdown == False:
-      time.sleep(0.1) # Rate limiting to prevent UI lock up and improve performance
-      with message_cv:
-        message_cv.wait()
-      if self._has_new_message:
-        with self.lock:
-          self._has_new_message = False
-          with global_display_lock:
-            win.refresh()
-
-  def writeThread(self, reader, win, message_cv):
-    #win = curses.newwin(self.shape.rowSize, self.shape.colSize, self.shape.rowStart, self.shape.colStart)
-    win.scrollok(True)
-    try:
-      with os.fdopen(reader, 'r') as r:
-        while self.shutdown == False:
-          for line in r:
-            if self.shutdown: break
-            with self.lock:
-              self.win.scrollok(True)
-              for i in range(0, len(line), self.shape.colSize):
-                win.scroll(1)
-                self.win.addstr(self.shape.rowSize - 1, 0, line[max(0, i - self.shape.colSize) : -1])
-              self._has_new_message = True
-            with message_cv:
-              message_cv.notify()
-            #win.refresh()
-            
-    except Exception as e:
-      print("EXCEPTION IN INFODISPLAY WRITER: " + str(e), file = sys.stderr)
-
-    
-  
-# Updates text on the info display window
-# window is the infoDisplay window
-# otherWindow is the one you want to keep the cursor on
-  def updateInfo(self, text):
-    #maxLen = self.colSize * self.rowSize
-    #if len(text) >= maxLen:
-    #  text = text[0:maxLen-1]
-    self.win.erase()
-    #text = text + "\n"
-    #os.write(self._w, bytes(text.encode('UTF-8')))
-    #return
-    try:
-      with self.lock:
-        self.win.scrollok(False)
-        self.win.addstr(0, 0, text) # Display text
-        self.win.scrollok(True)
-    except curses.error:
-      pass # Python Curses does not provide the functions necessary to ensure the cursor is not updated beyond the width of the window (https://stackoverflow.com/a/54412404/16386050) 
-    #with global_display_lock:
-    self.win.refresh()
-    if self.otherWindow:
-      self.otherWindow.refresh()
-      
-
-
 #Thread generating and playing audio
 class AudioPlayer:
-  def __init__(self, global_config, info_update_fn = None):
+  def __init__(self, global_config, info_update_fn = None, sink = None):
     self.global_config = global_config
     self.info_update_fn = info_update_fn
     self.index = 0
     self.paused = False
+    self.resumed = threading.Event() # Set while not paused; the player waits on this instead of polling
+    self.resumed.set()
+    self.seekTo = None # Set by seek() for the player to jump to at the next chunk boundary
+    self.pendingSwap = None # (evaluator, x, generation) warmed up by hotSwap() to x (None if it gave up), for the player to crossfade to
+    self.swapGeneration = 0 # Incremented by every hotSwap(), so that older warm-ups can be abandoned
+    self.swapRequest = None # (evaluator, generation) of the latest hotSwap(), for the preroll thread to warm up next
+    self.prerollWorker = None # The thread warming up evaluators passed to hotSwap(), if one is running
+    self.swapLock = threading.Lock()
+    self.prerollTimeout = 2.0 # Seconds to spend chasing the playback position before switching to a program that is not fully warmed up
+    self.prerollSteps = 200 # The most steps (of up to four chunks each) to chase the playback position for
     self.graph = None
     self.isGraphEnabled = None
     self.is_paused_on_error = False
     #self.enableGraph()
     #self.lock = threading.Lock()
     self.nextStart = None
+    self.sink = sink # The AudioSink to play through. If None, one is created from global_config.sink when playing.
+    self.loop = True # Whether to start over from the beginning after reaching the end of the range
+    self.pauseOnError = True # Whether to pause on runtime exceptions (otherwise, log them and output 0)
+    self.telemetry = PlayerTelemetry(rate = global_config.rate) # Per-chunk DSP load, buffer fill and underrun counts
+    self.tuner = FrameSizeTuner() if global_config.autotune else None
+    self.frameSize = self.tuner.initialSize() if self.tuner else global_config.frameSize # The current chunk size
+    self.cacheKey = (None, None) # The snapshot last looked up in the render cache, and its key (None if it cannot be cached)
+    self.loopBuffer = (None, None) # The snapshot last played, and the cache.LoopBuffer recording it (None if it is not recorded)
 
   def getLock(self):
     return self.global_config.lock
@@ -959,6 +574,13 @@ class AudioPlayer:
     self.info_update_fn = info_update
 
   def pauseOnException(self, e):
+    if not self.pauseOnError:
+      msg = f"Runtime Exception at x={str(self.index)}: {type(e).__name__}: {e}"
+      if self.info_update_fn:
+        self.info_update_fn(msg)
+      else:
+        print(msg, file = sys.stderr)
+      return
     msg = f"[paused] Runtime Exception at x={str(self.index)}:\n{type(e).__name__}: {e}"
     if self.info_update_fn:
       self.info_update_fn(msg)
@@ -982,11 +604,12 @@ class AudioPlayer:
     self.isGraphEnabled = None
 
   def graphOn(self):
+    import matplotlib.pyplot as plt
     plt.ion()
     plt.close('all')
     plt.ylim([-1, 1])
-    X = list(range(self.global_config.frameSize))
-    Y = [0.0] * self.global_config.frameSize
+    X = list(range(self.frameSize))
+    Y = [0.0] * self.frameSize
     fig, ax = plt.subplots()
 
     # Create one line per channel, stored in a list
@@ -1000,6 +623,7 @@ class AudioPlayer:
 
   # TODO: Why doesn't it actually close on Mac? - this may be a bug with MPL
   def graphOff(self):
+    import matplotlib.pyplot as plt
     plt.close('all')
     self.graph = None
     #gc.collect(2)
@@ -1015,6 +639,37 @@ class AudioPlayer:
   # Runs the audio loop in the foreground
   def play(self):
     self.playerloop(self.global_config,)
+
+  # Returns the sink that is being (or was last) played through
+  def getSink(self):
+    return self.sink
+
+  def getTelemetry(self):
+    return self.telemetry
+
+  # Returns the telemetry summary, with the chunk size if it is being auto-tuned
+  def statusText(self):
+    text = self.telemetry.statusText()
+    if self.tuner is not None:
+      text += f" buf {self.frameSize}"
+    return text
+
+  # Applies a chunk size chosen by the tuner, optionally saving it into the project
+  def setFrameSize(self, frameSize):
+    self.frameSize = frameSize
+    if self.global_config.saveTunedFrameSize:
+      self.global_config.frameSize = frameSize
+      if self.global_config.SaveTimer:
+        self.global_config.SaveTimer.notify()
+    if self.graph is not None:
+      self.enableGraph() # Rebuild the graph for the new chunk size
+
+  # Writes the player's telemetry and the sink's counters as JSON to path
+  def dumpStats(self, path):
+    extra = {"frameSize": self.frameSize, "channels": self.global_config.channels}
+    if self.sink is not None:
+      extra["sink"] = {"name": self.sink.describe(), **self.sink.stats.as_dict()}
+    self.telemetry.dump(path, extra = extra)
   
   def isPausedOnException(self):
     return self.is_paused_on_error
@@ -1023,10 +678,174 @@ class AudioPlayer:
   def isPaused(self):
     return self.paused
 
-  # Set this to True to pause. Note: A lock is not used autmatically. Please manually aquire the lock for this class if needed.
+  # Set this to True to pause. Unpausing wakes the player immediately; pausing takes effect at the next chunk boundary.
   def setPaused(self, paused):
     self.paused = paused
     self.is_paused_on_error = False
+    if paused:
+      self.resumed.clear()
+    else:
+      self.resumed.set()
+
+  # Installs a newly compiled evaluator without resetting its memory classes (delay buffers, averages, etc.) to silence.
+  # A background thread renders the samples leading up to the playback position with the new evaluator, as many as
+  # its memory needs, and then the player crossfades from the old evaluator to it over one chunk. Warming up gives up after
+  # prerollTimeout seconds or prerollSteps steps, switching to the program as it is, so that the edit is always heard.
+  def hotSwap(self, evaluator):
+    with self.swapLock:
+      self.swapGeneration += 1
+      self.swapRequest = (evaluator, self.swapGeneration)
+      self.pendingSwap = None # Superseded
+      if self.prerollWorker is None: # Otherwise, the running thread picks the request up once it abandons its current one
+        self.prerollWorker = threading.Thread(target = self.prerollLoop, daemon = True)
+        self.prerollWorker.start()
+
+  # Warms up the evaluators passed to hotSwap() one at a time, skipping to the latest, so that edits in quick succession do not
+  # start a thread each
+  def prerollLoop(self):
+    while True:
+      with self.swapLock:
+        request, self.swapRequest = self.swapRequest, None
+        if request is None:
+          self.prerollWorker = None
+          return
+      self.prerollThread(*request)
+
+  # Installs the evaluator for the player to switch to at the next chunk boundary
+  def installEvaluator(self, evaluator):
+    with self.global_config.lock:
+      self.global_config.evaluator = evaluator
+      if self.global_config.SaveTimer:
+        self.global_config.SaveTimer.notify()
+    return self.global_config.publish()
+
+  # Evaluates evaluator from x towards target (exclusive), discarding the output, and returns the position reached.
+  # Stops early after "limit" samples, if given.
+  def advance(self, evaluator, x, target, step, limit = None):
+    count = 0
+    while (x < target if step > 0 else x > target) and (limit is None or count < limit):
+      evaluator.evaluate(x)
+      x = x + step
+      count += 1
+    return x
+
+  def prerollThread(self, evaluator, generation):
+    config = self.global_config
+    snapshot = config.snapshot
+    step = snapshot.step
+    try:
+      memory = analysis.analyze(evaluator.getText(), rate = config.rate).warmupLength()
+    except SyntaxError:
+      memory = None
+    maxPreroll = int(config.prerollSeconds * config.rate)
+    n = maxPreroll if memory is None else min(memory, maxPreroll)
+    if n == 0 or step == 0: # Stateless; nothing to warm up
+      if generation == self.swapGeneration:
+        self.installEvaluator(evaluator)
+      return
+
+    x = self.index - n * step
+    x = max(x, snapshot.start) if step > 0 else min(x, snapshot.end)
+    deadline = time.perf_counter() + self.prerollTimeout
+    try:
+      # Chase the playback position until within a chunk of it; the player catches up the rest at the switch.
+      # A program too slow to catch up (it shares the interpreter with the player) is switched to as it is, once the time or
+      # steps run out, with x = None so that the player does not catch it up either.
+      for _ in range(self.prerollSteps):
+        if generation != self.swapGeneration or config.shutdown:
+          return # Superseded by a newer edit
+        target = self.index
+        if (target - x) / step <= self.frameSize:
+          break
+        if time.perf_counter() > deadline:
+          x = None
+          break
+        x = self.advance(evaluator, x, target, step, limit = self.frameSize * 4)
+      else:
+        x = None
+    except Exception:
+      # Let the player run into the exception in the usual way
+      if generation == self.swapGeneration:
+        self.installEvaluator(evaluator)
+      return
+    with self.swapLock:
+      if generation == self.swapGeneration: # Not if superseded while warming up
+        self.pendingSwap = (evaluator, x, generation)
+
+  # Called by the player at a chunk boundary: catches the pending evaluator up to pos, writes one chunk crossfading from
+  # the current evaluator to it, and installs it. Returns (new snapshot, position after the crossfade).
+  def crossfadeToPending(self, sink, snapshot, pos):
+    evaluator, x, generation = self.pendingSwap
+    self.pendingSwap = None
+    if generation != self.swapGeneration:
+      return snapshot, pos
+    start, end, step, old = snapshot
+    channels = self.global_config.channels
+    try:
+      if x is not None: # Not if the warm-up gave up chasing the playback position
+        self.advance(evaluator, x, pos, step)
+    except Exception:
+      return self.installEvaluator(evaluator), pos
+
+    def render(ev):
+      it = maybeCalcIterator(pos if step > 0 else start, end if step > 0 else pos, step, ev.evaluate, minVal = -1, maxVal = 1, exceptionHandler = self.pauseOnException, repeatOnException = self.pauseOnError)
+      return np.fromiter(itertools.islice(it, self.frameSize), dtype = (np.float32, channels)), it
+
+    evalStart = time.perf_counter()
+    a, _ = render(old)
+    b, it = render(evaluator)
+    frames = min(len(a), len(b))
+    ramp = np.linspace(0, 1, frames, dtype = np.float32)[:, None]
+    mixed = a[:frames] * (1 - ramp) + b[:frames] * ramp
+    writeStart = time.perf_counter()
+    sink.write(mixed)
+    self.telemetry.recordChunk(frames, writeStart - evalStart, writeStart, realtime = sink.isRealtime())
+    pos = pos + frames * step
+    self.index = pos
+    return self.installEvaluator(evaluator), pos
+
+  # Returns an iterator over the samples of the snapshot's range from start to end, reading stateless programs from the
+  # render cache if there is one
+  def sampleIterator(self, snapshot, start, end):
+    step, evaluator = snapshot.step, snapshot.evaluator
+    buffer = self.getLoopBuffer(snapshot)
+    if buffer is not None:
+      return cache.LoopIterator(buffer, start, end, step, evaluator.evaluate, minVal = -1, maxVal = 1,
+                                exceptionHandler = self.pauseOnException, repeatOnException = self.pauseOnError)
+    renderCache = self.global_config.renderCache
+    if renderCache is not None:
+      if self.cacheKey[0] is not snapshot:
+        key = cache.program_key(evaluator.getText(), self.global_config.rate, self.global_config.channels, step,
+                                render.range_origin(snapshot.start, snapshot.end, step))
+        self.cacheKey = (snapshot, key)
+      key = self.cacheKey[1]
+      if key is not None:
+        return cache.CachedCalcIterator(renderCache, key, render.range_origin(snapshot.start, snapshot.end, step),
+                                        render.sample_count(snapshot.start, snapshot.end, step), self.global_config.channels,
+                                        start, end, step, evaluator.evaluate, minVal = -1, maxVal = 1,
+                                        exceptionHandler = self.pauseOnException, repeatOnException = self.pauseOnError)
+    return maybeCalcIterator(start, end, step, evaluator.evaluate, minVal = -1, maxVal = 1, exceptionHandler = self.pauseOnException, repeatOnException = self.pauseOnError)
+
+  # Returns the LoopBuffer to play the snapshot's range with, or None if it should not be recorded: when not looping, if the
+  # program is not repeatable, or if the range takes more than global_config.loopCacheBytes
+  def getLoopBuffer(self, snapshot):
+    played, buffer = self.loopBuffer
+    if played is snapshot or (buffer is not None and buffer.matches(snapshot)):
+      return buffer
+    buffer = None
+    count = render.sample_count(snapshot.start, snapshot.end, snapshot.step)
+    if self.loop and 0 < count * self.global_config.channels * 4 <= self.global_config.loopCacheBytes \
+       and cache.is_repeatable(snapshot.evaluator.getText(), self.global_config.rate):
+      buffer = cache.LoopBuffer(snapshot, count, self.global_config.channels)
+    self.loopBuffer = (snapshot, buffer)
+    return buffer
+
+  # Pauses, and moves the playback position to x. Playback will continue from there once unpaused.
+  def seek(self, x):
+    self.index = x
+    self.seekTo = x
+    self.paused = True # Unlike setPaused(), this keeps is_paused_on_error, so recompiling still resumes
+    self.resumed.clear()
 
   #def getAudioFunc(self):
   #  try: # Don't error-out on an empty text box
@@ -1062,58 +881,66 @@ class AudioPlayer:
 
 
   def playerloop(self, global_config): # The config is needed to dynamically change start/end
+    sink = None
     try:
-      p = pyaudio.PyAudio()
-
-      stream = p.open(format=pyaudio.paFloat32,
-                      channels = global_config.channels,
-                      rate = global_config.rate,
-                      output = True,
-                      frames_per_buffer = global_config.frameSize,
-                      output_device_index = global_config.output_device_index)
+      if self.sink is None:
+        self.sink = create_sink(global_config.sink, channels = global_config.channels, rate = global_config.rate,
+                                frameSize = self.frameSize, output_device_index = global_config.output_device_index)
+      sink = self.sink.open()
       
-      
-      frameSize = global_config.frameSize
-      start, end, step, evaluator = (0,0,0, None)
-      with global_config.lock:
-        start, end, step, evaluator = (global_config.start, global_config.end, global_config.step, global_config.evaluator)
+      if global_config.snapshot is None:
+        global_config.publish()
       graphtimer = time.time()
       while global_config.shutdown == False:
 
-        while self.paused == True:
-          paused = self.paused # Basically relaxed read
-          # Wait to become unpaused
-          time.sleep(0.2)
-          if global_config.shutdown == True:
-            self.setPaused(False)
+        if self.paused:
+          # Wait to become unpaused. The timeout only bounds how long it takes to notice a shutdown.
+          while not self.resumed.wait(0.5):
+            if global_config.shutdown == True:
+              self.setPaused(False)
+          self.telemetry.restartPlayout() # Silence while paused is not an underrun
 
         # Refresh data
-        with global_config.lock:
-          start, end, step, evaluator = (global_config.start, global_config.end, global_config.step, global_config.evaluator)
-          if self.nextStart != None:
-            if step < 0:
-              end = self.nextStart
-            else:
-              start = self.nextStart
-            self.nextStart = None
-
-        iter = maybeCalcIterator(start, end, step, evaluator.evaluate, minVal = -1, maxVal = 1, exceptionHandler = self.pauseOnException, repeatOnException = True)
-        for chunk in npchunker(iter, global_config.frameSize, global_config.channels, dtype=np.float32):
+        snapshot = global_config.snapshot
+        if self.seekTo is not None:
+          self.nextStart, self.seekTo = self.seekTo, None
+        if self.pendingSwap is not None and self.nextStart is not None:
+          snapshot, self.nextStart = self.crossfadeToPending(sink, snapshot, self.nextStart)
+        start, end, step, evaluator = snapshot
+        if self.nextStart != None:
+          if step < 0:
+            end = self.nextStart
+          else:
+            start = self.nextStart
+          self.nextStart = None
+
+        iter = self.sampleIterator(snapshot, start, end)
+        cont = False
+        realtime = sink.isRealtime()
+        evalStart = time.perf_counter()
+        frameSize = self.frameSize
+        for chunk in iter.chunks(frameSize, global_config.channels):
+          writeStart = time.perf_counter()
           chunkold = chunk
           chunk = np.ravel(chunk)
           assert np.may_share_memory(chunkold, chunk) # Ensures that the ravel did not make a deep copy of chunk for performance reasons
 
-          r = struct.pack('<%df' % len(chunk), *chunk)
-          stream.write( r )
+          sink.write(chunk)
+          self.telemetry.recordChunk(len(chunkold), writeStart - evalStart, writeStart, realtime = realtime)
           self.updateGraphState() # Have this thread manage the graph
           cont = False
           self.index = iter.curr
-          with self.getLock():
-            if global_config.updateAudio or global_config.shutdown or self.paused: # Time to read new data
-              global_config.updateAudio = False
+          if self.tuner is not None:
+            newSize = self.tuner.update(self.telemetry, frameSize)
+            if newSize != frameSize:
+              self.setFrameSize(newSize)
+              self.nextStart = iter.curr # Continue from here in chunks of the new size
               cont = True
-              self.nextStart = iter.curr # Pick up where you left off this time
               break
+          if global_config.snapshot is not snapshot or global_config.shutdown or self.paused or self.seekTo is not None or self.pendingSwap is not None: # Time to read new data
+            cont = True
+            self.nextStart = iter.curr # Pick up where you left off this time
+            break
           
           ### Update the graph
           if self.graph is not None:
@@ -1123,8 +950,8 @@ class AudioPlayer:
               ax.set_ylim(bottom=-1, top=1)
               graphtimer = timenow
               
-              xd = list(range( int(self.index), int(self.index + global_config.frameSize) ))
-              ax.set_xlim(int(self.index), int(self.index + global_config.frameSize) )
+              xd = list(range( int(self.index), int(self.index + frameSize) ))
+              ax.set_xlim(int(self.index), int(self.index + frameSize) )
 
               # Update each line with the corresponding channel data
               for i in range(global_config.channels):
@@ -1144,12 +971,16 @@ class AudioPlayer:
               if max_clip:
                 ax.plot([xd[0], xd[-1]], [1, 1], linewidth=3, color='red')
               
+              import matplotlib.pyplot as plt # (Already imported by graphOn())
               plt.draw()
               plt.pause(0.001)
     
-    
+          evalStart = time.perf_counter()
           if cont: continue
 
+        if not cont and not self.loop: # Reached the end of the range
+          break
+
     except Exception as e:
       if isinstance(e, KeyboardInterrupt) or isinstance(e, SystemExit):
         pass
@@ -1157,10 +988,8 @@ class AudioPlayer:
         global_exception = e
         raise e
     finally:
-      if stream is not None:
-        stream.stop_stream()
-        stream.close()
-      p.terminate()
+      if sink is not None:
+        sink.close()
 
         
 
@@ -1175,6 +1004,11 @@ class CalcWave:
     global_config = Config()
     self.global_config = global_config
 
+    # Set by parse_args() for options that were not given on the command line, so that the project's values are used instead
+    self.channels_is_default = False
+    self.buffer_is_default = False
+    self.rate_is_default = False
+
     # Parses command line arguments to the program
     args = self.parse_args(argv)
 
@@ -1183,6 +1017,25 @@ class CalcWave:
     self.global_config.end = args.end
     self.global_config.rate = args.rate
     self.global_config.frameSize = args.buffer
+    self.global_config.sink = args.sink
+    self.global_config.jobs = args.jobs
+    self.global_config.verifyExport = args.verify
+    self.global_config.dither = args.dither
+    self.global_config.container = args.container
+    self.global_config.splitSize = args.split
+    self.global_config.seed = args.seed
+    self.global_config.checkpointInterval = args.checkpoint_interval
+    self.global_config.resume = args.resume
+    self.global_config.loopCacheBytes = args.loop_cache
+    self.global_config.assetCache = assets.AssetCache(None if args.no_asset_cache else os.path.abspath(os.path.expanduser(args.asset_cache)),
+                                                      streamAbove = args.stream_assets_above, pageBudget = args.asset_page_cache,
+                                                      memoryBudget = args.asset_mem or None)
+    if args.cache:
+      self.global_config.renderCache = cache.RenderCache(os.path.abspath(os.path.expanduser(args.cache)), args.cache_size)
+    self.global_config.autotune = args.autotune or args.autotune_save
+    self.global_config.saveTunedFrameSize = args.autotune_save
+    self.global_config.hotswap = args.hotswap
+    self.global_config.prerollSeconds = args.preroll_max
     self.args = args
 
     # Check basic argument requirements, syntax, and path validity
@@ -1193,9 +1046,6 @@ class CalcWave:
     
     
 
-    self.channels_is_default = False
-    self.buffer_is_default = False
-    self.rate_is_default = False
     self.global_config.channels = self.args.channels
     self.global_config.frameSize = self.args.buffer
     if self.priorProjectExists:
@@ -1207,8 +1057,9 @@ class CalcWave:
   
   def _setup(self, argv):
     if self.global_config.evaluator is None:
-      self.global_config.evaluator = Evaluator(self.get_default_prog(), rate = self.global_config.rate, channels = self.global_config.channels, audio_map = self.global_config.AUDIO_MAP)
+      self.global_config.evaluator = Evaluator(self.get_default_prog(), rate = self.global_config.rate, channels = self.global_config.channels, audio_map = self.global_config.AUDIO_MAP, seed = self.global_config.seed, asset_cache = self.global_config.assetCache)
     ### There is guaranteed to be a self.global_config.evaluator past this point ###
+    self.global_config.publish()
 
   
   # Thanks to https://stackoverflow.com/a/3042378/16386050
@@ -1248,19 +1099,65 @@ class CalcWave:
                         help = "The number of audio channels to set the project with (default 1). Values for each can be set using out[channelno] = value. If specified, the value will be updated when loading an existing project.")
     parser.add_argument("--editor", type = str, default = None,
                         help = "Specify the shell executable for launching and attaching an external GUI code editor (eg. --editor 'open -e'). Note: This flag does NOT support terminal-based editors directly (eg. vim)")
-    parser.add_argument("-o", "--export", type = str, default = None, nargs = '?',
-                        help = "Generate, and export to the specified file in WAVE format.")
+    parser.add_argument("-o", "--export", type = str, default = None, action = 'append',
+                        help = "Generate, and export to the specified file. The format is chosen by the file extension (eg. .wav, .flac, .ogg; WAVE if there is none). Repeat to export several files from a single render.")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+                        help = "Number of processes to export with (0 for one per CPU core). Programs whose memory functions have unbounded state (such as intg or freq) are exported on one process.")
+    parser.add_argument("--verify", action = 'store_true',
+                        help = "After a parallel export, render the program again on one process and report any differences")
     parser.add_argument("-y", "--yes", action = 'store_true',
                         help = "Automatically confirms Y/n prompts")
     #parser.add_argument("--channels", type = int, default = 1,
     #                    help = "The number of audio channels to use")
-    parser.add_argument("--int", action="store_true", default=False, help = "By default, audio will be exported as float32 wav. Specify this to export audio as integer wav.")
+    parser.add_argument("--int", action="store_true", default=False, help = "By default, audio will be exported as float32 wav. Specify this to export audio as integer wav (the same as --format int16).")
+    parser.add_argument("--format", type = str, default = None, choices = list(wavwriter.FORMATS),
+                        help = "The sample format to export in (default float32)")
+    parser.add_argument("--dither", action = 'store_true',
+                        help = "Add triangular (TPDF) dither when exporting to an integer format")
+    parser.add_argument("--container", type = str, default = None, choices = wavwriter.CONTAINERS,
+                        help = "The file container to export to. By default, this is w64 for a .w64 file, or otherwise a WAV file that becomes RF64 if it exceeds 4 GiB")
+    parser.add_argument("--split", type = parse_size, default = 0, metavar = "SIZE",
+                        help = "Split the export into numbered files of at most SIZE bytes of audio each (eg. 2G, 700M)")
+    parser.add_argument("--seed", type = int, default = None,
+                        help = "Seed random functions such as rand(), so that every render of the program is the same")
+    parser.add_argument("--checkpoint-interval", type = float, default = 30, metavar = "SECONDS",
+                        help = "How often a single-process export saves a checkpoint next to the output file, for --resume (default 30, 0 to disable)")
+    parser.add_argument("--resume", action = 'store_true',
+                        help = "Continue an interrupted export from its last checkpoint, producing the same file as an uninterrupted export")
+    parser.add_argument("--cache", type = str, nargs = '?', const = cache.DEFAULT_DIR, default = None, metavar = "DIR",
+                        help = f"Keep rendered audio of deterministic programs in a cache directory (default {cache.DEFAULT_DIR}), so replaying or re-exporting an unchanged program reads it back instead of computing it again")
+    parser.add_argument("--cache-size", type = parse_size, default = "1G", metavar = "SIZE",
+                        help = "The most disk space the render cache may use, eg. 500M or 2G (default 1G). The least recently used audio is evicted first.")
+    parser.add_argument("--asset-cache", type = str, default = assets.DEFAULT_DIR, metavar = "DIR",
+                        help = f"Where to keep decoded copies of the audio files programs load(), so that they are memory-mapped instead of decoded again (default {assets.DEFAULT_DIR})")
+    parser.add_argument("--no-asset-cache", action = 'store_true',
+                        help = "Decode loaded audio files every time Calcwave starts, without storing them in the asset cache")
+    parser.add_argument("--stream-assets-above", type = parse_size, default = "1G", metavar = "SIZE",
+                        help = "Stream loaded audio files that would take more than SIZE decoded (and are not uncompressed WAV files, which are mapped), decoding parts of them as they are read (default 1G)")
+    parser.add_argument("--asset-page-cache", type = parse_size, default = "64M", metavar = "SIZE",
+                        help = "The most memory each streamed audio file keeps decoded (default 64M)")
+    parser.add_argument("--asset-mem", type = parse_size, default = "2G", metavar = "SIZE",
+                        help = "The most memory to keep loaded audio files in (memory-mapped ones included) once programs no longer use them; the least recently used are dropped first (default 2G, 0 for no limit)")
+    parser.add_argument("--loop-cache", type = parse_size, default = "256M", metavar = "SIZE",
+                        help = "The most memory to use recording the range during its first pass, so that later passes of a program without state or rand() are played back without evaluating it again (default 256M, 0 to disable)")
     parser.add_argument("--rate", type = int, default = 0,
                         help = "The audio baud rate to set the project with. Note: this will affect the pitch of the audio!")
     parser.add_argument("--buffer", type = int, default = 0,
                         help = "The audio buffer frame size to set the project with. This is the length of chunks of floats, not the memory it will use. If specified, the value will be updated when loading an existing project.")
     parser.add_argument("--output-device", type = int, default = -1,
                         help = "The index of the output device to use.")
+    parser.add_argument("--autotune", action = "store_true", default = False,
+                        help = "Start with a small, low-latency buffer, and grow or shrink the frame size during playback depending on the measured DSP load and underruns. --buffer is ignored while auto-tuning.")
+    parser.add_argument("--autotune-save", action = "store_true", default = False,
+                        help = "With --autotune, save the chosen frame size into the project file.")
+    parser.add_argument("--hotswap", action = "store_true", default = False,
+                        help = "When the program is edited during playback, warm up the new program's memory (delay, ema, norm, ...) in the background on the audio leading up to the playback position, and crossfade to it, instead of restarting them from silence.")
+    parser.add_argument("--preroll-max", type = float, default = 5.0,
+                        help = "With --hotswap, the most audio in seconds to render when warming up an edited program (default 5).")
+    parser.add_argument("--stats-json", type = str, default = None,
+                        help = "On exit, write the audio player's telemetry (DSP load and evaluation time percentiles, buffer fill, underruns, and sink counters) as JSON to this file.")
+    parser.add_argument("--sink", type = str, default = "pyaudio",
+                        help = "Where to play audio: pyaudio (the sound card, default), null, null:realtime, wav:PATH, raw:- (stdout), raw:PATH (file or FIFO), or raw:unix:PATH (Unix socket). Any sink other than pyaudio runs headless (without the UI), rendering the range once and exiting.")
     #parser.add_argument("--cli", default = False, action = "store_true",
     #                    help = "Use cli mode - will export generated audio to the provided file path as wav audio, without launching the curses UI")
 
@@ -1268,9 +1165,17 @@ class CalcWave:
       argv = sys.argv
     
     args = parser.parse_args(argv) #Parse arguments
+    try:
+      deviceSink = is_device_sink(args.sink)
+      args.sink = resolve_sink_spec(args.sink) # The working directory changes to the project's before playing
+    except ValueError as e:
+      parser.error(str(e))
+    if args.stats_json:
+      args.stats_json = os.path.abspath(args.stats_json)
     if args.channels == 0:
       self.channels_is_default = True
-      args.channels = pyaudio.PyAudio().get_default_output_device_info()['maxOutputChannels']
+      # Only ask the sound card for its channel count if we will be playing through it (not when exporting)
+      args.channels = default_device_channels() if deviceSink and not args.export else 1
     if args.buffer == 0:
       self.buffer_is_default = True
       args.buffer = 1024
@@ -1308,7 +1213,7 @@ class CalcWave:
       self.global_config.rate = dict['rate']
     self.global_config.SaveTimer = self
     
-    self.global_config.evaluator = Evaluator(dict['expr'], rate = self.global_config.rate, audio_map = self.global_config.AUDIO_MAP, channels = self.global_config.channels)
+    self.global_config.evaluator = Evaluator(dict['expr'], rate = self.global_config.rate, audio_map = self.global_config.AUDIO_MAP, channels = self.global_config.channels, seed = self.global_config.seed, asset_cache = self.global_config.assetCache)
     return self.global_config
   
 
@@ -1332,6 +1237,30 @@ class CalcWave:
   # Initializes an AudioPlayer (evaluator and stream player) object based on the global_config object currently configured in this class
   def create_audio_player(self):
     return AudioPlayer(self.global_config)
+
+  # The sample format to export in, from --format or --int
+  def export_format(self):
+    if self.args.format:
+      return self.args.format
+    return "int16" if self.args.int else "float32"
+
+  # Plays the range once through the configured (non-device) sink without starting the UI, then reports the sink's counters.
+  def run_headless(self):
+    audioPlayer = self.create_audio_player()
+    audioPlayer.loop = False
+    audioPlayer.pauseOnError = False # Nobody is there to unpause it
+    try:
+      audioPlayer.play()
+    finally:
+      self.global_config.shutdown = True
+    sink = audioPlayer.getSink()
+    if sink is not None:
+      print(f"{sink.describe()}: {sink.stats}", file = sys.stderr)
+    print(f"Telemetry: {audioPlayer.statusText()}", file = sys.stderr)
+    if self.global_config.renderCache is not None:
+      print(self.global_config.renderCache.statusText(), file = sys.stderr)
+    if self.args.stats_json:
+      audioPlayer.dumpStats(self.args.stats_json)
     
   # Creates a SaveTimer object using the class's current configuration, turns it on, and returns it.
   # SaveTimer also manages the loading of files, as well as saving.
@@ -1349,6 +1278,7 @@ class CalcWave:
   
   # Configures curses. Returns the curses screen object
   def init_curses(self):
+    import curses
     scr = curses.initscr()
     curses.curs_set(0) # Disable the actual cursor
     rows, cols = scr.getmaxyx()
@@ -1359,6 +1289,7 @@ class CalcWave:
     return scr
   
   def teardown_curses(self, scr):
+    import curses
     curses.curs_set(1) # Re-enable the actual cursor
     curses.echo()
     curses.nocbreak()
@@ -1367,7 +1298,9 @@ class CalcWave:
 
   # Some editor commmands, eg. vscode, do not hang until they are closed. This thread may exit immediately, or hang.
   # Under this assumption, this means that it will not be possible to detect when your editor is closed.
-  def run_external_editor(self, external_editor, internal_editor, initial_text, windowmanager: WindowManager, infoDisplay: InfoDisplay, lock, output_fd):
+  def run_external_editor(self, external_editor, internal_editor, initial_text, windowmanager, infoDisplay, lock, output_fd):
+    from calcwave.editsync import FileWatchAndSync
+    from watchdog.observers.polling import PollingObserver
     temp = tempfile.NamedTemporaryFile(suffix=".py", delete = False)
     with open(temp.name, 'w') as file:
       file.write(initial_text)
@@ -1389,10 +1322,11 @@ class CalcWave:
     # If the file.wav already exists, ask the user if they want to overwrite it, exit the program if not
     exportPath = None
     if self.args.export:
-      if os.path.exists(self.args.export):
-        if not self._confirm_input(f'\nFile "{self.args.export}" already exists. Would you like to overwrite it?'):
-          sys.exit(0)
-      exportPath = os.path.abspath(self.args.export)
+      for path in self.args.export:
+        if os.path.exists(path) and not self.args.resume:
+          if not self._confirm_input(f'\nFile "{path}" already exists. Would you like to overwrite it?'):
+            sys.exit(0)
+      exportPath = [os.path.abspath(path) for path in self.args.export]
     #print("Done")
 
     # Set the CWD to the project file directory
@@ -1406,9 +1340,15 @@ class CalcWave:
       if not self.global_config.evaluator:
         print("Error: Incorrect _setup: global_config.evaluator is not set")
         exit(1)
-      exportAudio(exportPath, self.global_config, None, None, dtype = int if self.args.int else float)
+      exportAudio(exportPath, self.global_config, None, None, dtype = self.export_format())
+      sys.exit(0)
+
+    # Sinks other than the sound card render headless
+    if not is_device_sink(self.global_config.sink):
+      self.run_headless()
       sys.exit(0)
     
+    from calcwave.tui import WindowManager, InfoDisplay, TextEditor
     saveTimer = self.create_save_timer(apath)
     audioPlayer = self.create_audio_player()
 
@@ -1427,7 +1367,7 @@ class CalcWave:
       self.global_config.output_fd = infoDisplay.getWriteFD()
 
       #Start the WindowManager thread, which handles typing and error checking
-      window = WindowManager(self.global_config, scr, self.global_config.evaluator.getText(), audioPlayer, editor, infoDisplay, exportDtype = int if self.args.int else float)
+      window = WindowManager(self.global_config, scr, self.global_config.evaluator.getText(), audioPlayer, editor, infoDisplay, exportDtype = self.export_format())
       window.setRedirectOutput(True) # Redirect all output to the InfoDisplay
       window.start()
       saveTimer.setTitleWidget(window.menu.title)
@@ -1467,6 +1407,8 @@ class CalcWave:
       self.teardown_curses(scr)
 
       self.global_config.shutdown = True
+      if self.args.stats_json:
+        audioPlayer.dumpStats(self.args.stats_json)
 
       if global_exception:
         raise global_exception
@@ -1474,6 +1416,11 @@ class CalcWave:
         raise exc
 
 def main(argv = None):
+  if argv is None:
+    argv = sys.argv
+  if len(argv) > 1 and argv[1] == "render": # "calcwave render ...": batch export (see batch.py)
+    from calcwave import batch
+    sys.exit(batch.main(argv[2:]))
   CalcWave(argv).main()
   if global_exception:
     raise global_exception
@@ -0,0 +1,111 @@
+# Checkpoints for resuming long exports.
+# While exporting, exportAudio periodically saves a sidecar file next to the output ("mix.wav.checkpoint") recording how far
+# the render has got: the index of the next sample, how many bytes of audio the output holds, the state of the program (every
+# memory class instance, including the generators of random ones, and the variables it keeps between samples), and the state
+# of the dither generator. Resuming from it truncates the output to that many bytes, restores the state, and renders on from
+# that sample, which gives the same file as an uninterrupted export. The sidecar is removed when the export finishes.
+#
+# The state is pickled, and unpickling runs code, so a checkpoint file must not be trusted just because it sits next to the
+# output. Checkpoints are signed with a key kept in the user's cache directory (KEY_PATH), and their settings and signature
+# are checked before anything in them is unpickled: a checkpoint written by anyone else cannot be resumed from.
+
+import os
+import hmac
+import json
+import pickle
+import hashlib
+
+VERSION = 2
+KEY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "calcwave", "checkpoint.key")
+
+
+# Returns the path of the checkpoint file for an output path
+def sidecar_path(path):
+  return path + ".checkpoint"
+
+# Returns this user's key for signing checkpoints, creating it (readable only by the user) if there is none
+def signing_key():
+  try:
+    with open(KEY_PATH, 'rb') as file:
+      return file.read()
+  except FileNotFoundError:
+    pass
+  os.makedirs(os.path.dirname(KEY_PATH), exist_ok = True)
+  key = os.urandom(32)
+  try:
+    fd = os.open(KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+  except FileExistsError: # Created by another process in the meantime
+    with open(KEY_PATH, 'rb') as file:
+      return file.read()
+  with os.fdopen(fd, 'wb') as file:
+    file.write(key)
+  return key
+
+def _signature(header, payload):
+  return hmac.new(signing_key(), header + b"\n" + payload, hashlib.sha256).hexdigest()
+
+
+class Checkpoint:
+  def __init__(self, settings, index = 0, datasize = 0, state = None, ditherState = None):
+    self.version = VERSION
+    self.settings = settings # The export settings the checkpoint is only valid for (see export_settings())
+    self.index = index # Index of the next sample to render
+    self.datasize = datasize # Bytes of audio data in the output up to that sample
+    self.state = state # The pickled state of the program (see Evaluator.getState())
+    self.ditherState = ditherState # The state of the WavWriter's dither generator
+    self.header, self.payload = None, None # When loaded, the JSON header, and the pickled state and dither state until unpack()
+    self.signature = None # When loaded, the signature of the header and payload
+
+  # Writes the checkpoint to path, replacing any existing one only once it is complete. The header (the version, settings and
+  # position) is JSON, so that it can be checked without unpickling the state that follows it.
+  def save(self, path):
+    header = json.dumps({"version": self.version, "settings": self.settings, "index": self.index, "datasize": self.datasize}).encode()
+    payload = pickle.dumps((self.state, self.ditherState))
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as file:
+      file.write(_signature(header, payload).encode() + b"\n" + header + b"\n" + payload)
+      file.flush()
+      os.fsync(file.fileno())
+    os.replace(tmp, path)
+
+  # Returns the reason this checkpoint cannot resume an export with the given settings, or None if it can
+  def mismatch(self, settings):
+    if self.version != VERSION:
+      return "it was written by a different version of Calcwave"
+    for key, value in settings.items():
+      if self.settings.get(key) != value:
+        return "the program has changed" if key == "program" else f'the export setting "{key}" has changed'
+    if self.payload is not None and not hmac.compare_digest(self.signature, _signature(self.header, self.payload)):
+      return f"it was not written by this user's Calcwave (its signature does not match the key in {KEY_PATH})"
+    return None
+
+  # Unpickles the state of a loaded checkpoint, once mismatch() has found nothing wrong with it
+  def unpack(self):
+    if self.payload is not None:
+      self.state, self.ditherState = pickle.loads(self.payload)
+      self.payload = None
+
+
+# Loads the header of the checkpoint at path, or returns None if there is none. Its state is only unpickled by unpack().
+# Raises ValueError if the file is not a checkpoint.
+def load(path):
+  if not os.path.exists(path):
+    return None
+  with open(path, 'rb') as file:
+    data = file.read()
+  try:
+    signature, header, payload = data.split(b"\n", 2)
+    fields = json.loads(header)
+  except ValueError:
+    raise ValueError(f"{path} is not a checkpoint of this version of Calcwave")
+  checkpoint = Checkpoint(fields.get("settings") or {}, fields.get("index", 0), fields.get("datasize", 0))
+  checkpoint.version = fields.get("version")
+  checkpoint.signature, checkpoint.header, checkpoint.payload = signature.decode(errors = "replace"), header, payload
+  return checkpoint
+
+
+# The settings that must not change between an export and its resumption
+def export_settings(text, rate, channels, start, end, step, format, container, dither, seed):
+  return {"program": hashlib.sha256(text.encode()).hexdigest(),
+          "rate": rate, "channels": channels, "start": start, "end": end, "step": step,
+          "format": format, "container": container, "dither": dither, "seed": seed}
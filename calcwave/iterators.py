@@ -20,6 +20,20 @@ class maybeCalcIterator(object):
     minc, maxc = self.min_clip, self.max_clip
     self.min_clip, self.max_clip = (False, False)
     return minc, maxc
+  # Clips v (in place) to minVal..maxVal, recording whether it clipped
+  def clip(self, v):
+    # After trying multiple options, not involving numpy seemed to be the fastest?
+    for i in range(len(v)):
+      if self.minVal and v[i] < self.minVal:
+        self.min_clip = True
+        v[i] = self.minVal
+      elif self.maxVal and v[i] > self.maxVal:
+        self.max_clip = True
+        v[i] = self.maxVal
+    return v
+  # Yields the samples in numpy arrays of n frames (see npchunker)
+  def chunks(self, n, channels):
+    return npchunker(self, n, channels, dtype = np.float32)
   def __next__(self):
     if(self.curr > self.end or self.curr < self.start):
       raise StopIteration()
@@ -36,15 +50,7 @@ class maybeCalcIterator(object):
       #self.max_clip = len(clip_high) >0
       #v[clip_high] = self.maxVal
       
-      # Clip
-      # After trying multiple options, not involving numpy seemed to be the fastest?
-      for i in range(len(v)):
-        if self.minVal and v[i] < self.minVal:
-          self.min_clip = True
-          v[i] = self.minVal
-        elif self.maxVal and v[i] > self.maxVal:
-          self.max_clip = True
-          v[i] = self.maxVal
+      v = self.clip(v)
 
       #if self.minVal and v < self.minVal:
       #  self.min_clip = True
@@ -12,6 +12,73 @@ crossfade = lambda c, a, b: a * (0.5 - c * 0.5) + b * (0.5 + c * 0.5)
 avg = lambda t: sum(t) / len(t)
 
 
+
+### Reading loaded audio ###
+# play(audio, pos) reads the audio a program load()ed (by its alias, eg. play(splinket, x * 1.5)) at a fractional sample
+# position, interpolating between the samples around it instead of truncating pos, which aliases. With wrap = True, positions
+# wrap around the audio's length; otherwise, positions outside it read as silence.
+# pos may also be a list or array of positions, which are all read at once: play(splinket, [x, x - 300, x - 700]) returns an
+# array of shape (3, channels), gathering every sample it needs with a single index into the audio.
+
+# The offsets, from the sample at or before a position, of the samples each interpolation reads
+_PLAY_TAPS = {"linear": np.array([0, 1]), "cubic": np.array([-1, 0, 1, 2])}
+
+# The weights of the samples at _PLAY_TAPS for a fraction t of the way from the sample before a position to the next.
+# Cubic interpolation is a Catmull-Rom spline, which passes through the samples.
+def _play_weights(t, interp):
+  if interp == "linear":
+    return (1 - t, t)
+  t2 = t * t
+  t3 = t2 * t
+  return ((-t3 + 2 * t2 - t) * 0.5, (3 * t3 - 5 * t2 + 2) * 0.5, (-3 * t3 + 4 * t2 + t) * 0.5, (t3 - t2) * 0.5)
+
+def play(audio, pos, interp = "linear", wrap = True):
+  if interp not in _PLAY_TAPS:
+    raise ValueError(f'play(): interp must be one of {", ".join(map(repr, _PLAY_TAPS))}, not {interp!r}')
+  if hasattr(pos, "__len__"):
+    return _play_block(audio, pos, interp, wrap)
+  n = len(audio)
+  if wrap:
+    pos = pos % n
+  i = math.floor(pos)
+  t = pos - i
+  if interp == "linear":
+    a = _play_sample(audio, i, n, wrap)
+    if t == 0:
+      return a
+    return a + (_play_sample(audio, i + 1, n, wrap) - a) * t
+  w = _play_weights(t, interp)
+  return (_play_sample(audio, i - 1, n, wrap) * w[0] + _play_sample(audio, i, n, wrap) * w[1]
+          + _play_sample(audio, i + 1, n, wrap) * w[2] + _play_sample(audio, i + 2, n, wrap) * w[3])
+
+# Returns sample i of the audio, wrapping i around its length n, or silence outside it
+def _play_sample(audio, i, n, wrap):
+  if wrap:
+    return audio[i % n]
+  if 0 <= i < n:
+    return audio[i]
+  return np.zeros(audio.shape[1:], dtype = np.float32)
+
+# play() for an array of positions, returning an array of their samples
+def _play_block(audio, pos, interp, wrap):
+  n = len(audio)
+  pos = np.asarray(pos, dtype = np.float64)
+  if wrap:
+    pos = np.mod(pos, n)
+  i = np.floor(pos)
+  t = (pos - i).astype(np.float32)
+  index = i.astype(np.intp)[..., None] + _PLAY_TAPS[interp] # Shape pos.shape + (taps,)
+  if wrap:
+    samples = audio[(index % n).ravel()]
+  else:
+    samples = audio[np.clip(index, 0, n - 1).ravel()]
+    samples[((index < 0) | (index >= n)).ravel()] = 0
+  samples = samples.reshape(index.shape + tuple(audio.shape[1:]))
+  weights = np.stack(_play_weights(t, interp), axis = -1)
+  weights = weights.reshape(weights.shape + (1,) * (samples.ndim - weights.ndim))
+  return (samples * weights).sum(axis = pos.ndim, dtype = np.float32)
+
+
 # Base class for memory classes
 class MemoryClass:
   # Any variables added for all MemoryClasses when compiled with the MemoryClassCompiler will be passed here as a dictionary
@@ -29,6 +96,12 @@ class MemoryClass:
   def __callname__():
     "MemoryClass"
 
+  # Given the arguments a call site passes to "evaluate", returns how many past samples the result depends on,
+  # or None if the state never forgets (or this cannot be determined). This is used to warm up fresh instances.
+  @staticmethod
+  def __memorylength__(*args, **kwargs):
+    return None
+
 # A tone generator of a constant frequency. The step parameter will not affect this.
 class Frequency(MemoryClass):
   def __init__(self, vars: dict):
@@ -48,22 +121,29 @@ class Frequency(MemoryClass):
     return "freq"
 
 
-# A memory class that returns a new random number every n steps
+# A memory class that returns a new random number every n steps.
+# Each call site has its own generator, seeded from the Evaluator's seed (if any) and the call's position in the program.
 class Random(MemoryClass):
   def __init__(self, vars: dict):
+    seed = vars.get("seed")
+    self.rng = random.Random(None if seed is None else f"{seed}:rand:{vars.get('instance', 0)}")
     self.steps = 1
-    self.num = random.random() * 2 - 1
+    self.num = self.rng.random() * 2 - 1
   
   def evaluate(self, n = 1):
     self.steps = self.steps + 1
     if self.steps > n:
       self.steps = 1
-      self.num = random.random() * 2 - 1
+      self.num = self.rng.random() * 2 - 1
     return self.num
   
   @staticmethod
   def __callname__():
     return "rand"
+
+  @staticmethod
+  def __memorylength__(n = 1):
+    return int(n)
   
 class Integral(MemoryClass):
   # __init__ must take no arguments
@@ -110,6 +190,10 @@ class Derivative(MemoryClass):
   @staticmethod
   def __callname__():
     return "derv"
+
+  @staticmethod
+  def __memorylength__(y = None, clip = True):
+    return 1
   
 
 
@@ -128,6 +212,15 @@ class ExponentialMovingAverage(MemoryClass):
   def __callname__():
     return "ema"
 
+  # The average never forgets entirely, but the weight of a sample k steps back is (1-v)^k.
+  # Returns the number of steps after which that weight falls below 1e-4.
+  @staticmethod
+  def __memorylength__(y = None, n = 3):
+    v = 2/(n-1)
+    if v >= 1 or v <= 0:
+      return 1
+    return int(math.ceil(math.log(1e-4) / math.log(1-v)))
+
 # A cache to avoid recomputing values that are known to not change.
 # This can greatly improve performance for user-defined values that would be
 # Recomputed at every iteration. This will update at every recompilation.
@@ -148,6 +241,10 @@ class Constant(MemoryClass):
   def __callname__():
     return "const"
 
+  @staticmethod
+  def __memorylength__(y = None):
+    return 0
+
 # A memistic convolution over the last number of values
 class Convolution(MemoryClass):
   def __init__(self, vars: dict):
@@ -171,6 +268,10 @@ class Convolution(MemoryClass):
   def __callname__():
     return "conv"
 
+  @staticmethod
+  def __memorylength__(y = None, filter = ()):
+    return len(filter)
+
 # Question: is it possible to get the start, end, and step attributes from a constructed range() object?
 # Answer: Yes.
 # Question: How?
@@ -198,6 +299,10 @@ class History(MemoryClass):
   @staticmethod
   def __callname__():
     return "history"
+
+  @staticmethod
+  def __memorylength__(y = None, length = 0):
+    return int(length)
     
 class Delay:
   def __init__(self, vars: dict):
@@ -245,6 +350,12 @@ class Delay:
   def __callname__():
     return "delay"
 
+  @staticmethod
+  def __memorylength__(y = None, lengths = 0, volumes = [1]):
+    if not hasattr(lengths, "__len__"):
+      lengths = [lengths]
+    return int(max(lengths)) + 1
+
 # Normalizes the wave for the specific history length n in (generally) O(1) time and O(n) memory
 # TODO: Even with optimizations, this is a bit compute-intensive in Python.
 #       It might be a good idea to compile this into a C module
@@ -312,6 +423,12 @@ class Normalize:
   def __callname__():
     return "norm"
 
+  # Unbounded: the moving sum is never subtracted from, and the minimum and maximum only start at 0 and are recomputed every
+  # "length" samples, so the output depends on every sample since the start
+  @staticmethod
+  def __memorylength__(y = None, length = 0):
+    return None
+
 
 # During compilation, a list of classes marked as having memistic capabilities.
 # Any calls to functions mapped within their getFunctionTable() will be mapped to a unique
@@ -326,4 +443,5 @@ def getFunctionTable():
           "sqr": sqr,
           "avg": avg,
           "clamp": clamp,
-          "crossfade": crossfade}
\ No newline at end of file
+          "crossfade": crossfade,
+          "play": play}
\ No newline at end of file
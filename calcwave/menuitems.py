@@ -6,9 +6,31 @@ import numpy as np
 import traceback
 import os
 import curses
+from calcwave import wavwriter
 
 
-# A button to export audio as a WAV file, assuming you have the "wave" module installed.
+# Parses the text of an export button: one or more file names, separated by commas. Names without a known audio file
+# extension are exported as WAV. Returns the absolute paths, and an error message (or None) for the first invalid one.
+def resolve_export_paths(text):
+  paths = []
+  for name in text.split(','):
+    name = os.path.expanduser(name.strip())
+    if name == '':
+      continue
+    if not name.lower().endswith(wavwriter.WAV_EXTENSIONS) and wavwriter.soundfile_format(name) is None:
+      name = name + ".wav"
+    fullPath = os.path.abspath(name)
+    parDir = os.path.dirname(fullPath)
+    try:
+      if not os.path.isdir(parDir):
+        return paths, "Invalid directory \"" + parDir + "\""
+    except PermissionError:
+      return paths, "Permission denied: " + parDir
+    paths.append(fullPath)
+  return paths, None
+
+
+# A button to export audio as WAV, FLAC, Ogg or any other file type soundfile can write, to one or more files at once.
 class ExportButton(LineEditor, BasicMenuItem):
   def __init__(self, shape: Box, global_config, progressBar, infoDisplay, dtype):
     super().__init__(shape)
@@ -32,7 +54,7 @@ class ExportButton(LineEditor, BasicMenuItem):
     
   def onBeginEdit(self):
       self.setText("") # Clear and allow you to enter the filename
-      return "Please enter filename, and press enter to save. Any existing file will be overwritten."
+      return "Please enter filenames (separated by commas, eg. mix.wav, mix.flac), and press enter to save. Any existing file will be overwritten."
   
   def onHoverEnter(self):
     self.hideCursor()
@@ -47,62 +69,37 @@ class ExportButton(LineEditor, BasicMenuItem):
   # Override type, make it check filenames live
   def type(self, ch):
     super().type(ch)
-    name = self.getText()
-    name = os.path.expanduser(name)
-    if name == '':
+    if self.getText().strip() == '':
       self.infoPad.updateInfo("Please enter filename, and press enter to save. Any existing file will be overwritten.")
       return
-    
+
     # Update the infoDisplay
-    fullPath = ''
-    if '/' in name:
-      # Use absolute specified path
-      fullPath = name + ".wav"
-      parDir = '/'.join(fullPath.split('/')[0:-1])
-      try:
-        if parDir != '' and not os.path.isdir(parDir):
-          self.infoPad.updateInfo("Invalid directory \"" + parDir + "\"")
-          return
-      except PermissionError:
-        self.infoPad.updateInfo("Permission denied: " + parDir)
+    paths, error = resolve_export_paths(self.getText())
+    if error:
+      self.infoPad.updateInfo(error)
+    elif any(os.path.isfile(path) for path in paths):
+      self.infoPad.updateInfo("Will overwrite " + ", ".join(path for path in paths if os.path.isfile(path)))
     else:
-      path = os.getcwd()
-      fullPath = path + "/" + name + ".wav"
-    
-      
-    if os.path.isfile(fullPath):
-      self.infoPad.updateInfo("Will overwrite " + fullPath)
-    else:
-      self.infoPad.updateInfo("Will export as " + fullPath)
+      self.infoPad.updateInfo("Will export as " + ", ".join(paths))
   
   # Where it actually saves the file
   def doAction(self):
-    name = self.getText()
-    name = os.path.expanduser(name)
-    actionMessage = "File saved in same directory!"
-    if name == '':
-      self.setText("Export Audio")
-      return "Cancelled."
+    text = self.getText()
     self.setText("Export Audio")
-    path = ''
-    if '/' in name:
-      fullPath = name + ".wav"
-      parDir = '/'.join(fullPath.split('/')[0:-1]) # Remove ending '/'
-      if not os.path.isdir(parDir):
-        actionMsg = "Cannot export audio: invalid path \"" + fullPath + "\""
-        self.setText("Export Audio")
-        return
-    else:
-      path = os.getcwd()
-      fullPath = path + "/" + name + ".wav"
-    actionMsg = "Saving file as " + fullPath
+    if text.strip() == '':
+      return "Cancelled."
+    paths, error = resolve_export_paths(text)
+    if error:
+      return "Cannot export audio: " + error
+    actionMsg = "Saving file as " + ", ".join(paths)
     
     #with self.lock:
     if(self.infoPad):
       self.infoPad.updateInfo("Writing...")
     
     # Do in a separate thread?
-    thread = threading.Thread(target=exportAudio, args=(fullPath, self.global_config, self.progressBar, self.infoPad, self.dtype), daemon = True)
+    from calcwave.calcwave import exportAudio
+    thread = threading.Thread(target=exportAudio, args=(paths, self.global_config, self.progressBar, self.infoPad, self.dtype), daemon = True)
     thread.start()
     #exportAudio(fullPath)
     return actionMsg
@@ -273,25 +270,21 @@ class ProgressBar(BasicMenuItem):
       self.toggleVisibility()
       return
 
-    with self.audioClass.getLock():
-      index = self.audioClass.index
-      if ch == curses.KEY_LEFT or ch == curses.KEY_SLEFT:
-        index = index - blockWidth
-      elif ch == curses.KEY_RIGHT or ch == curses.KEY_SRIGHT:
-        index = index + blockWidth
-      if index < self.global_config.start: # Limit between acceptable range
-        index = self.global_config.start
-      elif index > self.global_config.end:
-        index = self.global_config.end
-      # Write back to audio player
-      self.audioClass.index = index
-      self.audioClass.nextStart = index
-      self.audioClass.paused = True
-      self.global_config.updateAudio = True
-      if self.audioClass.isPaused():
-        self.debugIndex(index) # Show debugging info about current index
-      if self.progressBarEnabled == True:
-        self.updateIndex(index, self.global_config.start, self.global_config.end)
+    index = self.audioClass.index
+    if ch == curses.KEY_LEFT or ch == curses.KEY_SLEFT:
+      index = index - blockWidth
+    elif ch == curses.KEY_RIGHT or ch == curses.KEY_SRIGHT:
+      index = index + blockWidth
+    if index < self.global_config.start: # Limit between acceptable range
+      index = self.global_config.start
+    elif index > self.global_config.end:
+      index = self.global_config.end
+    # Write back to audio player
+    self.audioClass.seek(index)
+    if self.audioClass.isPaused():
+      self.debugIndex(index) # Show debugging info about current index
+    if self.progressBarEnabled == True:
+      self.updateIndex(index, self.global_config.start, self.global_config.end)
     
   
   # Defines action to do when activated
@@ -467,12 +460,13 @@ class TitleWindow:
     self.message = ""
     self.titlestr = titlestr
     self.perm_messages = []
+    self.status = "" # Right-aligned status text, such as the DSP load
     
   # Draws the title
   def refresh(self):
     self.win.clear()
     permmsg = ('' if self.perm_messages == [] else ' ') + ' '.join(self.perm_messages)
-    self.win.addstr(self.titlestr + self.message + permmsg)
+    self.win.addstr(self.withStatus(self.titlestr + self.message + permmsg))
     self.win.chgat(0, 0, self.shape.colSize, curses.A_REVERSE)
     #with global_display_lock:
     curses.use_default_colors()
@@ -494,4 +488,15 @@ class TitleWindow:
   
   # Adds a permanent message to the title
   def addPermanentMessage(self, text):
-    self.perm_messages.append(text)
\ No newline at end of file
+    self.perm_messages.append(text)
+
+  # Sets the status shown at the right end of the title. Call refresh() to display it.
+  def setStatus(self, text):
+    self.status = text
+
+  # Pads text such that the status lines up against the right edge, if it fits
+  def withStatus(self, text):
+    width = self.shape.colSize - 1 # Writing to the last cell of a curses window raises an error
+    if self.status == "" or len(text) + len(self.status) + 1 > width:
+      return text[:width]
+    return text + ' ' * (width - len(text) - len(self.status)) + self.status
\ No newline at end of file
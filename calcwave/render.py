@@ -0,0 +1,254 @@
+# Offline rendering of a program over its x range, for exporting.
+# Samples are addressed by their index in the range (x = origin + index * step) rather than by accumulating x, so that any
+# part of the range can be rendered on its own, and the result is the same whether it is rendered in one pass or in
+# segments by several processes.
+
+import os
+import math
+import itertools
+import concurrent.futures
+import numpy as np
+
+MAX_ERRORS_PER_BLOCK = 10 # Exception messages kept per rendered block; the rest are only counted
+
+
+# Returns the number of samples in the range start..end (inclusive) at the given step
+def sample_count(start, end, step):
+  if step == 0:
+    raise ValueError("Step value cannot be zero!")
+  if end < start:
+    return 0
+  return int(math.floor((end - start) / abs(step) + 1e-9)) + 1
+
+# Returns the x value that sample index 0 corresponds to. Negative steps play the range backwards from end.
+def range_origin(start, end, step):
+  return end if step < 0 else start
+
+
+# The result of rendering part of the range
+class Block:
+  def __init__(self, first, samples, errors, errorCount, frames = None):
+    self.first = first # Index of the first sample
+    self.samples = samples # float32 array of shape (frames, channels), or None if the samples were written elsewhere
+    self.errors = errors # Up to MAX_ERRORS_PER_BLOCK messages of exceptions raised while evaluating
+    self.errorCount = errorCount # Total number of exceptions raised
+    self.frames = len(samples) if frames is None else frames
+
+  def __len__(self):
+    return self.frames
+
+  # Messages for the exceptions raised, summarizing any beyond those kept
+  def errorMessages(self):
+    msgs = list(self.errors)
+    if self.errorCount > len(self.errors):
+      msgs.append(f"... and {self.errorCount - len(self.errors)} more exceptions")
+    return msgs
+
+
+# Evaluates "count" samples starting at sample index "first", clipping to minVal..maxVal if they are given.
+# Samples whose evaluation raises an exception are 0.
+def render_block(evaluate, origin, step, first, count, channels, minVal = None, maxVal = None):
+  out = np.zeros((count, channels), dtype = np.float32)
+  errors = []
+  errorCount = 0
+  for i in range(count):
+    x = origin + (first + i) * step
+    try:
+      out[i] = evaluate(x)
+    except Exception as e:
+      errorCount += 1
+      if len(errors) < MAX_ERRORS_PER_BLOCK:
+        errors.append(f"Exception at x={str(x)}: {type(e).__name__ }: {str(e)}")
+  if minVal is not None or maxVal is not None:
+    np.clip(out, minVal, maxVal, out = out)
+  return Block(first, out, errors, errorCount)
+
+
+# Renders the range in this process with the given evaluate function, yielding Blocks of frameSize samples in order.
+# Rendering starts from sample index "first", for resuming a render whose state has been restored.
+def render_serial(evaluate, start, end, step, channels, frameSize, minVal = None, maxVal = None, first = 0):
+  count = sample_count(start, end, step)
+  origin = range_origin(start, end, step)
+  for first in range(first, count, frameSize):
+    yield render_block(evaluate, origin, step, first, min(frameSize, count - first), channels, minVal, maxVal)
+
+
+### Parallel rendering ###
+# Stateless programs are compiled once per worker process, which then renders whole segments of the range.
+# Programs whose memory classes only remember a bounded number of samples (see analysis.ProgramAnalysis.warmupLength()) are
+# compiled afresh for every segment, and warmed up by evaluating the "warmup" samples before the segment first, so that
+# their state at the start of the segment matches what it would be in a serial render.
+
+_worker = {}
+
+def _init_worker(text, rate, channels, cwd, seed = None, cache = None, assetCache = None):
+  from calcwave.calcwave import Evaluator
+  os.chdir(cwd) # Relative paths in load() are relative to the project
+  _worker["args"] = (text, rate, channels, seed)
+  _worker["assets"] = assetCache # An assets.AssetCache; the decoded files in its directory are memory-mapped by every worker
+  if cache is not None: # (directory, maxBytes, key, count): render through a cache.RenderCache shared with the parent
+    from calcwave.cache import RenderCache
+    directory, maxBytes, key, count = cache
+    _worker["cache"] = (RenderCache(directory, maxBytes), key, count)
+  _worker["audio_map"] = {} # Loaded audio is shared between the segments rendered by this worker
+  _worker["evaluator"] = Evaluator(text, rate = rate, channels = channels, audio_map = _worker["audio_map"], seed = seed, asset_cache = _worker["assets"])
+
+def _render_segment(origin, step, first, count, channels, minVal, maxVal, warmup = 0):
+  evaluator = _worker["evaluator"]
+  if warmup > 0:
+    from calcwave.calcwave import Evaluator
+    text, rate, channels, seed = _worker["args"]
+    evaluator = Evaluator(text, rate = rate, channels = channels, audio_map = _worker["audio_map"], seed = seed, asset_cache = _worker["assets"])
+  if "cache" in _worker:
+    from calcwave.cache import cached_render
+    cache, key, total = _worker["cache"]
+    # The program is only warmed up if part of the segment is not cached
+    blocks = list(cached_render(cache, key, evaluator.evaluate, origin, step, first, first + count, total, channels, count, minVal, maxVal, warmup, stale = first > 0))
+    samples = np.concatenate([block.samples for block in blocks])
+    errors = [msg for block in blocks for msg in block.errors][:MAX_ERRORS_PER_BLOCK]
+    return Block(first, samples, errors, sum(block.errorCount for block in blocks))
+  if warmup > 0:
+    # A serial render starts from an empty state at index 0, so there is nothing to warm up before it
+    for i in range(max(0, first - warmup), first):
+      try:
+        evaluator.evaluate(origin + i * step)
+      except Exception:
+        pass
+  return render_block(evaluator.evaluate, origin, step, first, count, channels, minVal, maxVal)
+
+# Renders a segment and stores it straight into a mapped file (see wavwriter.MappedRegion), returning a Block without samples
+def _render_segment_into(region, origin, step, first, count, channels, minVal, maxVal, warmup = 0):
+  from calcwave import wavwriter
+  block = _render_segment(origin, step, first, count, channels, minVal, maxVal, warmup)
+  maps = _worker.setdefault("maps", {})
+  if region not in maps:
+    maps[region] = wavwriter.open_region(region)
+  wavwriter.write_into(maps[region], region, block.first, block.samples)
+  return Block(block.first, None, block.errors, block.errorCount, frames = len(block))
+
+
+# Checks that warming a program up for "warmup" samples settles its state, as a guard against the analysis underestimating
+# its memory: renders up to frameSize samples at the start of the second segment (see segment_length()) after warming up
+# for warmup samples, and again after warming up for twice as many, and returns the largest difference between them.
+def warmup_error(text, rate, channels, start, end, step, frameSize, jobs, warmup, seed = None, assetCache = None):
+  from calcwave.calcwave import Evaluator
+  count = sample_count(start, end, step)
+  origin = range_origin(start, end, step)
+  first = segment_length(count, jobs, frameSize, rate, warmup)
+  if warmup <= 0 or first >= count:
+    return 0.0
+  renders = []
+  for n in (warmup, warmup * 2):
+    evaluator = Evaluator(text, rate = rate, channels = channels, audio_map = {}, seed = seed, asset_cache = assetCache)
+    for i in range(max(0, first - n), first):
+      try:
+        evaluator.evaluate(origin + i * step)
+      except Exception:
+        pass
+    renders.append(render_block(evaluator.evaluate, origin, step, first, min(frameSize, count - first), channels).samples)
+  return float(np.max(np.abs(renders[0] - renders[1])))
+
+# Returns the number of worker processes to use for a --jobs value (0 means one per CPU)
+def resolve_jobs(jobs):
+  if jobs is None or jobs <= 0:
+    return os.cpu_count() or 1
+  return jobs
+
+# Chooses a segment length: enough segments to keep every worker busy and balance uneven costs, but not so
+# short that the per-segment overhead (including any warm-up) shows, rounded to whole chunks (of "align" samples, if given).
+def segment_length(count, jobs, frameSize, rate, warmup = 0, align = None):
+  length = math.ceil(count / (jobs * 8))
+  length = max(frameSize, warmup * 4, min(length, rate * 30))
+  align = align or frameSize
+  return math.ceil(length / align) * align
+
+# Renders the range in segments across a pool of "jobs" processes, yielding the segments' Blocks in order.
+# For a stateful program, warmup must be at least its memory (see analysis.ProgramAnalysis.warmupLength()); with warmup = 0, the program must be stateless.
+# If region (a wavwriter.MappedRegion) is given, the workers store their segments in it themselves, and the Blocks, which
+# then carry no samples, are yielded in the order they finish.
+# If cache (a cache.RenderCache) and its key are given, the workers read and store the segments' chunks in it.
+# The workers load audio files through assetCache (an assets.AssetCache), if given. The files the program loads are loaded
+# into it first, and those it does not store on disk are placed in shared memory for the workers (see AssetCache.share()).
+def render_parallel(text, rate, start, end, step, channels, frameSize, jobs, minVal = None, maxVal = None, warmup = 0, region = None, seed = None, cache = None, key = None, assetCache = None):
+  count = sample_count(start, end, step)
+  origin = range_origin(start, end, step)
+  cacheArgs = None
+  align = None
+  if cache is not None and key is not None:
+    from calcwave.cache import CHUNK_FRAMES
+    cacheArgs = (cache.directory, cache.maxBytes, key, count)
+    align = CHUNK_FRAMES # Segments made of whole chunks can store all of them
+  length = segment_length(count, jobs, frameSize, rate, warmup, align)
+  segments = iter(range(0, count, length))
+
+  def submit(pool, first):
+    args = (origin, step, first, min(length, count - first), channels, minVal, maxVal, warmup)
+    if region is not None:
+      return pool.submit(_render_segment_into, region, *args)
+    return pool.submit(_render_segment, *args)
+
+  shared = []
+  if assetCache is not None:
+    from calcwave import analysis
+    shared = assetCache.share(analysis.loaded_paths(text) or [], rate)
+  try:
+    with concurrent.futures.ProcessPoolExecutor(max_workers = jobs, initializer = _init_worker, initargs = (text, rate, channels, os.getcwd(), seed, cacheArgs, assetCache)) as pool:
+      # Keep a bounded window of segments in flight, so memory use does not grow with the length of the render
+      pending = [submit(pool, first) for first in itertools.islice(segments, jobs * 2)]
+      while pending:
+        if region is None:
+          done = [pending.pop(0)]
+        else:
+          done, _ = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+          pending = [future for future in pending if future not in done]
+        for future in done:
+          block = future.result()
+          first = next(segments, None)
+          if first is not None:
+            pending.append(submit(pool, first))
+          yield block
+  finally:
+    if shared:
+      assetCache.unshare(shared)
+
+
+# The result of comparing an exported file against a reference render
+class VerifyResult:
+  def __init__(self):
+    self.samples = 0 # Samples compared (frames * channels)
+    self.differing = 0 # Samples that differ at all
+    self.maxDiff = 0.0 # Largest absolute difference, in the -1..1 scale
+    self.firstIndex = None # Sample index of the first differing frame
+
+  def matches(self, tolerance = 0.0):
+    return self.maxDiff <= tolerance
+
+  def __str__(self):
+    if self.differing == 0:
+      return f"Verified: all {self.samples} samples are identical to a serial render."
+    return f"{self.differing} of {self.samples} samples differ from a serial render (max difference {self.maxDiff:.3g}, first at sample {self.firstIndex})."
+
+
+# Compares the data chunk of the file at path (starting at byte dataOffset, in the given wavwriter format) with the given
+# reference Blocks, in order
+def compare_to_file(path, dataOffset, blocks, format = "float32"):
+  from calcwave import wavwriter
+  result = VerifyResult()
+  with open(path, 'rb') as file:
+    file.seek(dataOffset)
+    for block in blocks:
+      # Quantize the reference the same way the export was, so only real differences are counted
+      expected = wavwriter.encode(block.samples, format)
+      actual = wavwriter.decode(file.read(expected.nbytes), format)
+      expected = wavwriter.decode(expected.tobytes(), format)
+      if len(actual) < len(expected): # The file is short; count the missing samples as differing
+        actual = np.concatenate([actual, np.zeros(len(expected) - len(actual))])
+      diff = np.abs(actual - expected)
+      nonzero = np.flatnonzero(diff)
+      if len(nonzero) > 0:
+        if result.firstIndex is None:
+          result.firstIndex = block.first + int(nonzero[0]) // block.samples.shape[1]
+        result.differing += len(nonzero)
+        result.maxDiff = max(result.maxDiff, float(diff.max()))
+      result.samples += len(expected)
+  return result
@@ -0,0 +1,316 @@
+# Audio sinks: the places rendered audio chunks can go.
+# Every sink accepts float32 chunks of shape (frames, channels) (or their flattened, interleaved form) through write(),
+# so the same rendering pipeline can drive live playback, headless rendering, piping into other tools, and benchmarks.
+# Select one on the command line with --sink (see parse_sink_spec() for the accepted forms).
+
+import os
+import sys
+import stat
+import time
+import socket
+import numpy as np
+
+
+# Throughput and latency counters kept by every sink
+class SinkStats:
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.writes = 0 # Number of write() calls
+    self.frames = 0 # Number of frames (one sample per channel) written
+    self.bytes = 0 # Number of bytes handed to the backend
+    self.busy = 0.0 # Total seconds spent blocked inside write()
+    self.max_latency = 0.0 # Longest single write() in seconds
+    self.last_latency = 0.0
+    self.opened_at = time.perf_counter()
+
+  # Records one write of the given size that took "latency" seconds
+  def record(self, frames, nbytes, latency):
+    self.writes += 1
+    self.frames += frames
+    self.bytes += nbytes
+    self.busy += latency
+    self.last_latency = latency
+    if latency > self.max_latency:
+      self.max_latency = latency
+
+  def elapsed(self):
+    return time.perf_counter() - self.opened_at
+
+  # Frames written per second of wall time since the sink was opened
+  def throughput(self):
+    elapsed = self.elapsed()
+    return self.frames / elapsed if elapsed > 0 else 0.0
+
+  def mean_latency(self):
+    return self.busy / self.writes if self.writes else 0.0
+
+  def as_dict(self):
+    return {"writes": self.writes,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "elapsed": self.elapsed(),
+            "throughput": self.throughput(),
+            "mean_latency": self.mean_latency(),
+            "max_latency": self.max_latency}
+
+  def __str__(self):
+    return f"{self.frames} frames in {self.elapsed():.2f}s ({self.throughput():.0f} frames/s), write latency mean {self.mean_latency()*1000:.2f}ms, max {self.max_latency*1000:.2f}ms"
+
+
+# Base class for sinks. Subclasses implement _open(), _write(data: bytes or ndarray, frames) and _close().
+# Use as a context manager, or call open() and close() manually.
+class AudioSink:
+  name = "sink"
+
+  def __init__(self, channels = 1, rate = 44100, frameSize = 1024):
+    self.channels = channels
+    self.rate = rate
+    self.frameSize = frameSize
+    self.stats = SinkStats()
+    self.is_open = False
+
+  # Whether writes block at the speed of a real audio device (live playback), rather than as fast as possible
+  def isRealtime(self):
+    return False
+
+  def open(self):
+    if not self.is_open:
+      self._open()
+      self.is_open = True
+      self.stats.reset()
+    return self
+
+  def close(self):
+    if self.is_open:
+      self.is_open = False
+      self._close()
+
+  # Writes a chunk of float32 samples, either shaped (frames, channels) or flattened and interleaved
+  def write(self, chunk):
+    chunk = np.asarray(chunk, dtype = np.float32)
+    frames = chunk.shape[0] if chunk.ndim > 1 else len(chunk) // self.channels
+    t = time.perf_counter()
+    nbytes = self._write(np.ravel(chunk), frames)
+    self.stats.record(frames, nbytes, time.perf_counter() - t)
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def describe(self):
+    return self.name
+
+  def _open(self):
+    pass
+
+  def _write(self, data, frames):
+    raise NotImplementedError()
+
+  def _close(self):
+    pass
+
+
+# Plays through the sound card using pyaudio (the default, and the only sink that needs a sound card)
+class PyAudioSink(AudioSink):
+  name = "pyaudio"
+
+  def __init__(self, channels = 1, rate = 44100, frameSize = 1024, output_device_index = None):
+    super().__init__(channels, rate, frameSize)
+    self.output_device_index = output_device_index
+    self.pa = None
+    self.stream = None
+
+  def isRealtime(self):
+    return True
+
+  def _open(self):
+    import pyaudio
+    self.pa = pyaudio.PyAudio()
+    self.stream = self.pa.open(format = pyaudio.paFloat32,
+                               channels = self.channels,
+                               rate = self.rate,
+                               output = True,
+                               frames_per_buffer = self.frameSize,
+                               output_device_index = self.output_device_index)
+
+  def _write(self, data, frames):
+    r = data.astype('<f4', copy = False).tobytes()
+    self.stream.write(r)
+    return len(r)
+
+  # The output latency reported by PortAudio, in seconds
+  def outputLatency(self):
+    return self.stream.get_output_latency() if self.stream is not None else 0.0
+
+  def _close(self):
+    if self.stream is not None:
+      self.stream.stop_stream()
+      self.stream.close()
+      self.stream = None
+    if self.pa is not None:
+      self.pa.terminate()
+      self.pa = None
+
+
+# Discards all samples. With realtime = True, writes are paced to the sample rate as if a sound card (with one buffer
+# of frameSize frames) were attached.
+class NullSink(AudioSink):
+  name = "null"
+
+  def __init__(self, channels = 1, rate = 44100, frameSize = 1024, realtime = False):
+    super().__init__(channels, rate, frameSize)
+    self.realtime = realtime
+    self._framesOut = 0
+    self._t0 = 0.0
+
+  def isRealtime(self):
+    return self.realtime
+
+  def _open(self):
+    self._framesOut = 0
+    self._t0 = time.perf_counter()
+
+  def _write(self, data, frames):
+    self._framesOut += frames
+    if self.realtime:
+      # Sleep until a device with one buffer of frameSize frames queued would have room for more
+      delay = self._t0 + (self._framesOut - self.frameSize) / self.rate - time.perf_counter()
+      if delay > 0:
+        time.sleep(delay)
+    return data.nbytes
+
+  def describe(self):
+    return "null (realtime)" if self.realtime else "null"
+
+
+# Writes a float32 WAV file. The RIFF sizes are patched when the sink is closed, as the length is not known beforehand.
+class WavFileSink(AudioSink):
+  name = "wav"
+
+  def __init__(self, path, channels = 1, rate = 44100, frameSize = 1024):
+    super().__init__(channels, rate, frameSize)
+    self.path = path
+    self.writer = None
+
+  def _open(self):
+    from calcwave.wavwriter import WavWriter
+    self.writer = WavWriter(self.path, self.rate, self.channels, "float32").open()
+
+  def _write(self, data, frames):
+    return self.writer.write(data)
+
+  def _close(self):
+    self.writer.close()
+    self.writer = None
+
+  def describe(self):
+    return "wav:" + self.path
+
+
+# Writes headerless little-endian float32 interleaved PCM to stdout ("-"), a file or FIFO, or a Unix domain socket ("unix:PATH").
+# For example, "calcwave proj.cw --sink raw:- | ffplay -f f32le -ar 44100 -ac 1 -" plays through ffplay.
+class RawPCMSink(AudioSink):
+  name = "raw"
+
+  def __init__(self, target, channels = 1, rate = 44100, frameSize = 1024):
+    super().__init__(channels, rate, frameSize)
+    self.target = target
+    self.file = None
+    self.sock = None
+
+  def _open(self):
+    if self.target == '-':
+      self.file = sys.stdout.buffer
+    elif self.target.startswith("unix:"):
+      self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      self.sock.connect(self.target[len("unix:"):])
+    else:
+      # Opening a FIFO blocks until a reader attaches, which is the desired behavior here
+      self.file = open(self.target, 'wb', buffering = 0 if self.isFifo() else -1)
+
+  def isFifo(self):
+    try:
+      return stat.S_ISFIFO(os.stat(self.target).st_mode)
+    except OSError:
+      return False
+
+  def _write(self, data, frames):
+    r = data.astype('<f4', copy = False).tobytes()
+    if self.sock is not None:
+      self.sock.sendall(r)
+    else:
+      self.file.write(r)
+    return len(r)
+
+  def _close(self):
+    if self.sock is not None:
+      self.sock.close()
+      self.sock = None
+    elif self.file is not None:
+      self.file.flush()
+      if self.file is not sys.stdout.buffer:
+        self.file.close()
+      self.file = None
+
+  def describe(self):
+    return "raw:" + self.target
+
+
+SINK_NAMES = ["pyaudio", "null", "wav", "raw"]
+
+# Parses a --sink specification into (name, argument). Accepted forms:
+#   pyaudio              play through the sound card (default)
+#   null                 discard samples as fast as they are produced
+#   null:realtime        discard samples, paced to the sample rate
+#   wav:PATH             write a float32 WAV file
+#   raw:-                write raw float32 PCM to stdout
+#   raw:PATH             write raw float32 PCM to a file or FIFO
+#   raw:unix:PATH        write raw float32 PCM to a Unix domain socket
+def parse_sink_spec(spec):
+  name, _, arg = spec.partition(':')
+  name = name.lower()
+  if name not in SINK_NAMES:
+    raise ValueError(f'Unknown sink "{name}". Choose one of: {", ".join(SINK_NAMES)}')
+  if name in ("wav", "raw") and arg == '':
+    raise ValueError(f'Sink "{name}" needs a target, eg. "{name}:out.{name}"')
+  if name == "null" and arg not in ('', "realtime"):
+    raise ValueError(f'Unknown option "{arg}" for the null sink. Did you mean "null:realtime"?')
+  return name, arg
+
+# Returns the specification with any file path made absolute, so it survives changing the working directory
+def resolve_sink_spec(spec):
+  name, arg = parse_sink_spec(spec)
+  if name == "wav" or (name == "raw" and arg != '-'):
+    if arg.startswith("unix:"):
+      return name + ":unix:" + os.path.abspath(os.path.expanduser(arg[len("unix:"):]))
+    return name + ':' + os.path.abspath(os.path.expanduser(arg))
+  return spec
+
+# Returns whether the sink specification plays through a sound card
+def is_device_sink(spec):
+  return parse_sink_spec(spec)[0] == "pyaudio"
+
+# Constructs the sink described by the --sink specification string
+def create_sink(spec, channels = 1, rate = 44100, frameSize = 1024, output_device_index = None):
+  name, arg = parse_sink_spec(spec)
+  if name == "pyaudio":
+    return PyAudioSink(channels, rate, frameSize, output_device_index = output_device_index)
+  elif name == "null":
+    return NullSink(channels, rate, frameSize, realtime = (arg == "realtime"))
+  elif name == "wav":
+    return WavFileSink(os.path.expanduser(arg), channels, rate, frameSize)
+  elif name == "raw":
+    return RawPCMSink(arg if arg == '-' or arg.startswith("unix:") else os.path.expanduser(arg), channels, rate, frameSize)
+
+# Asks PortAudio for the number of output channels of the default device
+def default_device_channels():
+  import pyaudio
+  p = pyaudio.PyAudio()
+  try:
+    return p.get_default_output_device_info()['maxOutputChannels']
+  finally:
+    p.terminate()
@@ -0,0 +1,173 @@
+# Realtime telemetry for the AudioPlayer: how much of each chunk's deadline (frameSize / rate seconds) is spent evaluating,
+# how far ahead of the device the player is running, and how many times it fell behind (underruns / xruns).
+
+import time
+import json
+import threading
+from collections import deque
+import numpy as np
+
+
+# A fixed-size window of the most recent values, with percentiles over that window
+class RollingWindow:
+  def __init__(self, size = 512):
+    self.values = deque(maxlen = size)
+    self.lock = threading.Lock() # Percentiles are read from the UI thread while the audio thread appends
+
+  def add(self, value):
+    with self.lock:
+      self.values.append(value)
+
+  def __len__(self):
+    return len(self.values)
+
+  def last(self):
+    with self.lock:
+      return self.values[-1] if self.values else 0.0
+
+  def mean(self):
+    with self.lock:
+      return sum(self.values) / len(self.values) if self.values else 0.0
+
+  # Returns a dict of the given percentiles, eg. {"p50": ..., "p95": ...}
+  def percentiles(self, ps = (50, 95, 99)):
+    with self.lock:
+      arr = np.fromiter(self.values, dtype = float, count = len(self.values))
+    if len(arr) == 0:
+      return {f"p{p}": 0.0 for p in ps}
+    return {f"p{p}": float(v) for p, v in zip(ps, np.percentile(arr, ps))}
+
+  def clear(self):
+    with self.lock:
+      self.values.clear()
+
+
+# Collects per-chunk timing from the AudioPlayer's loop.
+# The playout model assumes the sink consumes audio at the sample rate: every write extends the time at which the
+# buffered audio runs out by the chunk's duration. If a write begins after that moment, the device ran dry (an underrun).
+class PlayerTelemetry:
+  def __init__(self, rate = 44100, window = 512):
+    self.rate = rate
+    self.evalTimes = RollingWindow(window) # Seconds spent evaluating each chunk
+    self.loads = RollingWindow(window) # Evaluation time as a fraction of the chunk's duration
+    self.fill = RollingWindow(window) # Seconds of audio buffered ahead of playout, measured just before each write
+    self.reset()
+
+  def reset(self):
+    self.chunks = 0
+    self.frames = 0
+    self.underruns = 0
+    self.maxEvalTime = 0.0
+    self.playoutDeadline = None # perf_counter() time at which the audio written so far will have finished playing
+    self.startedAt = time.perf_counter()
+    self.evalTimes.clear()
+    self.loads.clear()
+    self.fill.clear()
+
+  # Call when playback stops or seeks, so the time spent paused is not counted as an underrun
+  def restartPlayout(self):
+    self.playoutDeadline = None
+
+  # Records one chunk of "frames" frames that took evalTime seconds to compute and began writing at writeStart.
+  # Underruns and buffer fill are only meaningful for sinks that play in realtime.
+  def recordChunk(self, frames, evalTime, writeStart, realtime = True):
+    if frames <= 0:
+      return
+    duration = frames / self.rate
+    self.chunks += 1
+    self.frames += frames
+    self.evalTimes.add(evalTime)
+    self.loads.add(evalTime / duration)
+    if evalTime > self.maxEvalTime:
+      self.maxEvalTime = evalTime
+
+    if realtime:
+      if self.playoutDeadline is None:
+        self.playoutDeadline = writeStart
+      ahead = self.playoutDeadline - writeStart
+      if ahead < 0:
+        self.underruns += 1
+        self.playoutDeadline = writeStart
+        ahead = 0.0
+      self.fill.add(ahead)
+      self.playoutDeadline += duration
+
+  # The DSP load over the recent window as a percentage of the realtime budget
+  def dspLoad(self):
+    return self.loads.mean() * 100
+
+  # A short summary for the title bar
+  def statusText(self):
+    return f"DSP {self.dspLoad():.0f}% xruns {self.underruns}"
+
+  def as_dict(self):
+    evalp = self.evalTimes.percentiles((50, 95, 99))
+    loadp = self.loads.percentiles((50, 95, 99))
+    fillp = self.fill.percentiles((5, 50))
+    return {"chunks": self.chunks,
+            "frames": self.frames,
+            "rate": self.rate,
+            "elapsed": time.perf_counter() - self.startedAt,
+            "underruns": self.underruns,
+            "dsp_load_percent": {"mean": self.dspLoad(), **{k: v * 100 for k, v in loadp.items()}},
+            "eval_time_ms": {"mean": self.evalTimes.mean() * 1000, "max": self.maxEvalTime * 1000, **{k: v * 1000 for k, v in evalp.items()}},
+            "buffer_fill_ms": {k: v * 1000 for k, v in fillp.items()}}
+
+  # Writes the telemetry, plus any extra keys, as JSON
+  def dump(self, path, extra = {}):
+    with open(path, 'w') as file:
+      json.dump({**extra, "player": self.as_dict()}, file, indent = 2)
+
+
+# Chooses the AudioPlayer's chunk size at runtime. It starts small for low latency, doubles the size when the
+# evaluation cost approaches the deadline or an underrun occurs, and halves it again after a period of headroom.
+# Sizes are kept to powers of two between minSize and maxSize.
+class FrameSizeTuner:
+  def __init__(self, minSize = 256, maxSize = 8192, growAbove = 0.75, shrinkBelow = 0.35, settleTime = 1.0, calmTime = 5.0):
+    self.minSize = minSize
+    self.maxSize = maxSize
+    self.growAbove = growAbove # Grow when the 95th percentile load exceeds this fraction of the deadline
+    self.shrinkBelow = shrinkBelow # Shrink when the 95th percentile load stays below this fraction
+    self.settleTime = settleTime # Seconds of audio to observe at a new size before judging its load
+    self.calmTime = calmTime # Seconds of audio without underruns needed before shrinking
+    self.loads = RollingWindow(256)
+    self.reset()
+
+  def reset(self):
+    self.loads.clear()
+    self.observed = 0.0 # Seconds of audio played at the current size
+    self.calm = 0.0 # Seconds of audio played since the last underrun
+    self.lastUnderruns = None
+
+  def initialSize(self):
+    return self.minSize
+
+  # Feeds the tuner with the most recent chunk from telemetry, and returns the frame size to use from now on
+  def update(self, telemetry, frameSize):
+    if telemetry.chunks == 0:
+      return frameSize
+    self.loads.add(telemetry.loads.last())
+    duration = frameSize / telemetry.rate
+    self.observed += duration
+    self.calm += duration
+
+    underran = self.lastUnderruns is not None and telemetry.underruns > self.lastUnderruns
+    self.lastUnderruns = telemetry.underruns
+    if underran:
+      self.calm = 0.0
+      return self.resize(frameSize * 2)
+    if self.observed < self.settleTime:
+      return frameSize
+
+    p95 = self.loads.percentiles((95,))["p95"]
+    if p95 > self.growAbove:
+      return self.resize(frameSize * 2)
+    if p95 < self.shrinkBelow and self.calm >= self.calmTime:
+      return self.resize(frameSize // 2)
+    return frameSize
+
+  def resize(self, frameSize):
+    frameSize = max(self.minSize, min(self.maxSize, frameSize))
+    self.loads.clear()
+    self.observed = 0.0
+    return frameSize
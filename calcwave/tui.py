@@ -0,0 +1,554 @@
+# Calcwave's terminal user interface: the windows, menus and info display drawn with curses.
+# This is only imported when the interface is started, so that exports and headless runs never load curses (or the widgets
+# built on it).
+
+import os
+import sys
+import time
+import threading
+import traceback
+import curses
+from calcwave import analysis
+from calcwave import assets
+from calcwave.calcwave import version, global_display_lock, Evaluator, exportAudio
+from calcwave.texteditors import TextEditor, LineEditor, detect_os_monkeypatch_curses_keybindings
+from calcwave.elementaltypes import *
+from calcwave.basicui import *
+from calcwave.menuitems import *
+
+# This is necessary because some systems I tested on seemed to have inaccurate curses default key bindings
+# (eg. enter, escape, backspace wouldn't type the correct character), which is odd...
+detect_os_monkeypatch_curses_keybindings(curses_module = curses)
+
+
+# Handles CalcWave's GUI
+# This is a CalcWave-specialized class (not following the parametric building-blocks convention). It holds references for
+# the main text editor and the buttons below (a UIManager), and switches between the two on up/down arrow keypresses
+# (based on booleans recieved by each of the two indicating whether those keypresses were handled or not).
+class WindowManager:
+  def __init__(self, global_config, scr, initialExpr, audioClass, editor, infoDisplay, exportDtype = int):
+    self.global_config = global_config
+    self.scr = scr
+    self.audioClass = audioClass
+    self.oldStdout = None
+    self.initialExpr = initialExpr
+    self.editor = editor
+    self.infoDisplay = infoDisplay
+    # Loads the audio files of edited programs in the background, before they are swapped in
+    self.prefetcher = assets.Prefetcher(global_config.assetCache) if global_config.assetCache is not None else None
+
+    self.initCursesSettings()
+  
+    rows, cols = self.scr.getmaxyx()
+    self.menu = UIManager(Box(rowSize = 2, colSize = cols, rowStart = rows - 7, colStart = 0), global_config, audioClass, self.infoDisplay, exportDtype = exportDtype)
+    
+    #with global_display_lock:
+    #  self.editor.setText(initialExpr)
+    self.thread = None
+  
+  def start(self):
+    if self.thread is None:
+      self.shutdown = False
+      self.thread = threading.Thread(target=self.windowThread, args=(self.global_config, self.scr, self.menu, self.audioClass), daemon=True)
+      self.thread.start()
+      self.statusThread = threading.Thread(target=self.statusUpdateThread, daemon=True)
+      self.statusThread.start()
+    
+  def stop(self):
+    if hasattr(self, 'thread'):
+      if self.thread is not None:
+        self.shutdown = True
+        self.thread.join()
+
+  # Periodically shows the audio player's DSP load and underrun count, and the memory held by loaded audio, in the title bar
+  def statusUpdateThread(self):
+    while self.global_config.shutdown is False and self.shutdown is False:
+      time.sleep(0.5)
+      status = self.audioClass.statusText()
+      if self.global_config.assetCache is not None and self.global_config.assetCache.loaded:
+        status += " " + self.global_config.assetCache.usageText()
+      self.menu.title.setStatus(status)
+      if not self.menu.isEditing(): # Don't draw over the "Editing ..." title
+        with global_display_lock:
+          self.menu.title.refresh()
+
+  def initCursesSettings(self):
+    self.scr.keypad(True)
+    self.scr.nodelay(True)
+    curses.noecho()
+
+  # Controls whether to redirect all stdout to the infoDisplay
+  def setRedirectOutput(self, redirect: bool):
+    if redirect == True and self.oldStdout == None:
+      newWrite = self.infoDisplay.getWriteFD()
+      if not newWrite:
+        return False
+      self.oldStdout = sys.stdout
+      sys.stdout = os.fdopen(newWrite, 'w')
+    elif self.oldStdout != None:
+      oldfd = sys.stdout
+      sys.stdout = self.oldStdout
+      oldfd.close()
+      self.oldStdout = None
+    return True
+
+  def try_compile_code(self, text):
+    try:
+      evaluator = Evaluator(text, rate = self.global_config.rate, audio_map = self.global_config.AUDIO_MAP, channels = self.global_config.channels, seed = self.global_config.seed, asset_cache = self.global_config.assetCache) # Compile on-screen code
+      if self.prefetcher is not None:
+        # Audio files loaded with literal paths are loaded in the background, and the program is installed once they are
+        # resident, so the audio thread never waits for them. Other paths are loaded when the program first runs.
+        pending = self.prefetcher.pending(analysis.loaded_paths(text) or [], self.global_config.rate)
+        if pending:
+          self.prefetcher.prefetch(pending, lambda: self.installCompiled(evaluator), self.showInfo, rate = self.global_config.rate)
+          return
+        self.prefetcher.cancel() # This program supersedes one still waiting for its files
+      self.installCompiled(evaluator)
+    except Exception as e:
+      # Display exceptions to the user
+      with global_display_lock:
+        self.infoDisplay.updateInfo(f"[Compile error] {e.__class__.__name__}: {e.msg}\nAt line {e.lineno} col {e.offset}: {e.text}")
+        self.editor.highlightRange(Point(row = e.lineno, col = e.offset), Point(row = e.end_lineno, col = e.end_offset))
+
+  # Installs a newly compiled evaluator for the player
+  def installCompiled(self, evaluator):
+    if self.global_config.hotswap and not self.audioClass.isPausedOnException():
+      self.audioClass.hotSwap(evaluator) # Installed by the player once it is warmed up
+      return
+    with self.global_config.lock:
+      self.global_config.evaluator = evaluator # Install newly compiled code
+      self.global_config.SaveTimer.notify()
+    self.global_config.publish()
+    if self.audioClass.isPausedOnException():
+      self.audioClass.setPaused(False)
+
+  def showInfo(self, text):
+    with global_display_lock:
+      self.infoDisplay.updateInfo(text)
+
+  def windowThread(self, global_config, scr, menu, audioClass):
+    self.scr.getch()
+    self.scr.nodelay(0) # Turn delay mode on, such that curses will now wait for new keypresses on calls to getch()
+    # Draw graphics
+    with global_display_lock:
+      self.menu.refreshAll()
+      self.menu.title.refresh()
+      if self.initialExpr:
+        self.editor.setText(self.initialExpr)
+        self.initialExpr = None
+      
+
+    self.focused = self.editor
+    try:
+      while self.global_config.shutdown is False:
+        ch = self.scr.getch()
+
+        if ch == 27 and self.focused != self.menu: # Escape key
+          with global_display_lock:
+            self.infoDisplay.updateInfo("ESC recieved. Shutting down...")
+          with self.global_config.lock:
+            self.global_config.shutdown = True
+          break
+        isArrowKey = (ch == curses.KEY_UP or ch == curses.KEY_DOWN or ch == curses.KEY_LEFT or ch == curses.KEY_RIGHT)
+        with global_display_lock:
+          successful = self.focused.type(ch)
+        
+        if successful and self.focused == self.editor:
+          p = self.editor.getPos()
+          self.infoDisplay.updateInfo(f"Line: {p.row+1}, Col: {p.col}, Scroll: {self.editor.scrollOffset}")
+          
+          if isArrowKey:
+            continue
+          
+          self.global_config.SaveTimer.clearSaveMsg()
+          # Display cursor position
+          text = self.editor.getText()
+          self.try_compile_code(text)
+          continue
+        
+        # Switch between menu and inputPad with the arrow keys
+        if self.menu.isEditing(): continue # Don't remove focus from the menu while it's editing
+        if ch == curses.KEY_UP and not self.menu.isEditing(): 
+          self.focused.onUnfocus()
+          self.focused = self.editor
+          self.focused.onFocus()
+        elif ch == curses.KEY_DOWN:
+          self.focused.onUnfocus()
+          self.focused = self.menu
+          self.focused.onFocus()
+          
+    except Exception as e:
+      if isinstance(e, KeyboardInterrupt) or isinstance(e, SystemExit):
+        pass
+      else:
+        global_exception = e
+        with open("calcwave_windowmanager_crash.log", 'w') as f:
+          f.write(traceback.format_exc())
+          sys.stderr.write("WindowManger thread has crashed; crash traceback written to calcwave_windowmanager_crash.log\n")
+        raise e
+    finally:
+      self.global_config.shutdown = True
+      
+  # Changes curses settings back in order to restore terminal state
+  # Call this when you are done with this object!
+  def stopCursesSettings(self, scr):
+    curses.echo()
+    curses.nocbreak()
+    scr.keypad(False)
+
+
+
+
+
+
+
+
+
+# A button to export audio as WAV, FLAC, Ogg or any other file type soundfile can write, to one or more files at once.
+class exportButton(LineEditor, BasicMenuItem):
+  def __init__(self, shape: Box, global_config, progressBar, infoDisplay, dtype):
+    super().__init__(shape)
+    self.global_config = global_config
+    self.infoPad = infoDisplay
+    self.progressBar = progressBar
+    self.setText("Export Audio")
+    self.hideCursor()
+    self.dtype = dtype
+
+
+  def getDisplayName(self):
+    return "Export Button"
+  
+  def updateValue(self, text):
+    self.setText(text)
+    
+  def onBeginEdit(self):
+      self.setText("") # Clear and allow you to enter the filename
+      return "Please enter filenames (separated by commas, eg. mix.wav, mix.flac), and press enter to save. Any existing file will be overwritten."
+  
+  def onHoverEnter(self):
+    self.hideCursor()
+    super().onHoverEnter()
+    return "Press enter to save a recording as a WAV file."
+
+  def onHoverLeave(self):
+    self.showCursor()
+    self.setText("Export Audio")
+    super().onHoverLeave()
+    
+  # Override type, make it check filenames live
+  def type(self, ch):
+    super().type(ch)
+    if self.getText().strip() == '':
+      self.infoPad.updateInfo("Please enter filename, and press enter to save. Any existing file will be overwritten.")
+      return
+
+    # Update the infoDisplay
+    paths, error = resolve_export_paths(self.getText())
+    if error:
+      self.infoPad.updateInfo(error)
+    elif any(os.path.isfile(path) for path in paths):
+      self.infoPad.updateInfo("Will overwrite " + ", ".join(path for path in paths if os.path.isfile(path)))
+    else:
+      self.infoPad.updateInfo("Will export as " + ", ".join(paths))
+  
+  # Where it actually saves the file
+  def doAction(self):
+    text = self.getText()
+    self.setText("Export Audio")
+    if text.strip() == '':
+      return "Cancelled."
+    paths, error = resolve_export_paths(text)
+    if error:
+      return "Cannot export audio: " + error
+    actionMsg = "Saving file as " + ", ".join(paths)
+    
+    #with self.lock:
+    if(self.infoPad):
+      self.infoPad.updateInfo("Writing...")
+    
+    # Do in a separate thread?
+    thread = threading.Thread(target=exportAudio, args=(paths, self.global_config, self.progressBar, self.infoPad, self.dtype), daemon = True)
+    thread.start()
+    #exportAudio(fullPath)
+    return actionMsg
+
+
+# A class that controls and handles interactions with menus and other UI.
+# Drive UIManager's type(ch) function with keyboard characters
+# to interact with it when needed.
+# Note that parts of it are not written in the best way of now, and also has some glaring deviations from a more parametric,
+# building-block type convention.
+class UIManager:
+  def __init__(self, shape: Box, global_config, audioClass, infoDisplay, exportDtype = int):
+    self.infoDisplay = infoDisplay
+    self.global_config = global_config
+    
+    self.settingPads = []
+    self.boxWidth = int(shape.colSize / 3)
+    
+    self.title = TitleWindow(Box(rowSize = 1, colSize = shape.colSize, rowStart = 0, colStart = 0), "Calcwave v" + version)
+    self.lock = threading.Lock()
+    
+    # Create windows and store them in the self.settingPads list.
+    
+    # Graph Button
+    graphBtn = GraphButtonMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart, colStart = shape.colStart), global_config, audioClass)
+
+    # Start range
+    startWin = StartRangeMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart+1, colStart = shape.colStart), "beg", global_config)
+    startWin.updateValue(global_config.start)
+    
+    # Progress bar
+    progressWin = ProgressBar(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart+1, colStart = shape.colStart + self.boxWidth), audioClass, global_config, self.infoDisplay)
+    
+    # End range
+    endWin = EndRangeMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart+1, colStart = shape.colStart + self.boxWidth * 2), "end", global_config)
+    endWin.updateValue(global_config.end)
+    
+    # Step value
+    stepWin = StepMenuItem(Box(rowSize = int(shape.rowSize/2), colSize = self.boxWidth, rowStart = shape.rowStart + 2, colStart = shape.colStart + self.boxWidth * 2), "step", global_config)
+    stepWin.updateValue(global_config.step)
+    
+    # This currently takes up the width of the screen. Change the value from colSize to resize it
+    saveWin = exportButton(Box(rowSize = int(shape.rowSize/2), colSize = int(shape.colSize*(2/3)-1), rowStart = shape.rowStart+2, colStart = shape.colStart), global_config, progressWin, self.infoDisplay, exportDtype)
+
+    if curses.has_colors():
+      curses.init_pair(2, curses.COLOR_RED, -1)
+      progressWin.win.bkgd(' ', curses.color_pair(2))
+    
+    # Be sure to add your object to the settingPads list!
+    # They will be selected by the arrow keys in the order of this list.
+    self.settingPads.append(graphBtn)
+    self.settingPads.append(startWin)
+    self.settingPads.append(progressWin)
+    self.settingPads.append(endWin)
+    self.settingPads.append(saveWin)
+    self.settingPads.append(stepWin)
+    
+    self.focusedWindow = startWin
+    self.focusedWindowIndex = 0
+    self.editing = False
+      
+    self.refreshAll()
+    # End of constructor
+  
+  # Returns true if this is busy editing a widget
+  def isEditing(self):
+    return self.editing
+
+  def onFocus(self):
+    self.refreshTitleMessage()
+    self.infoDisplay.updateInfo(self.focusedWindow.onHoverEnter())
+
+  def onUnfocus(self):
+    self.focusedWindow.onHoverLeave()
+    self.focusedWindow.hideCursor()
+    self.infoDisplay.updateInfo("")
+    self.title.refresh()
+  
+  # Calls refresh() for the InputPads for the start and end values,
+  # and updates the title window
+  def refreshAll(self):
+    for win in self.settingPads:
+      win.refresh()
+      win.hideCursor()
+  
+  # Retrieves the ProgressBar object in the most godawful way...
+  def getProgressBar(self):
+    return self.settingPads[2]
+    
+  # Refreshes title message based on editing status
+  def refreshTitleMessage(self):
+    if self.editing:
+      displayName = self.focusedWindow.getDisplayName()
+      if displayName != "":
+          self.title.customTitle("Editing " + displayName)
+    else:
+      self.title.refresh()
+      
+    
+  # Handles typing and switching between items
+  def type(self, ch):
+    # Make it possible to cancel editing using the escape key
+    if ch == 27: # Escape key
+      if self.editing == True:
+        self.editing = False
+        #self.focusedWindow.onHoverEnter()
+        self.infoDisplay.updateInfo("Cancelled editing!")
+        self.focusedWindow.onHoverEnter()
+        self.refreshTitleMessage()
+        return
+      else: # Not editing? Interpret as shut down
+        with self.lock:
+          self.infoDisplay.updateInfo("ESC recieved. Shutting down...")
+          self.global_config.shutdown = True
+
+    # Switch between menu items
+    if self.editing == False and (ch == curses.KEY_LEFT or ch == curses.KEY_RIGHT):
+      self.focusedWindow.onHoverLeave()
+      self.focusedWindow.hideCursor()
+      if ch == curses.KEY_LEFT:
+        if self.focusedWindowIndex > 0:
+          self.focusedWindowIndex = self.focusedWindowIndex - 1
+        else:
+          self.focusedWindowIndex = len(self.settingPads) - 1
+      elif ch == curses.KEY_RIGHT:
+        if self.focusedWindowIndex < len(self.settingPads) - 1:
+          self.focusedWindowIndex = self.focusedWindowIndex + 1
+        else:
+          self.focusedWindowIndex = 0
+      self.focusedWindow = self.settingPads[self.focusedWindowIndex]
+      msg = self.focusedWindow.onHoverEnter()
+      #self.setMainWindow(self.focusedWindow)
+      self.infoDisplay.updateInfo(msg)
+      return
+      
+    #self.setMainWindow(self.focusedWindow)
+    
+    # Function macro to end editing ; TODO: Make this not horribly inline inside this function?
+    def endEdit():
+      self.editing = False
+      # Run action specified in class
+      actionMsg = self.focusedWindow.doAction()
+      self.focusedWindow.onHoverEnter()
+      self.infoDisplay.updateInfo(actionMsg)
+      self.refreshTitleMessage()
+      self.global_config.SaveTimer.notify()
+      self.global_config.publish()
+    
+    # Function macro to begin edting
+    def beginEdit():
+      self.editing = True
+      self.focusedWindow.onHoverLeave() # Item exits hover mode while editing
+      self.refreshTitleMessage()
+      tooltipMsg = self.focusedWindow.onBeginEdit()
+      self.infoDisplay.updateInfo(tooltipMsg)
+      if self.focusedWindow.isOneshot(): # If onBeginEdit() returns True, end edit immediately after.
+        endEdit()
+      self.focusedWindow.refresh()
+    
+    # Toggle editing on and off and handle highlighting (with onHoverEnter)
+    if ch == curses.KEY_ENTER:
+      if self.editing == False:
+        beginEdit()
+      else:
+        endEdit()
+      return
+      
+      
+    # Drive the type function
+    if not (ch == curses.KEY_UP or ch == curses.KEY_DOWN):
+      if self.editing == False:
+        beginEdit() # Begin editing automatically
+      self.focusedWindow.type(ch)
+    
+    
+
+
+# The display at the bottom of the screen that shows status
+# and error messages
+class InfoDisplay:
+  def __init__(self, shape: Box):
+    self.shape = shape
+  # Make info display window (rowSize, colSize, rowStart, colStart)
+    self.win = curses.newwin(shape.rowSize, shape.colSize, shape.rowStart, shape.colStart)
+    self.otherWindow = None
+    self._r, self._w = os.pipe()
+    self.shutdown = False
+    self._has_new_message = False
+    self.message_cv = threading.Condition()
+    self.lock = threading.Lock()
+
+    # Set the background and text color of the display
+    if curses.has_colors():
+      curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)
+      self.win.bkgd(' ', curses.color_pair(1))
+
+    # For now, lines written will be deleted off the screen when scrolling,
+    # until perhaps a selection / scrolling mechanism is implemented.
+    self.win.scrollok(True)
+    self.thread = threading.Thread(target=self.writeThread, args = (self._r, self.win, self.message_cv), daemon=True)
+    self.thread.start()
+    self.thread2 = threading.Thread(target=self.refreshThread, args = (self.win, self.message_cv), daemon=True)
+    self.thread2.start()
+  
+
+
+  def __del__(self):
+    self.shutdown = True
+    os.write(self._w, b"Shutting Down...")
+    #with open(self._w) as stream:
+    #  print("Shutting Down...", file = stream) # This is really to wake up the reader
+    self.thread.join()
+    os.close(self._w)
+    self._has_new_message = True
+    with self.message_cv:
+      self.message_cv.notify()
+    self.thread2.join()
+    
+    
+  # If you tell it what window to go back to, it will retain
+  # the cursor focus.
+  def setMainWindow(self, window):
+    self.otherWindow = window
+
+  def getWriteFD(self):
+    return self._w # Must be opened with os.fdopen(... , 'w')
+  
+  def refreshThread(self, win, message_cv):
+    while self.shutdown == False:
+      time.sleep(0.1) # Rate limiting to prevent UI lock up and improve performance
+      with message_cv:
+        message_cv.wait()
+      if self._has_new_message:
+        with self.lock:
+          self._has_new_message = False
+          with global_display_lock:
+            win.refresh()
+
+  def writeThread(self, reader, win, message_cv):
+    #win = curses.newwin(self.shape.rowSize, self.shape.colSize, self.shape.rowStart, self.shape.colStart)
+    win.scrollok(True)
+    try:
+      with os.fdopen(reader, 'r') as r:
+        while self.shutdown == False:
+          for line in r:
+            if self.shutdown: break
+            with self.lock:
+              self.win.scrollok(True)
+              for i in range(0, len(line), self.shape.colSize):
+                win.scroll(1)
+                self.win.addstr(self.shape.rowSize - 1, 0, line[max(0, i - self.shape.colSize) : -1])
+              self._has_new_message = True
+            with message_cv:
+              message_cv.notify()
+            #win.refresh()
+            
+    except Exception as e:
+      print("EXCEPTION IN INFODISPLAY WRITER: " + str(e), file = sys.stderr)
+
+    
+  
+# Updates text on the info display window
+# window is the infoDisplay window
+# otherWindow is the one you want to keep the cursor on
+  def updateInfo(self, text):
+    #maxLen = self.colSize * self.rowSize
+    #if len(text) >= maxLen:
+    #  text = text[0:maxLen-1]
+    self.win.erase()
+    #text = text + "\n"
+    #os.write(self._w, bytes(text.encode('UTF-8')))
+    #return
+    try:
+      with self.lock:
+        self.win.scrollok(False)
+        self.win.addstr(0, 0, text) # Display text
+        self.win.scrollok(True)
+    except curses.error:
+      pass # Python Curses does not provide the functions necessary to ensure the cursor is not updated beyond the width of the window (https://stackoverflow.com/a/54412404/16386050) 
+    #with global_display_lock:
+    self.win.refresh()
+    if self.otherWindow:
+      self.otherWindow.refresh()
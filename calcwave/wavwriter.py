@@ -0,0 +1,461 @@
+# Streaming WAV file writer.
+# Samples are given as float arrays of shape (frames, channels) (or flattened and interleaved) in the range -1..1, and are
+# converted and written a whole chunk at a time. The header is written when the file is opened, from the number of frames
+# expected (if known), and its sizes are patched when it is closed, so that it always matches the data actually written.
+#
+# A plain WAV file's sizes are 32-bit, which limits it to 4 GiB. Larger files are written as RF64 (EBU Tech 3306), which
+# adds a "ds64" chunk holding 64-bit sizes, or as Sony Wave64, which uses 64-bit sizes throughout. By default ("auto"), the
+# header reserves room for a ds64 chunk in a "JUNK" chunk, and the file is upgraded to RF64 on close only if it needs to be.
+#
+# Other formats, such as FLAC and Ogg Vorbis, are encoded by soundfile (see SoundFileWriter), and TeeWriter writes the same
+# samples to several files at once, so that one render can produce every format needed.
+
+import os
+import struct
+import collections
+import numpy as np
+
+# Sample formats: name -> (WAVE format tag, bits per sample, numpy dtype of one stored sample, full scale for integers)
+FORMATS = {
+  "int16": (1, 16, '<i2', 32767),
+  "int24": (1, 24, None, 8388607), # Stored as 3 little-endian bytes, which numpy has no dtype for
+  "int32": (1, 32, '<i4', 2147483647),
+  "float32": (3, 32, '<f4', None),
+  "float64": (3, 64, '<f8', None),
+}
+HEADER_SIZE = 44 # Size of a plain WAV header
+MAX_RIFF_SIZE = 0xFFFFFFFF # Largest size the 32-bit RIFF fields can hold
+CONTAINERS = ["auto", "wav", "rf64", "w64"]
+
+# Wave64 chunk identifiers are GUIDs. The first four bytes are the familiar RIFF chunk names.
+_W64_SUFFIX = bytes([0xF3, 0xAC, 0xD3, 0x11, 0x8C, 0xD1, 0x00, 0xC0, 0x4F, 0x8E, 0xDB, 0x8A])
+_W64_RIFF = b'riff' + bytes([0x2E, 0x91, 0xCF, 0x11, 0xA5, 0xD6, 0x28, 0xDB, 0x04, 0xC1, 0x00, 0x00])
+_W64_WAVE = b'wave' + _W64_SUFFIX
+_W64_FMT = b'fmt ' + _W64_SUFFIX
+_W64_DATA = b'data' + _W64_SUFFIX
+
+# Returns the format name for an export dtype: int (16-bit integer), float (32-bit float), or a name in FORMATS
+def format_for(dtype):
+  if dtype == int:
+    return "int16"
+  if dtype == float:
+    return "float32"
+  if dtype not in FORMATS:
+    raise ValueError(f'Unknown sample format "{dtype}". Choose one of: {", ".join(FORMATS)}')
+  return dtype
+
+def is_integer_format(format):
+  return FORMATS[format][0] == 1
+
+def bytes_per_sample(format):
+  return FORMATS[format][1] // 8
+
+# Returns the container to write a path in, from its extension: "w64" for .w64, "rf64" for .rf64, otherwise "auto"
+def container_for_path(path):
+  ext = os.path.splitext(path)[1].lower()
+  return {".w64": "w64", ".rf64": "rf64"}.get(ext, "auto")
+
+
+# The contents of the 'fmt ' chunk
+def _fmt_chunk(rate, channels, format):
+  tag, bits, _, _ = FORMATS[format]
+  blockAlign = channels * bits // 8
+  return struct.pack('<HHIIHH',
+    tag, # 1 = integer PCM, 3 = floating-point PCM
+    channels,
+    rate, # Frames / second
+    rate * blockAlign, # Bytes / second
+    blockAlign, # Bytes / frame
+    bits) # Bits / sample
+
+# Returns the 44-byte header of a WAV file holding the given number of frames
+def wav_header(frames, rate, channels, format = "float32"):
+  datasize = frames * channels * bytes_per_sample(format)
+  return (struct.pack('<4sI4s4sI', b'RIFF', 36 + datasize + (datasize & 1), b'WAVE', b'fmt ', 16) # RIFF size includes any pad byte
+          + _fmt_chunk(rate, channels, format) + struct.pack('<4sI', b'data', datasize))
+
+# Returns the 80-byte header of an RF64 file holding the given number of frames. With placeholder = True, it is instead a
+# plain WAV header with a JUNK chunk in place of the ds64 chunk, which can be overwritten with the RF64 header later.
+def rf64_header(frames, rate, channels, format = "float32", placeholder = False):
+  datasize = frames * channels * bytes_per_sample(format)
+  riffsize = 72 + datasize + (datasize & 1)
+  fmt = struct.pack('<4sI', b'fmt ', 16) + _fmt_chunk(rate, channels, format)
+  if placeholder:
+    return struct.pack('<4sI4s4sI28x', b'RIFF', riffsize, b'WAVE', b'JUNK', 28) + fmt + struct.pack('<4sI', b'data', datasize)
+  # The 32-bit sizes are set to -1, meaning "see the ds64 chunk"
+  return (struct.pack('<4sI4s4sIQQQI', b'RF64', 0xFFFFFFFF, b'WAVE', b'ds64', 28, riffsize, datasize, frames, 0)
+          + fmt + struct.pack('<4sI', b'data', 0xFFFFFFFF))
+
+# Returns the 104-byte header of a Wave64 file holding the given number of frames. Its sizes include the chunk headers.
+def w64_header(frames, rate, channels, format = "float32"):
+  datasize = frames * channels * bytes_per_sample(format)
+  filesize = 104 + datasize + (-datasize % 8) # Chunks are aligned to 8 bytes
+  return (_W64_RIFF + struct.pack('<Q', filesize) + _W64_WAVE
+          + _W64_FMT + struct.pack('<Q', 40) + _fmt_chunk(rate, channels, format)
+          + _W64_DATA + struct.pack('<Q', 24 + datasize))
+
+
+# Converts float samples to the bytes of a WAV data chunk in the given format, returned as a flat numpy array.
+# Integer formats are rounded and clipped to full scale. With dither, triangular (TPDF) noise of +-1 LSB is added before
+# rounding, drawn from rng (a numpy Generator).
+def encode(samples, format = "float32", dither = False, rng = None):
+  _, _, npdtype, scale = FORMATS[format]
+  samples = np.ravel(samples)
+  if scale is None:
+    return samples.astype(npdtype, copy = False)
+
+  scaled = samples.astype(np.float64) * scale
+  if dither:
+    rng = rng if rng is not None else np.random.default_rng()
+    scaled += rng.random(len(scaled))
+    scaled -= rng.random(len(scaled))
+  np.rint(scaled, out = scaled)
+  np.clip(scaled, -scale - 1, scale, out = scaled)
+  if format == "int24":
+    # Keep the low 3 bytes of each little-endian int32
+    return np.ascontiguousarray(scaled.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3]).ravel()
+  return scaled.astype(npdtype)
+
+# Converts the bytes of a WAV data chunk in the given format back to float64 samples in the range -1..1
+def decode(data, format = "float32"):
+  _, _, npdtype, scale = FORMATS[format]
+  if format == "int24":
+    raw = np.frombuffer(data, dtype = np.uint8)
+    raw = raw[:len(raw) - len(raw) % 3].reshape(-1, 3)
+    padded = np.zeros((len(raw), 4), dtype = np.uint8)
+    padded[:, 1:] = raw
+    values = padded.view('<i4').ravel() >> 8 # Arithmetic shift sign-extends the top byte
+  else:
+    itemsize = np.dtype(npdtype).itemsize
+    values = np.frombuffer(data[:len(data) - len(data) % itemsize], dtype = npdtype)
+  values = values.astype(np.float64)
+  return values / scale if scale is not None else values
+
+
+# Writes a WAV, RF64 or Wave64 file (see CONTAINERS). "frames" is the number of frames expected, or 0 if unknown.
+class WavWriter:
+  def __init__(self, path, rate = 44100, channels = 1, format = "float32", dither = False, frames = 0, seed = None, container = None):
+    self.path = path
+    self.paths = [path]
+    self.rate = rate
+    self.channels = channels
+    self.format = format_for(format)
+    self.dither = dither and is_integer_format(self.format)
+    self.expectedFrames = frames # Used for the header until the file is closed
+    self.container = container or container_for_path(path)
+    if self.container not in CONTAINERS:
+      raise ValueError(f'Unknown container "{self.container}". Choose one of: {", ".join(CONTAINERS)}')
+    self.rng = np.random.default_rng(seed)
+    self.file = None
+    self.frames = 0 # Frames written so far
+    self.datasize = 0 # Bytes of sample data written so far
+    self.dataOffset = len(self.header(0)) # Position of the first byte of sample data in the file
+
+  def frameBytes(self):
+    return self.channels * bytes_per_sample(self.format)
+
+  # The header for a file of the given number of frames
+  def header(self, frames):
+    if self.container == "w64":
+      return w64_header(frames, self.rate, self.channels, self.format)
+    if self.container == "rf64":
+      return rf64_header(frames, self.rate, self.channels, self.format)
+    if self.container == "auto":
+      datasize = frames * self.frameBytes()
+      return rf64_header(frames, self.rate, self.channels, self.format, placeholder = 72 + datasize + (datasize & 1) <= MAX_RIFF_SIZE)
+    return wav_header(frames, self.rate, self.channels, self.format)
+
+  # Creates the file, or with resumeAt, reopens an existing one and continues after its first resumeAt bytes of sample data
+  def open(self, resumeAt = None):
+    if resumeAt is None:
+      self.file = open(self.path, 'wb')
+      self.file.write(self.header(self.expectedFrames))
+      self.frames = 0
+      self.datasize = 0
+    else:
+      self.file = open(self.path, 'r+b')
+      self.file.write(self.header(self.expectedFrames)) # The header may have been patched for a shorter file when it was interrupted
+      self.file.truncate(self.dataOffset + resumeAt)
+      self.file.seek(self.dataOffset + resumeAt)
+      self.frames = resumeAt // self.frameBytes()
+      self.datasize = resumeAt
+    return self
+
+  # Writes any buffered data through to the disk
+  def flush(self):
+    self.file.flush()
+    os.fsync(self.file.fileno())
+
+  # Writes a chunk of float samples and returns the number of bytes written.
+  # Raises ValueError if a plain WAV file ("wav" container) would grow past its 4 GiB limit.
+  def write(self, samples):
+    data = encode(samples, self.format, self.dither, self.rng)
+    if self.container == "wav" and 36 + self.datasize + data.nbytes + 1 > MAX_RIFF_SIZE:
+      raise ValueError(f"{self.path} would exceed the 4 GiB limit of a WAV file. Use the rf64 or w64 container, or split the output.")
+    data.tofile(self.file)
+    self.datasize += data.nbytes
+    self.frames += data.nbytes // self.frameBytes()
+    return data.nbytes
+
+  def close(self):
+    if self.file is None:
+      return
+    padding = -self.datasize % 8 if self.container == "w64" else self.datasize & 1 # Chunks are padded to an even size (8 in Wave64)
+    self.file.write(bytes(padding))
+    if self.frames != self.expectedFrames:
+      self.file.seek(0)
+      self.file.write(self.header(self.frames))
+    self.file.close()
+    self.file = None
+
+  def __enter__(self):
+    return self if self.file is not None else self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+# A data region of a preallocated file (see MappedWavWriter), described so that it can be opened by other processes
+MappedRegion = collections.namedtuple("MappedRegion", ["path", "offset", "size", "frameBytes", "format", "dither", "seed"])
+
+# Maps the region's bytes as a writable numpy.memmap of uint8
+def open_region(region):
+  return np.memmap(region.path, dtype = np.uint8, mode = 'r+', offset = region.offset, shape = (region.size,))
+
+# Converts the samples (starting at frame "first") and stores them in buffer, the mapped data region.
+# Dither is seeded from the region's seed and the position, so the result does not depend on the order blocks are written in.
+def write_into(buffer, region, first, samples):
+  rng = None
+  if region.dither:
+    rng = np.random.default_rng(None if region.seed is None else [region.seed, first])
+  data = encode(samples, region.format, region.dither, rng).view(np.uint8)
+  start = first * region.frameBytes
+  buffer[start:start + len(data)] = data
+
+
+# Writes a file of a known number of frames in any order. The file is preallocated at its final size, with the final
+# header, when it is opened, and its data region is mapped into memory. Blocks of frames can then be stored with writeAt(),
+# or by other processes through region() and open_region().
+class MappedWavWriter:
+  def __init__(self, path, frames, rate = 44100, channels = 1, format = "float32", dither = False, seed = None, container = None):
+    self.layout = WavWriter(path, rate, channels, format, dither = dither, frames = frames, container = container)
+    self.path = path
+    self.paths = [path]
+    self.channels = channels
+    self.format = self.layout.format
+    self.dither = self.layout.dither
+    self.seed = seed
+    self.frames = frames
+    self.datasize = frames * self.layout.frameBytes()
+    self.dataOffset = self.layout.dataOffset
+    self.map = None
+
+  def region(self):
+    return MappedRegion(self.path, self.dataOffset, self.datasize, self.layout.frameBytes(), self.format, self.dither, self.seed)
+
+  def open(self):
+    padding = -self.datasize % 8 if self.layout.container == "w64" else self.datasize & 1
+    with open(self.path, 'wb') as file:
+      file.write(self.layout.header(self.frames))
+      file.truncate(self.dataOffset + self.datasize + padding) # Sparse where the filesystem supports it
+    if self.datasize > 0:
+      self.map = open_region(self.region())
+    return self
+
+  # The data region as an array of shape (frames, channels) in the file's sample format (not available for int24)
+  def array(self):
+    _, _, npdtype, _ = FORMATS[self.format]
+    return self.map.view(npdtype).reshape(-1, self.channels)
+
+  # Stores samples starting at frame "first", and returns the number of bytes written
+  def writeAt(self, first, samples):
+    write_into(self.map, self.region(), first, samples)
+    return np.size(samples) * bytes_per_sample(self.format)
+
+  def close(self):
+    if self.map is not None:
+      self.map.flush()
+      self.map = None
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+# Writes the samples as a series of files of at most partSize bytes of sample data each, named after path with a number:
+# "mix.wav" becomes "mix-001.wav", "mix-002.wav", and so on. Each part is a complete file on its own.
+class SplitWavWriter:
+  def __init__(self, path, partSize, rate = 44100, channels = 1, format = "float32", dither = False, frames = 0, seed = None, container = None):
+    self.path = path
+    self.args = dict(rate = rate, channels = channels, format = format, dither = dither, container = container or container_for_path(path))
+    self.rng = np.random.default_rng(seed)
+    self.expectedFrames = frames
+    self.framesPerPart = max(1, partSize // (channels * bytes_per_sample(format_for(format))))
+    self.part = None
+    self.paths = [] # Paths of the parts written so far
+    self.frames = 0
+    self.datasize = 0
+
+  def partPath(self, number):
+    root, ext = os.path.splitext(self.path)
+    return f"{root}-{number:03d}{ext}"
+
+  def open(self):
+    self.paths = []
+    self.frames = 0
+    self.datasize = 0
+    return self
+
+  def nextPart(self):
+    self.closePart()
+    path = self.partPath(len(self.paths) + 1)
+    expected = min(self.framesPerPart, max(0, self.expectedFrames - self.frames))
+    self.part = WavWriter(path, frames = expected, **self.args)
+    self.part.rng = self.rng # Continue the same dither sequence across parts
+    self.part.open()
+    self.paths.append(path)
+
+  def closePart(self):
+    if self.part is not None:
+      self.part.close()
+      self.part = None
+
+  def write(self, samples):
+    samples = np.reshape(samples, (-1, self.args["channels"]))
+    written = 0
+    while len(samples) > 0:
+      if self.part is None or self.part.frames >= self.framesPerPart:
+        self.nextPart()
+      n = self.framesPerPart - self.part.frames
+      written += self.part.write(samples[:n])
+      self.frames += len(samples[:n])
+      samples = samples[n:]
+    self.datasize += written
+    return written
+
+  def close(self):
+    self.closePart()
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+# The soundfile subtype for each sample format, in order of preference
+_SOUNDFILE_SUBTYPES = {"int16": "PCM_16", "int24": "PCM_24", "int32": "PCM_32", "float32": "FLOAT", "float64": "DOUBLE"}
+# File extensions whose soundfile format name is not simply the extension in upper case
+_SOUNDFILE_EXTENSIONS = {".oga": "OGG", ".opus": "OGG", ".aif": "AIFF"}
+WAV_EXTENSIONS = (".wav", ".wave", ".rf64", ".w64")
+
+# Returns the soundfile format name for a path's extension (eg. "FLAC" for .flac), or None if soundfile cannot write it
+def soundfile_format(path):
+  try:
+    import soundfile
+  except ImportError:
+    return None
+  ext = os.path.splitext(path)[1].lower()
+  name = _SOUNDFILE_EXTENSIONS.get(ext, ext[1:].upper())
+  return name if name and name in soundfile.available_formats() else None
+
+# Writes any format supported by soundfile (libsndfile), chosen by the file extension: eg. .flac, .ogg, .aiff.
+# The sample format is used if the file format supports it; otherwise its closest supported depth, or the format's default
+# (as for lossy formats like Ogg Vorbis).
+class SoundFileWriter:
+  def __init__(self, path, rate = 44100, channels = 1, format = "float32"):
+    import soundfile
+    self.path = path
+    self.paths = [path]
+    self.rate = rate
+    self.channels = channels
+    self.format = format_for(format)
+    self.fileFormat = soundfile_format(path)
+    if self.fileFormat is None:
+      raise ValueError(f'Cannot export to "{path}": unknown file type')
+    self.subtype = "OPUS" if path.lower().endswith(".opus") else self.chooseSubtype(soundfile)
+    self.file = None
+    self.frames = 0
+    self.datasize = 0
+    self.dither = False
+
+  def chooseSubtype(self, soundfile):
+    # Prefer the requested depth, then deeper integer depths (eg. FLAC has no float or 32-bit subtypes)
+    names = list(_SOUNDFILE_SUBTYPES)
+    for name in [self.format] + names[names.index(self.format):] + ["int24", "int16"]:
+      if soundfile.check_format(self.fileFormat, _SOUNDFILE_SUBTYPES[name]):
+        return _SOUNDFILE_SUBTYPES[name]
+    return soundfile.default_subtype(self.fileFormat)
+
+  def open(self):
+    import soundfile
+    self.file = soundfile.SoundFile(self.path, 'w', samplerate = self.rate, channels = self.channels, format = self.fileFormat, subtype = self.subtype)
+    self.frames = 0
+    self.datasize = 0
+    return self
+
+  def write(self, samples):
+    samples = np.reshape(samples, (-1, self.channels))
+    if self.subtype not in ("FLOAT", "DOUBLE"):
+      samples = np.clip(samples, -1, 1) # libsndfile wraps around rather than clipping
+    self.file.write(samples)
+    self.frames += len(samples)
+    self.datasize += samples.nbytes
+    return samples.nbytes
+
+  def close(self):
+    if self.file is not None:
+      self.file.close()
+      self.file = None
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+# Writes the same samples to each of several writers
+class TeeWriter:
+  def __init__(self, writers):
+    self.writers = writers
+
+  @property
+  def paths(self):
+    return [path for writer in self.writers for path in writer.paths]
+
+  def open(self):
+    opened = []
+    try:
+      for writer in self.writers:
+        opened.append(writer.open())
+    except:
+      for writer in opened:
+        writer.close()
+      raise
+    return self
+
+  def write(self, samples):
+    return sum(writer.write(samples) for writer in self.writers)
+
+  def close(self):
+    for writer in self.writers:
+      writer.close()
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+# Constructs the writer for one output path: a SoundFileWriter for formats other than WAV that soundfile can write (such
+# as .flac or .ogg), or otherwise a WavWriter (or SplitWavWriter, if splitSize is nonzero)
+def open_writer(path, rate = 44100, channels = 1, format = "float32", dither = False, frames = 0, container = None, splitSize = 0, seed = None):
+  if container is None and not path.lower().endswith(WAV_EXTENSIONS) and soundfile_format(path) is not None:
+    return SoundFileWriter(path, rate, channels, format)
+  if splitSize:
+    return SplitWavWriter(path, splitSize, rate, channels, format, dither = dither, frames = frames, seed = seed, container = container)
+  return WavWriter(path, rate, channels, format, dither = dither, frames = frames, seed = seed, container = container)
@@ -1 +1 @@
-{"start": 0, "end": 1390376, "step": 1.0, "rate": 44100, "channels": 2, "frameSize": 1024, "expr": "# Load audio file, and populate the variable \"splinket\" with the loaded array.\n# This is managed efficiently such that it is not reloaded unnecessarily\nload(\"SplinketCommercial7.mp3\", \"splinket\")\n\n# Audio is loaded in the shape: (samples, channels)\n#print(splinket.shape)\n\n# Random Walk\n\"\"\"\nExplanation:\n* rand(n): chooses a new random number between -1 and 1 every n steps\n* intg(err, clip=False): accumulates error in an integral, allowing error accumulation beyond -1 .. 1\n* ema(y, n): exponential moving average of y over n steps\n* \"int(read_head) % len(splinket)\": quantizes read_head, wrapping around to safely read from \"splinket\"\n\"\"\"\n\nread_head = x + intg(ema(rand(16000)*1, 16000), clip=False)\nout[:] = splinket[int(read_head) % len(splinket)]"}
\ No newline at end of file
+{"start": 0, "end": 1390376, "step": 1.0, "rate": 44100, "channels": 2, "frameSize": 1024, "expr": "# Load audio file, and populate the variable \"splinket\" with the loaded array.\n# This is managed efficiently such that it is not reloaded unnecessarily\nload(\"SplinketCommercial7.mp3\", \"splinket\")\n\n# Audio is loaded in the shape: (samples, channels)\n#print(splinket.shape)\n\n# Random Walk\n\"\"\"\nExplanation:\n* rand(n): chooses a new random number between -1 and 1 every n steps\n* intg(err, clip=False): accumulates error in an integral, allowing error accumulation beyond -1 .. 1\n* ema(y, n): exponential moving average of y over n steps\n* play(splinket, read_head): reads \"splinket\" between samples at read_head, wrapping around its length\n\"\"\"\n\nread_head = x + intg(ema(rand(16000)*1, 16000), clip=False)\nout[:] = play(splinket, read_head)"}
\ No newline at end of file
@@ -0,0 +1,47 @@
+from calcwave.analysis import analyze, loaded_paths
+
+def test_memory_lengths_from_constant_arguments():
+  a = analyze("n = 44100 // 10\nout[:] = delay(sin(x), [0, n]) + conv(x, [0.5] * 8)", rate = 44100)
+  assert [(site.name, site.memory) for site in a.callsites] == [("delay", 4411), ("conv", 8)]
+  assert a.warmupLength() == 4419 # Memories add up, as memory classes may feed each other
+  assert not a.isStateless()
+
+def test_unbounded_and_unknown_memory():
+  a = analyze("out[:] = intg(x, clip=False) + history(x, int(x)) + norm(x, 100)")
+  assert not a.isBounded()
+  assert a.warmupLength() is None
+  assert [site.name for site in a.unboundedSites()] == ["intg", "history", "norm"]
+
+# Variables read before they are assigned, and out read before out[:] is assigned, keep state from the last sample
+def test_state_in_variables():
+  a = analyze("try:\n  n += 1\nexcept NameError:\n  n = 0\nif x > 5:\n  y = 1\nout[:] = out[0] * 0.9 + y")
+  assert a.carried == [("n", 2), ("y", 7), ("out", 7)]
+  assert not a.isBounded() and not a.isStateless() and a.warmupLength() is None
+  assert analyze("count = globals().get('count', 0) + 1").carried == [("globals()", 1)]
+  assert analyze("e = e / 2\nout[:] = e").carried == [("e", 1)]
+  for prog in ["if x > 5:\n  y = 1\nelse:\n  y = 2\nout[:] = y", "out[:] = sum([sin(i * x) for i in range(3)])",
+               "def f(v):\n  w = v * 2\n  return w\nout[:] = f(sin(x))", "load('a.wav', 'a')\nout[:] = a[int(x)]\ns = out[0]",
+               "for i in range(2):\n  out[i] = sin(x * i)"]:
+    assert analyze(prog).isStateless(), prog
+
+# Memory classes in loops and functions may run several times per sample, so their memory is not known
+def test_repeated_call_sites():
+  a = analyze("y = sin(x)\nfor i in range(3):\n  y = delay(y, 10)\ndef f(v):\n  return ema(v, 5)\nout[:] = f(y) + sum(conv(y, [1, 1]) for j in range(2)) + const(lambda: 2)")
+  assert [(site.name, site.bounded, site.repeated) for site in a.callsites] == [("delay", False, True), ("ema", False, True), ("conv", False, True), ("const", True, False)]
+  assert a.warmupLength() is None
+  assert a.unboundedReasons()[0] == "delay() at line 3 in a loop or function"
+  assert analyze("for i in range(2):\n  out[i] = const(lambda: 0.5)").isStateless()
+
+# Clock and random number modules are found, however they are imported
+def test_nondeterministic_modules():
+  a = analyze("import time\nfrom datetime import datetime\nimport numpy as np\nout[0] = np.random.rand() + time.time()\nfrom numpy.random import default_rng")
+  assert a.nondeterministic == [("time", 1), ("datetime", 2), ("random", 4), ("numpy.random", 5)]
+  assert analyze("import numpy as np\nout[:] = np.sin(x)").nondeterministic == []
+
+def test_const_is_stateless():
+  assert analyze("k = const(lambda: 2)\nout[:] = sin(x / k)").isStateless()
+  assert analyze("out[:] = sin(x)").isStateless()
+
+def test_loaded_paths():
+  assert loaded_paths("load('a.wav', 'a')\nload(path = 'b.flac', alias = 'b')\nout[0] = a[int(x)]") == ["a.wav", "b.flac"]
+  assert loaded_paths("p = 'a.wav'\nload(p, 'a')") is None
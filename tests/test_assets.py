@@ -0,0 +1,165 @@
+import os
+import pickle
+import threading
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+import pytest
+import numpy as np
+import soundfile as sf
+from calcwave.assets import AssetCache, PagedAsset, Prefetcher, map_wav, resample, ScaledArray
+from calcwave.wavwriter import WavWriter
+from calcwave.calcwave import Evaluator
+
+def write_audio(path, frames = 1000, channels = 2, subtype = "PCM_16"):
+  data = np.stack([np.sin(np.arange(frames) / (10 + c)) * 0.5 for c in range(channels)], axis = 1)
+  sf.write(str(path), data, 44100, subtype = subtype)
+  return str(path)
+
+# Decoded files are stored as float32 .npy files, which later loads (by other caches, as in other processes) memory-map
+def test_asset_cache_stores_and_maps(tmp_path):
+  path = write_audio(tmp_path / "a.flac")
+  first = AssetCache(str(tmp_path / "cache")).load(path)
+  assert first.dtype == np.float32 and first.shape == (1000, 2)
+  assert len(os.listdir(tmp_path / "cache")) == 1
+  second = AssetCache(str(tmp_path / "cache")).load(path)
+  assert isinstance(second, np.memmap) and not second.flags.writeable
+  assert np.array_equal(first, second)
+  assert np.allclose(second, sf.read(path, always_2d = True)[0], atol = 1e-6)
+
+# A file changed on disk is decoded again
+def test_asset_cache_notices_changes(tmp_path):
+  cache = AssetCache(str(tmp_path / "cache"))
+  path = write_audio(tmp_path / "a.wav")
+  key = cache.key(path)[0]
+  write_audio(tmp_path / "a.wav", frames = 500)
+  os.utime(path, ns = (1, 1))
+  assert cache.key(path)[0] != key
+  assert cache.load(path).shape == (500, 2)
+
+def test_load_through_asset_cache(tmp_path):
+  path = write_audio(tmp_path / "a.wav")
+  ev = Evaluator(f"load({path!r}, 'a')\nout[:] = a[int(x)]", channels = 2, audio_map = {}, asset_cache = AssetCache(str(tmp_path / "cache")))
+  assert np.allclose(ev.evaluate(10), sf.read(path)[0][10], atol = 1e-6)
+
+# Uncompressed WAV and RF64 files are mapped where they are, with integer samples scaled as they are read
+def test_map_wav(tmp_path):
+  for subtype in ("PCM_16", "PCM_32", "FLOAT", "DOUBLE"):
+    path = write_audio(tmp_path / f"{subtype}.wav", subtype = subtype)
+    mapped = map_wav(path)
+    assert isinstance(mapped, np.memmap if subtype == "FLOAT" else ScaledArray) and mapped[0].dtype == np.float32
+    assert mapped.shape == (1000, 2) and len(mapped) == 1000
+    expected = sf.read(path, always_2d = True)[0]
+    assert np.allclose(mapped[123], expected[123], atol = 1e-6)
+    assert np.allclose(np.asarray(mapped), expected, atol = 1e-6)
+  assert map_wav(write_audio(tmp_path / "24.wav", subtype = "PCM_24")) is None
+  assert map_wav(write_audio(tmp_path / "a.flac")) is None
+
+  samples = np.linspace(-1, 1, 600, dtype = np.float32).reshape(300, 2)
+  with WavWriter(str(tmp_path / "a.rf64"), channels = 2, format = "int16", container = "rf64") as writer:
+    writer.write(samples)
+  assert np.allclose(np.asarray(map_wav(str(tmp_path / "a.rf64"))), samples, atol = 1 / 16384)
+
+# Large files are streamed in pages, keeping only the most recently used ones, and reading ahead when read in order
+def test_paged_asset(tmp_path):
+  path = write_audio(tmp_path / "a.flac", frames = 5000)
+  expected = sf.read(path, always_2d = True, dtype = 'float32')[0]
+  asset = PagedAsset(path, pageFrames = 256, budget = 256 * 2 * 4 * 4, readAhead = 2)
+  assert len(asset) == 5000 and asset.shape == (5000, 2)
+  for i in range(0, 5000, 7):
+    assert np.array_equal(asset[i], expected[i])
+  assert asset.misses == 11 # 20 pages: the first alone, then two at a time
+  assert len(asset.pages) == 4
+  assert np.array_equal(asset[-1], expected[-1]) and asset[100, 1] == expected[100, 1]
+  assert np.array_equal(asset[250:1000], expected[250:1000])
+  assert np.array_equal(np.asarray(asset), expected)
+  index = np.array([[4999, 3], [-1, 700]])
+  assert np.array_equal(asset[index], expected[index])
+  for index in [(slice(None), 0), (slice(10, 20), 1), (slice(None, None, 3), slice(None)), ([5, 4000], 1), (7, slice(None))]:
+    assert np.array_equal(asset[index], expected[index])
+
+def test_asset_cache_streams_large_files(tmp_path):
+  path = write_audio(tmp_path / "a.flac")
+  asset = AssetCache(str(tmp_path / "cache"), streamAbove = 1000).load(path)
+  assert isinstance(asset, PagedAsset)
+  assert os.listdir(tmp_path / "cache") == []
+
+# Prefetching decodes files in the background, reporting progress, and calls back once they are all resident
+def test_prefetcher(tmp_path):
+  cache = AssetCache(str(tmp_path / "cache"))
+  paths = [write_audio(tmp_path / "a.flac"), write_audio(tmp_path / "b.wav"), str(tmp_path / "missing.wav")]
+  prefetcher = Prefetcher(cache)
+  assert prefetcher.pending(paths) == paths
+  ready = threading.Event()
+  messages = []
+  prefetcher.prefetch(paths, ready.set, messages.append).join()
+  assert ready.is_set()
+  assert prefetcher.pending(paths) == paths[2:]
+  assert "Loading a.flac (1/3): 100%" in messages
+  assert messages[-1].startswith("Could not load")
+
+# Files at other sample rates are resampled to the program's rate when they are loaded, and the result is cached
+def test_resampled_assets(tmp_path):
+  t = np.arange(48000) / 48000
+  tone = np.stack([np.sin(2 * np.pi * 1000 * t), np.sin(2 * np.pi * 3000 * t)], axis = 1) * 0.5
+  path = str(tmp_path / "tone.flac")
+  sf.write(path, tone, 48000)
+  cache = AssetCache(str(tmp_path / "cache"))
+  arr = cache.load(path, 44100)
+  assert arr.shape == (44100, 2) and isinstance(arr, np.memmap)
+  u = np.arange(44100) / 44100
+  expected = np.stack([np.sin(2 * np.pi * 1000 * u), np.sin(2 * np.pi * 3000 * u)], axis = 1) * 0.5
+  assert np.abs(arr[100:-100] - expected[100:-100]).max() < 1e-3 # Away from the edges
+  assert AssetCache(str(tmp_path / "cache")).load(path, 44100).shape == (44100, 2)
+  assert cache.load(path, 48000).shape == (48000, 2) # Not resampled
+  assert Evaluator(f"load({path!r}, 'a')\nout[:] = len(a)", rate = 44100, channels = 1, audio_map = {}).evaluate(0)[0] == 44100
+
+# Upsampling and downsampling keep a tone below both Nyquist frequencies, and remove tones above the new one
+def test_resample():
+  t = np.arange(22050) / 22050
+  x = (np.sin(2 * np.pi * 440 * t) * 0.5)[:, None]
+  up = resample(x, 22050, 44100)
+  u = np.arange(44100) / 44100
+  assert len(up) == 44100 and np.abs(up[200:-200, 0] - np.sin(2 * np.pi * 440 * u[200:-200]) * 0.5).max() < 1e-3
+  t = np.arange(44100) / 44100
+  high = np.sin(2 * np.pi * 15000 * t)[:, None]
+  down = resample(high, 44100, 22050)
+  assert len(down) == 22050 and np.abs(down[200:-200]).max() < 1e-2
+
+def sum_shared(cache, path):
+  arr = cache.load(path)
+  return float(arr.sum()), arr.flags.writeable, cache.shared.get(cache.key(path)[0]) is arr
+
+# Decoded files that are not stored on disk are shared with other processes, which attach to them instead of decoding them
+def test_shared_assets(tmp_path):
+  path = write_audio(tmp_path / "a.flac")
+  cache = AssetCache(None)
+  keys = cache.share([path, path])
+  assert len(keys) == 2 and cache.shared.refs[keys[0]] == 2
+  attached = pickle.loads(pickle.dumps(cache))
+  assert np.array_equal(attached.load(path), cache.load(path))
+  with concurrent.futures.ProcessPoolExecutor(1, mp_context = multiprocessing.get_context("spawn")) as pool:
+    assert pool.submit(sum_shared, cache, path).result() == (float(cache.load(path).sum()), False, True)
+  name = cache.shared.blocks[keys[0]].name
+  cache.unshare(keys[:1])
+  shared_memory.SharedMemory(name).close() # Still referenced
+  cache.unshare(keys[1:])
+  with pytest.raises(FileNotFoundError):
+    shared_memory.SharedMemory(name)
+
+class Program:
+  pass
+
+# Over its memory budget, the cache drops the least recently used files that no program uses any more
+def test_asset_memory_budget(tmp_path):
+  paths = [write_audio(tmp_path / f"{name}.flac") for name in "abcd"]
+  cache = AssetCache(None, memoryBudget = 2 * 1000 * 2 * 4)
+  program = Program()
+  cache.load(paths[0], user = program)
+  cache.load(paths[1])
+  cache.load(paths[2])
+  assert cache.isResident(paths[0]) and not cache.isResident(paths[1]) and cache.isResident(paths[2])
+  assert cache.memoryUsage() == 2 * 1000 * 2 * 4 and cache.usageText() == "assets 0/0M"
+  del program
+  cache.load(paths[3])
+  assert not cache.isResident(paths[0]) and cache.evictions == 2
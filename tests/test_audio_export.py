@@ -3,3 +3,122 @@ from calcwave.calcwave import CalcWave
 # Tests if audio exported with --float32 is really in float32 format
 def test_float32_export():
   pass
+
+import os
+import pytest
+import numpy as np
+import soundfile as sf
+from calcwave.calcwave import Config, Evaluator, exportAudio
+
+def export(tmp_path, prog, name, jobs = 1, dtype = float, start = 0, end = 5000, step = 1.):
+  config = Config()
+  config.start, config.end, config.step, config.channels, config.frameSize, config.jobs = start, end, step, 2, 512, jobs
+  config.evaluator = Evaluator(prog, channels = 2)
+  path = str(tmp_path / name)
+  exportAudio(path, config, None, None, dtype = dtype)
+  return path
+
+# Every sample of the range is exported, including a final partial chunk
+def test_export_length_and_values(tmp_path):
+  arr, rate = sf.read(export(tmp_path, "out[0] = x / 10000\nout[1] = -x / 10000", "a.wav"), dtype = 'float32')
+  assert arr.shape == (5001, 2)
+  assert np.isclose(arr[-1, 0], 0.5) and np.isclose(arr[-1, 1], -0.5)
+
+# A stateless program exported by a process pool is identical to exporting it serially
+def test_parallel_export_matches_serial(tmp_path):
+  prog = "out[0] = sin(x / 30)\nout[1] = const(lambda: 0.5) * cos(x / 7)"
+  serial = export(tmp_path, prog, "serial.wav")
+  parallel = export(tmp_path, prog, "parallel.wav", jobs = 3)
+  with open(serial, 'rb') as a, open(parallel, 'rb') as b:
+    assert a.read() == b.read()
+
+# Programs with bounded memory are exported in parallel by warming up each segment, with the same result as a serial export.
+# Chained memory classes are warmed up for the sum of their memories, and programs with unbounded state (norm, or feedback
+# through out) are exported on one process.
+@pytest.mark.parametrize("prog", ["s = sin(x / 30)\nout[0] = delay(s, [100, 250], [0.5, 0.25])\nout[1] = history(s, 40)[0]",
+                                  "out[:] = delay(conv(delay(x / 5000, [0, 300], [0, 1]), [0.5] * 20), [0, 400], [0, 1])",
+                                  "out[:] = norm(sin(x / 300) - 2 + 0.1 * sin(x / 7), 50)",
+                                  "out[:] = out[0] * 0.9 + sin(x / 10) * 0.1"])
+def test_parallel_export_warms_up_stateful_programs(tmp_path, prog):
+  serial = export(tmp_path, prog, "serial.wav")
+  parallel = export(tmp_path, prog, "parallel.wav", jobs = 3)
+  with open(serial, 'rb') as a, open(parallel, 'rb') as b:
+    assert a.read() == b.read()
+
+# If the analysis underestimates a program's memory, warming it up for twice as long shows it, and it is exported on one process
+def test_parallel_export_checks_warmup(tmp_path, monkeypatch, capsys):
+  from calcwave import analysis, render
+  prog = "out[:] = delay(delay(sin(x / 30), [0, 300], [0, 1]), [0, 300], [0, 1])"
+  assert render.warmup_error(prog, 44100, 2, 0, 5000, 1., 512, 3, 301) > 0.1
+  assert render.warmup_error(prog, 44100, 2, 0, 5000, 1., 512, 3, 602) == 0
+  monkeypatch.setattr(analysis.ProgramAnalysis, "warmupLength", lambda self: 301)
+  serial = export(tmp_path, prog, "serial.wav")
+  parallel = export(tmp_path, prog, "parallel.wav", jobs = 3)
+  assert "does not settle" in capsys.readouterr().err
+  with open(serial, 'rb') as a, open(parallel, 'rb') as b:
+    assert a.read() == b.read()
+
+def test_verify_parallel_export(tmp_path):
+  config = Config()
+  config.start, config.end, config.step, config.channels, config.frameSize, config.jobs = 0, 3000, 1., 2, 256, 2
+  config.evaluator = Evaluator("out[0] = ema(sin(x / 20), 10)", channels = 2)
+  config.verifyExport = True
+  result = exportAudio(str(tmp_path / "v.wav"), config, None, None)
+  assert result.samples == 3001 * 2
+  assert result.matches(tolerance = 1e-4)
+
+# Several outputs in different formats are written from a single render
+def test_export_to_several_formats(tmp_path):
+  config = Config()
+  config.start, config.end, config.step, config.channels, config.frameSize = 0, 999, 1., 2, 256
+  config.evaluator = Evaluator("out[0] = sin(x / 30) * 0.5\nout[1] = 2", channels = 2)
+  paths = [str(tmp_path / name) for name in ("mix.wav", "mix.flac", "preview.ogg")]
+  exportAudio(paths, config, None, None, dtype = "int16")
+  wav, _ = sf.read(paths[0])
+  flac, _ = sf.read(paths[1])
+  assert [sf.info(p).format for p in paths] == ["WAV", "FLAC", "OGG"]
+  assert wav.shape == (1000, 2) and np.allclose(flac, wav, atol = 1 / 32767)
+  assert np.all(flac[:, 1] > 0.99) # Clipped rather than wrapped around
+  assert sf.info(paths[2]).frames == 1000
+
+# An interrupted export resumed from its checkpoint gives the same file as an uninterrupted one, including variables the
+# program keeps between samples. Only checkpoints signed with this user's key are resumed from.
+def test_resume_from_checkpoint(tmp_path, monkeypatch):
+  from calcwave import wavwriter, checkpoint
+  monkeypatch.setattr(checkpoint, "KEY_PATH", str(tmp_path / "checkpoint.key"))
+  def export(name, resume = False):
+    config = Config()
+    config.start, config.end, config.step, config.channels, config.frameSize = 0, 4000, 1., 2, 256
+    config.seed, config.checkpointInterval, config.dither, config.resume = 5, 1e-9, True, resume
+    config.evaluator = Evaluator("out[0] = delay(rand(7), 50) + ema(sin(x / 20), 9)\ncount = globals().get('count', 0) + 1\n"
+                                 "out[1] = intg(sin(x / 50) * 0.01) + count / 10000", channels = 2)
+    exportAudio(str(tmp_path / name), config, None, None, dtype = "int24")
+    return str(tmp_path / name)
+  expected = export("full.wav")
+
+  write = wavwriter.WavWriter.write
+  def interrupted(self, samples):
+    if self.datasize > 5000:
+      raise KeyboardInterrupt()
+    return write(self, samples)
+  monkeypatch.setattr(wavwriter.WavWriter, "write", interrupted)
+  with pytest.raises(KeyboardInterrupt):
+    export("resumed.wav")
+  monkeypatch.setattr(wavwriter.WavWriter, "write", write)
+  sidecar = checkpoint.sidecar_path(str(tmp_path / "resumed.wav"))
+  assert checkpoint.load(sidecar).index > 0
+
+  with open(sidecar, 'rb') as file:
+    signed = file.read()
+  monkeypatch.setattr(checkpoint, "KEY_PATH", str(tmp_path / "other.key"))
+  checkpoint.load(sidecar).save(sidecar) # Written by someone else
+  monkeypatch.setattr(checkpoint, "KEY_PATH", str(tmp_path / "checkpoint.key"))
+  with pytest.raises(ValueError, match = "signature"):
+    export("resumed.wav", resume = True)
+  with open(sidecar, 'wb') as file:
+    file.write(signed)
+
+  resumed = export("resumed.wav", resume = True)
+  with open(expected, 'rb') as a, open(resumed, 'rb') as b:
+    assert a.read() == b.read()
+  assert not os.path.exists(checkpoint.sidecar_path(resumed))
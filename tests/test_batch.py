@@ -0,0 +1,42 @@
+import json
+import pytest
+import soundfile as sf
+from calcwave import batch
+
+def write_project(path, expr, end = 999, channels = 1):
+  with open(path, 'w') as f:
+    json.dump({"start": 0, "end": end, "step": 1.0, "rate": 44100, "channels": channels, "frameSize": 256, "expr": expr}, f)
+  return str(path)
+
+# Globs and manifests expand to jobs, with manifest paths relative to the manifest and outputs defaulting to NAME.wav
+def test_collect_jobs(tmp_path):
+  write_project(tmp_path / "a.cw", "out[:] = 0")
+  write_project(tmp_path / "b.cw", "out[:] = 0")
+  (tmp_path / "jobs.csv").write_text("project,output,end,format\na.cw,renders/a_short.flac,99,int16\nb.cw,renders/b.wav,,\n")
+  (tmp_path / "jobs.json").write_text(json.dumps({"jobs": [{"project": "b.cw", "output": "renders/b_stereo.wav", "channels": 2}]}))
+  jobs = batch.collect_jobs([str(tmp_path / "*.cw"), str(tmp_path / "jobs.csv"), str(tmp_path / "jobs.json")], str(tmp_path / "out"))
+  assert [job.output for job in jobs] == [str(tmp_path / "out" / "a.wav"), str(tmp_path / "out" / "b.wav"), str(tmp_path / "renders" / "a_short.flac"),
+                                          str(tmp_path / "renders" / "b.wav"), str(tmp_path / "renders" / "b_stereo.wav")]
+  assert jobs[2].overrides == {"end": 99.0, "format": "int16"}
+  assert jobs[4].overrides == {"channels": 2}
+
+# Jobs that would export to the same file (and race to write it) are refused
+def test_collect_jobs_with_the_same_output(tmp_path):
+  write_project(tmp_path / "b.cw", "out[:] = 0")
+  (tmp_path / "jobs.json").write_text(json.dumps([{"project": "b.cw"}, {"project": "b.cw", "channels": 2}]))
+  with pytest.raises(ValueError, match = "2 jobs would export to"):
+    batch.collect_jobs([str(tmp_path / "jobs.json")])
+
+def test_run_jobs_with_overrides(tmp_path):
+  jobs = [batch.RenderJob(write_project(tmp_path / "a.cw", "out[:] = 0.25"), str(tmp_path / "a.wav")),
+          batch.RenderJob(write_project(tmp_path / "b.cw", "out[:] = x / 1000"), str(tmp_path / "b.wav"), {"end": 499, "channels": 2, "format": "int16"}),
+          batch.RenderJob(str(tmp_path / "missing.cw"), str(tmp_path / "c.wav"))]
+  results = batch.run_jobs(jobs, processes = 2)
+  assert [result.error is None for result in results] == [True, True, False]
+  a, _ = sf.read(jobs[0].output)
+  b = sf.info(jobs[1].output)
+  assert len(a) == 1000 and (a == 0.25).all()
+  assert (b.frames, b.channels, b.subtype) == (500, 2, "PCM_16")
+  assert results[1].frames == 500
+  table = batch.summary_table(results, 1.0)
+  assert "FAILED" in table and "2/3 ok" in table
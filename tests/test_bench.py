@@ -0,0 +1,18 @@
+import json
+from calcwave import bench
+
+# Projects and stress programs run on every backend in their own processes without errors, and the report gives their
+# throughput and memory; projects render at most --seconds of audio, and unbounded ones are not rendered in parallel
+def test_bench(tmp_path):
+  project = tmp_path / "p.cw"
+  project.write_text(json.dumps({"start": 0, "end": 999, "step": 1.0, "rate": 44100, "channels": 1, "expr": "out[:] = intg(0.001)"}))
+  out = tmp_path / "bench.json"
+  assert bench.main([str(project), "--seconds", "0.05", "-j", "2", "-o", str(out)]) == 0
+  results = json.loads(out.read_text())["results"]
+  assert [(result["backend"], result["frames"], result.get("errors")) for result in results[:3]] == [("player", 1000, 0), ("serial", 1000, 0), ("parallel", 1000, None)]
+  assert "skipped" in results[2]
+  stress = results[3:]
+  assert [(result["program"], result["backend"]) for result in stress] == [(name, backend) for name in bench.STRESS_PROGRAMS for backend in bench.BACKENDS]
+  for result in stress:
+    assert result["frames"] == 2205 and result["errors"] == 0
+    assert result["samples_per_sec"] > 0 and result["realtime_factor"] > 0 and result["peak_rss_mib"] > 0
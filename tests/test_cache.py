@@ -0,0 +1,66 @@
+import os
+import numpy as np
+from calcwave import render
+from calcwave.cache import RenderCache, program_key, cached_render, CHUNK_FRAMES
+from calcwave.calcwave import Evaluator
+
+def render_all(blocks):
+  return np.concatenate([block.samples for block in blocks])
+
+# Rendering through the cache gives the same samples as rendering serially, whether chunks hit or miss. A stateful program
+# is warmed up before computing the chunks that follow cached ones, and those chunks are not stored, as they are approximate.
+def test_cached_render_matches_serial(tmp_path):
+  prog = "s = sin(x / 30)\nout[0] = delay(s, [100], [0.5])\nout[1] = ema(s, 20)"
+  count = CHUNK_FRAMES * 3 + 100
+  expected = render_all(render.render_serial(Evaluator(prog, channels = 2).evaluate, 0, count - 1, 1., 2, 500))
+  cache = RenderCache(str(tmp_path), maxBytes = 1 << 30)
+  key = program_key(prog, 44100, 2, 1., 0, stateful = True)
+  first = render_all(cached_render(cache, key, Evaluator(prog, channels = 2).evaluate, 0, 1., 0, count, count, 2, 500, warmup = 101))
+  assert np.array_equal(first, expected)
+  assert cache.stores == 4
+  os.remove(cache.path(key, 1)) # A miss between hits
+  second = render_all(cached_render(cache, key, Evaluator(prog, channels = 2).evaluate, 0, 1., 0, count, count, 2, 500, warmup = 101))
+  assert cache.hits == 3
+  assert np.allclose(second, expected, atol = 1e-4)
+  assert cache.stores == 4 and not os.path.exists(cache.path(key, 1))
+  render_all(cached_render(cache, key, Evaluator(prog, channels = 2).evaluate, 0, 1., CHUNK_FRAMES, CHUNK_FRAMES * 2, count, 2, 500, warmup = 101, stale = True))
+  assert cache.stores == 4 # Rendered from a warmed up state
+
+# Only deterministic programs whose loaded files are known are cached, and the key changes with anything the samples depend on
+def test_program_key():
+  key = program_key("out[:] = sin(x)", 44100, 1, 1., 0)
+  assert key is not None and key == program_key("out[:] = sin(x)", 44100, 1, 1., 0)
+  assert key != program_key("out[:] = sin(x)", 48000, 1, 1., 0)
+  assert key != program_key("out[:] = sin(x)", 44100, 1, 1., 10)
+  assert program_key("out[:] = ema(sin(x), 5)", 44100, 1, 1., 0) is None
+  assert program_key("out[:] = ema(sin(x), 5)", 44100, 1, 1., 0, stateful = True) is not None
+  assert program_key("out[:] = rand()", 44100, 1, 1., 0, seed = 3, stateful = True) is None
+  assert program_key("load(name, 'a')\nout[:] = 0", 44100, 1, 1., 0) is None
+
+# Programs that keep state in their own variables or in out, or read the clock or random numbers from modules, are not cached,
+# so an export through the cache stores nothing for them
+def test_programs_that_do_not_repeat_are_not_cached(tmp_path):
+  from calcwave.calcwave import Config, exportAudio
+  progs = ["out[:] = out[0] * 0.9 + sin(x / 10) * 0.1", "try:\n  n += 1\nexcept NameError:\n  n = 0\nout[:] = n / 10000",
+           "import time\nout[:] = time.time() % 1", "import numpy as np\nout[:] = np.random.rand()"]
+  for prog in progs:
+    assert program_key(prog, 44100, 1, 1., 0, stateful = True) is None, prog
+  config = Config()
+  config.start, config.end, config.frameSize = 0, CHUNK_FRAMES * 2, 512
+  config.renderCache = RenderCache(str(tmp_path / "cache"))
+  for i, prog in enumerate(progs):
+    config.evaluator = Evaluator(prog)
+    exportAudio(str(tmp_path / f"{i}.wav"), config, None, None)
+  assert config.renderCache.stores == 0 and os.listdir(tmp_path / "cache") == []
+
+# The least recently used chunks are evicted once the cache outgrows its size
+def test_lru_eviction(tmp_path):
+  cache = RenderCache(str(tmp_path), maxBytes = 3 * (CHUNK_FRAMES * 4 + 128))
+  samples = np.zeros((CHUNK_FRAMES, 1), dtype = np.float32)
+  for chunk in range(3):
+    cache.put("k", chunk, samples)
+    os.utime(cache.path("k", chunk), (chunk, chunk))
+  assert cache.get("k", 0, CHUNK_FRAMES) is not None # Now the most recently used
+  cache.put("k", 3, samples)
+  assert os.path.exists(cache.path("k", 0)) and os.path.exists(cache.path("k", 3))
+  assert not os.path.exists(cache.path("k", 1))
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from calcwave.mathextensions import play
+
+audio = np.stack([np.arange(10, dtype = np.float32) ** 2, -np.arange(10, dtype = np.float32)], axis = 1)
+
+# Linear interpolation is exact for lines, and cubic (Catmull-Rom) interpolation for parabolas, away from the ends
+def test_play_interpolates():
+  assert np.allclose(play(audio, 4.25), [4.25 ** 2 + 0.25 * 0.75, -4.25])
+  assert np.allclose(play(audio, 4.25, interp = "cubic"), [4.25 ** 2, -4.25])
+  assert np.array_equal(play(audio, 3), audio[3])
+  with pytest.raises(ValueError):
+    play(audio, 1.5, interp = "sinc")
+
+# Positions wrap around the audio, or read silence outside it; arrays of positions give the same samples as one at a time
+def test_play_wraps_and_reads_blocks():
+  assert np.allclose(play(audio, 9.5), (audio[9] + audio[0]) / 2)
+  assert np.allclose(play(audio, -0.5), (audio[9] + audio[0]) / 2)
+  assert np.allclose(play(audio, 9.5, wrap = False), audio[9] / 2)
+  assert np.array_equal(play(audio, -3, wrap = False), [0, 0])
+  positions = np.linspace(-12, 25, 101)
+  for interp in ("linear", "cubic"):
+    for wrap in (True, False):
+      block = play(audio, positions, interp, wrap)
+      assert block.shape == (101, 2) and block.dtype == np.float32
+      assert np.allclose(block, [play(audio, p, interp, wrap) for p in positions], atol = 1e-4)
+  assert play(audio[:, 0], [[1.5, 2.5]]).shape == (1, 2)
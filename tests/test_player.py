@@ -0,0 +1,127 @@
+import time
+import numpy as np
+from calcwave.calcwave import Config, Evaluator, AudioPlayer
+from calcwave.sinks import AudioSink
+
+# Keeps every chunk, and runs a callback after each write
+class RecordingSink(AudioSink):
+  def __init__(self, onWrite = None):
+    super().__init__(channels = 1, rate = 44100, frameSize = 64)
+    self.chunks = []
+    self.onWrite = onWrite
+
+  def _write(self, data, frames):
+    self.chunks.append(data.copy())
+    if self.onWrite:
+      self.onWrite(len(self.chunks))
+    return data.nbytes
+
+def make_player(sink, prog, end = 64 * 8 - 1):
+  config = Config()
+  config.start, config.end, config.frameSize = 0, end, 64
+  config.evaluator = Evaluator(prog, channels = 1)
+  config.publish()
+  player = AudioPlayer(config, sink = sink)
+  player.loop = False
+  return config, player
+
+# A newly published program is picked up at the next chunk boundary, continuing from the same position
+def test_program_swap_at_chunk_boundary():
+  def onWrite(n):
+    if n == 2:
+      config.evaluator = Evaluator("out[:] = 0.5", channels = 1)
+      config.publish()
+  sink = RecordingSink(onWrite)
+  config, player = make_player(sink, "out[:] = 0.25")
+  player.play()
+  out = np.concatenate(sink.chunks)
+  assert len(out) == 64 * 8
+  assert np.all(out[:128] == 0.25)
+  assert np.all(out[128:] == 0.5)
+
+def test_seek_pauses_and_resumes_from_new_position():
+  def onWrite(n):
+    if n == 1:
+      player.seek(448)
+      player.setPaused(False)
+  sink = RecordingSink(onWrite)
+  config, player = make_player(sink, "out[:] = x / 1000")
+  player.play()
+  out = np.concatenate(sink.chunks)
+  assert len(out) == 128
+  assert np.isclose(out[64], 0.448)
+
+# With hotswap, a stateful program is warmed up before the switch, instead of starting from an empty state
+def test_hotswap_prerolls_memory_classes():
+  def onWrite(n):
+    if n == 2:
+      player.hotSwap(Evaluator("out[:] = ema(0.5, 21)", channels = 1))
+      while player.pendingSwap is None:
+        time.sleep(0.001)
+  sink = RecordingSink(onWrite)
+  config, player = make_player(sink, "out[:] = 0")
+  config.hotswap = True
+  player.play()
+  out = np.concatenate(sink.chunks)
+  assert np.all(out[:128] == 0)
+  assert np.all(np.diff(out[128:192]) >= 0) # Crossfade
+  assert np.allclose(out[192:], 0.5, atol = 1e-3)
+
+# A program too slow for the warm-up to catch up with playback is switched to once the warm-up runs out of time, and edits
+# made while one is warming up are merged into a single thread
+def test_hotswap_gives_up_on_slow_programs():
+  def onWrite(n):
+    if n == 2:
+      for _ in range(3):
+        evaluator = Evaluator("out[:] = delay(0.5, 20000)", channels = 1)
+        evaluate = evaluator.evaluate
+        evaluator.evaluate = lambda x, evaluate = evaluate: time.sleep(0.0005) or evaluate(x)
+        player.hotSwap(evaluator)
+      threads.append(player.prerollWorker)
+      while player.pendingSwap is None:
+        time.sleep(0.001)
+      threads.append(player.prerollWorker)
+  threads = []
+  sink = RecordingSink(onWrite)
+  config, player = make_player(sink, "out[:] = 0")
+  config.start, config.end, config.hotswap = 64 * 30000, 64 * 30008 - 1, True # Far from x = 0, so warming up would take 10 seconds
+  config.publish()
+  player.prerollTimeout = 0.05
+  started = time.perf_counter()
+  player.play()
+  assert time.perf_counter() - started < 5
+  assert threads[0] is not None and threads[1] in (None, threads[0])
+  out = np.concatenate(sink.chunks)
+  assert len(out) == 64 * 8 and np.all(out[:128] == 0) and np.allclose(out[192:], 0.5)
+
+# When looping a stateless program, the first pass is recorded and the following passes are played back without evaluating it
+def test_loop_plays_back_recorded_pass():
+  def onWrite(n):
+    if n == 20:
+      config.shutdown = True
+  sink = RecordingSink(onWrite)
+  config, player = make_player(sink, "out[:] = sin(x / 10) * 2")
+  player.loop = True
+  evaluate = config.evaluator.evaluate
+  calls = []
+  config.evaluator.evaluate = lambda x: calls.append(x) or evaluate(x)
+  player.play()
+  out = np.concatenate(sink.chunks)
+  assert len(calls) == 64 * 8
+  assert np.array_equal(out[:512], out[512:1024])
+  assert np.array_equal(out[:512], np.clip(np.sin(np.arange(512) / 10) * 2, -1, 1).astype(np.float32))
+
+# Programs that keep state in their own variables, or read the clock, are evaluated on every pass instead of played back
+def test_loop_evaluates_programs_that_do_not_repeat():
+  for prog in ["out[:] = out[0] * 0.5 + 0.1", "import time\nout[:] = time.time() % 1"]:
+    def onWrite(n):
+      if n == 16:
+        config.shutdown = True
+    sink = RecordingSink(onWrite)
+    config, player = make_player(sink, prog)
+    player.loop = True
+    evaluate = config.evaluator.evaluate
+    calls = []
+    config.evaluator.evaluate = lambda x, evaluate = evaluate: calls.append(x) or evaluate(x)
+    player.play()
+    assert len(calls) == 64 * 16, prog
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import soundfile as sf
+from calcwave.sinks import create_sink, parse_sink_spec, NullSink
+
+def test_parse_sink_spec():
+  assert parse_sink_spec("null") == ("null", "")
+  assert parse_sink_spec("raw:unix:/tmp/sock") == ("raw", "unix:/tmp/sock")
+  with pytest.raises(ValueError):
+    parse_sink_spec("wav")
+  with pytest.raises(ValueError):
+    parse_sink_spec("speakers")
+
+def test_null_sink_counts_frames():
+  with NullSink(channels = 2) as sink:
+    for _ in range(4):
+      sink.write(np.zeros((256, 2), dtype = np.float32))
+  assert sink.stats.frames == 1024
+  assert sink.stats.writes == 4
+  assert sink.stats.bytes == 1024 * 2 * 4
+
+# The WAV header is written before the length is known, and must be patched on close
+def test_wav_sink_roundtrip(tmp_path):
+  path = str(tmp_path / "out.wav")
+  data = np.linspace(-1, 1, 300, dtype = np.float32).reshape(150, 2)
+  with create_sink("wav:" + path, channels = 2, rate = 8000) as sink:
+    sink.write(data[:100])
+    sink.write(data[100:])
+  arr, rate = sf.read(path, dtype = 'float32')
+  assert rate == 8000
+  assert np.array_equal(arr, data)
+
+def test_raw_sink_writes_interleaved_float32(tmp_path):
+  path = str(tmp_path / "out.raw")
+  data = np.arange(8, dtype = np.float32).reshape(4, 2)
+  with create_sink("raw:" + path, channels = 2) as sink:
+    sink.write(data)
+  assert np.array_equal(np.fromfile(path, dtype = '<f4'), data.ravel())
@@ -0,0 +1,27 @@
+import os
+import re
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET = 0.3 # Seconds that importing calcwave may take, not counting numpy
+
+# Returns the cumulative import time in seconds of each module imported by "import module", measured with python -X importtime
+def import_times(module):
+  env = dict(os.environ, PYTHONPATH = os.pathsep.join([ROOT] + [p for p in [os.environ.get("PYTHONPATH")] if p]))
+  result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output = True, text = True, env = env)
+  assert result.returncode == 0, result.stderr
+  times = {}
+  for line in result.stderr.splitlines():
+    match = re.match(r"import time:\s*\d+ \|\s*(\d+) \|\s*(\S+)", line)
+    if match:
+      times[match.group(2)] = int(match.group(1)) / 1e6
+  return times
+
+# Exports, headless runs and batch renders import calcwave.calcwave, which must not load the user interface, plotting or
+# audio device libraries, and must stay within its import time budget
+def test_import_time_budget():
+  times = import_times("calcwave.calcwave")
+  loaded = [name for name in times if name.split('.')[0] in ("curses", "_curses", "matplotlib", "watchdog", "pyaudio") or name == "calcwave.tui"]
+  assert loaded == []
+  assert times["calcwave.calcwave"] - times.get("numpy", 0) < IMPORT_BUDGET
@@ -0,0 +1,39 @@
+from calcwave.telemetry import PlayerTelemetry, FrameSizeTuner
+
+def test_dsp_load_and_underruns():
+  t = PlayerTelemetry(rate = 1000)
+  # 100 frame chunks last 0.1s each; spending 0.05s evaluating each one is 50% load
+  t.recordChunk(100, 0.05, writeStart = 0.0)
+  t.recordChunk(100, 0.05, writeStart = 0.05) # 0.05s of audio still queued
+  assert t.underruns == 0
+  t.recordChunk(100, 0.05, writeStart = 0.5) # The queue ran out at 0.2s
+  assert t.underruns == 1
+  assert round(t.dspLoad()) == 50
+  stats = t.as_dict()
+  assert stats["underruns"] == 1
+  assert round(stats["dsp_load_percent"]["p50"]) == 50
+
+def test_paused_time_is_not_an_underrun():
+  t = PlayerTelemetry(rate = 1000)
+  t.recordChunk(100, 0.01, writeStart = 0.0)
+  t.restartPlayout()
+  t.recordChunk(100, 0.01, writeStart = 10.0)
+  assert t.underruns == 0
+
+def test_tuner_grows_on_underrun_and_shrinks_with_headroom():
+  t = PlayerTelemetry(rate = 1000)
+  tuner = FrameSizeTuner(minSize = 100, maxSize = 800, settleTime = 0.5, calmTime = 1.0)
+  size = tuner.initialSize()
+  now = 0.0
+  t.recordChunk(size, 0.01, writeStart = now)
+  size = tuner.update(t, size)
+  now += 1.0 # Far later than the 0.1s of audio queued
+  t.recordChunk(size, 0.01, writeStart = now)
+  size = tuner.update(t, size)
+  assert size == 200
+  # Light load for longer than calmTime shrinks back down
+  for _ in range(20):
+    now += size / 1000
+    t.recordChunk(size, 0.001, writeStart = now)
+    size = tuner.update(t, size)
+  assert size == 100
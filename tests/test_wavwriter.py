@@ -0,0 +1,87 @@
+import struct
+import numpy as np
+import pytest
+import soundfile as sf
+from calcwave.wavwriter import WavWriter, wav_header, encode, decode, FORMATS
+
+DATA = np.linspace(-1, 1, 202, dtype = np.float32).reshape(101, 2)
+
+@pytest.mark.parametrize("format", list(FORMATS))
+def test_roundtrip(tmp_path, format):
+  path = str(tmp_path / "out.wav")
+  with WavWriter(path, rate = 8000, channels = 2, format = format) as writer:
+    writer.write(DATA[:50])
+    writer.write(DATA[50:])
+  arr, rate = sf.read(path, dtype = 'float64')
+  assert rate == 8000 and arr.shape == DATA.shape
+  assert np.allclose(arr, DATA, atol = 2 / 32767) # soundfile scales integers by 2^(bits-1) rather than full scale
+  assert np.allclose(decode(encode(DATA, format).tobytes(), format), DATA.ravel(), atol = 1 / 32767)
+
+def test_header_fields():
+  header = wav_header(10, 48000, 6, "int24")
+  riff, datasize = struct.unpack_from('<I', header, 4)[0], struct.unpack_from('<I', header, 40)[0]
+  byterate, blockalign, bits = struct.unpack_from('<IHH', header, 28)
+  assert (byterate, blockalign, bits) == (48000 * 6 * 3, 18, 24)
+  assert datasize == 180 and riff == 36 + 180
+
+# The header is written from the expected length, and corrected on close if fewer frames were written
+def test_header_patched_on_close(tmp_path):
+  path = str(tmp_path / "short.wav")
+  with WavWriter(path, channels = 2, format = "int16", frames = 1000) as writer:
+    writer.write(DATA[:7])
+  assert sf.info(path).frames == 7
+
+# Integer samples are rounded, clipped to full scale, and dither moves them by at most one step
+def test_integer_conversion():
+  x = np.array([0.5, 2.0, -2.0, 1 / 32767 * 0.6])
+  assert list(encode(x, "int16")) == [16384, 32767, -32768, 1]
+  dithered = encode(np.full(1000, 0.25), "int16", dither = True, rng = np.random.default_rng(1))
+  assert np.abs(dithered.astype(int) - 8192).max() <= 1 and len(np.unique(dithered)) > 1
+
+# Files that outgrow the 32-bit RIFF sizes are upgraded to RF64 on close (the limit is lowered here to keep the test small)
+def test_auto_container_upgrades_to_rf64(tmp_path, monkeypatch):
+  from calcwave import wavwriter
+  monkeypatch.setattr(wavwriter, "MAX_RIFF_SIZE", 500)
+  small, large = str(tmp_path / "small.wav"), str(tmp_path / "large.wav")
+  for path, frames in ((small, 10), (large, 101)):
+    with WavWriter(path, channels = 2, format = "float32") as writer:
+      writer.write(DATA[:frames])
+  with open(small, 'rb') as a, open(large, 'rb') as b:
+    assert a.read(4) == b'RIFF' and b.read(4) == b'RF64'
+  arr, _ = sf.read(large, dtype = 'float32')
+  assert np.array_equal(arr, DATA)
+  assert sf.info(small).frames == 10
+
+def test_w64(tmp_path):
+  path = str(tmp_path / "out.w64")
+  with WavWriter(path, channels = 2, format = "int24") as writer:
+    writer.write(DATA[:33])
+  arr, _ = sf.read(path, dtype = 'float64')
+  assert sf.info(path).format == "W64" and np.allclose(arr, DATA[:33], atol = 1e-6)
+
+def test_split_into_parts(tmp_path):
+  from calcwave.wavwriter import SplitWavWriter
+  path = str(tmp_path / "mix.wav")
+  with SplitWavWriter(path, 40 * 2 * 4, channels = 2, format = "float32", frames = len(DATA)) as writer:
+    for i in range(0, len(DATA), 30):
+      writer.write(DATA[i:i + 30])
+  assert [p[-11:] for p in writer.paths] == ["mix-001.wav", "mix-002.wav", "mix-003.wav"]
+  parts = [sf.read(p, dtype = 'float32')[0] for p in writer.paths]
+  assert [len(p) for p in parts] == [40, 40, 21]
+  assert np.array_equal(np.concatenate(parts), DATA)
+
+# Blocks stored out of order into a preallocated file give the same file as writing them in sequence
+@pytest.mark.parametrize("format", ["int24", "float32"])
+def test_mapped_writer_out_of_order(tmp_path, format):
+  from calcwave.wavwriter import MappedWavWriter
+  streamed, mapped = str(tmp_path / "streamed.wav"), str(tmp_path / "mapped.wav")
+  with WavWriter(streamed, channels = 2, format = format, frames = len(DATA)) as writer:
+    writer.write(DATA)
+  with MappedWavWriter(mapped, len(DATA), channels = 2, format = format) as writer:
+    for first in (60, 0, 30):
+      writer.writeAt(first, DATA[first:first + 30])
+    writer.writeAt(90, DATA[90:])
+    if format == "float32":
+      assert np.array_equal(writer.array()[:30], DATA[:30])
+  with open(streamed, 'rb') as a, open(mapped, 'rb') as b:
+    assert a.read() == b.read()